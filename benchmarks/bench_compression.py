@@ -0,0 +1,65 @@
+"""
+Сжатие сообщений браузерам, которые смотрят на несколько районов Москвы: сколько байт уходит в сеть без сжатия
+и со сжатием, и сколько стоит сжатие за тик, если сжимать сообщение для каждого браузера отдельно или один раз
+для всех браузеров с одинаковым сообщением.
+Запуск: python -m benchmarks.bench_compression
+"""
+
+import random
+import time
+import zlib
+
+from benchmarks.bench_spatial import make_buses
+from benchmarks.bench_viewports import make_browsers
+from compression import COMPRESSION_LEVEL, MessageCompressor
+from hub import BusesHub
+
+BUSES_NUMBER = 60_000
+BROWSERS_NUMBERS = (10, 100, 1000)
+
+
+def main():
+    rnd = random.Random(0)
+    hub = BusesHub(cluster_threshold=0)
+    for bus in make_buses(BUSES_NUMBER, rnd):
+        hub.update(bus)
+    hub.tick()
+
+    print(
+        'браузеров   JSON, КБ   сжато, КБ   каждому, мс   общее, мс'
+        '   ускорение'
+    )
+    for number in BROWSERS_NUMBERS:
+        messages = [
+            hub.payload(bounds) for bounds in make_browsers(number, rnd)
+        ]
+
+        started = time.perf_counter()
+        frames = [
+            zlib.compress(message.encode('utf8'), COMPRESSION_LEVEL)
+            for message in messages
+        ]
+        each_time = time.perf_counter() - started
+
+        compressor = MessageCompressor()
+        started = time.perf_counter()
+        for message in messages:
+            compressor.compress(message, hub.version)
+        shared_time = time.perf_counter() - started
+
+        print(
+            '%9d %10d %11d %13.1f %11.1f %10.1fx'
+            % (
+                number,
+                sum(len(message.encode('utf8')) for message in messages)
+                / 1024,
+                sum(len(frame) for frame in frames) / 1024,
+                each_time * 1000,
+                shared_time * 1000,
+                each_time / shared_time,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
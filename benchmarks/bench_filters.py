@@ -0,0 +1,67 @@
+"""
+Сколько стоит сообщение браузеру-диспетчеру, который следит за несколькими маршрутами на всей карте Москвы:
+выборка всех автобусов окна с отбрасыванием чужих маршрутов против выборки из индекса маршрутов FleetState.
+Запуск: python -m benchmarks.bench_filters
+"""
+
+import random
+import timeit
+
+import numpy as np
+
+from benchmarks.bench_fleet import MOSCOW, ROUTES_NUMBER, make_updates
+from hub import BusesHub, join_buses
+
+BUSES_NUMBER = 60_000
+ROUTES_CHOSEN = (1, 5, 20)
+
+
+def scan_payload(hub, routes):
+    slots = hub.slots(MOSCOW)
+    indexes = [hub.buses._routes[route] for route in routes]
+    slots = slots[np.isin(hub.buses.route[slots], indexes)]
+    return join_buses(hub.buses.encode(slots).tolist())
+
+
+def index_payload(hub, routes):
+    return join_buses(hub.buses.encode(hub.slots(MOSCOW, routes)).tolist())
+
+
+def main():
+    rnd = random.Random(0)
+    hub = BusesHub(cluster_threshold=0)
+    for bus in make_updates(BUSES_NUMBER, rnd):
+        hub.update(bus)
+    hub.tick()
+
+    print('маршрутов   перебор, мс   индекс, мс   ускорение')
+    for number in ROUTES_CHOSEN:
+        routes = tuple(
+            str(route) for route in rnd.sample(range(ROUTES_NUMBER), number)
+        )
+        assert len(scan_payload(hub, routes)) == len(
+            index_payload(hub, routes)
+        )  # те же автобусы в другом порядке
+        scan_time = min(
+            timeit.repeat(
+                lambda: scan_payload(hub, routes), number=10, repeat=3
+            )
+        )
+        index_time = min(
+            timeit.repeat(
+                lambda: index_payload(hub, routes), number=10, repeat=3
+            )
+        )
+        print(
+            '%9d %13.3f %12.3f %10.1fx'
+            % (
+                number,
+                scan_time * 100,
+                index_time * 100,
+                scan_time / index_time,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
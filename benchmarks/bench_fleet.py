@@ -0,0 +1,94 @@
+"""
+Сравнение состояния парка: словарь экземпляров Bus, который пополняется новыми экземплярами на каждое обновление,
+против столбцов FleetState с записью на месте. Каждый тик сдвигаются все автобусы, затем выбираются и кодируются
+в JSON автобусы окна над всей Москвой.
+Запуск: python -m benchmarks.bench_fleet
+"""
+
+import json
+import random
+import timeit
+
+import numpy as np
+
+from fleet import FleetState
+from server import Bus, WindowBounds
+
+MOSCOW = WindowBounds(
+    south_lat=55.55, north_lat=55.95, west_lng=37.35, east_lng=37.85
+)
+BUSES_NUMBERS = (1_000, 10_000, 60_000)
+ROUTES_NUMBER = 595
+
+
+def make_updates(number, rnd):
+    return [
+        Bus(
+            busId=f'{i % ROUTES_NUMBER}-{i:05d}',
+            lat=rnd.uniform(MOSCOW.south_lat, MOSCOW.north_lat),
+            lng=rnd.uniform(MOSCOW.west_lng, MOSCOW.east_lng),
+            route=str(i % ROUTES_NUMBER),
+        )
+        for i in range(number)
+    ]
+
+
+def dict_tick(buses, updates):
+    for bus in updates:
+        buses[bus.busId] = Bus(bus.busId, bus.lat, bus.lng, bus.route)
+    return ', '.join(
+        json.dumps(
+            {
+                'busId': bus.busId,
+                'lat': bus.lat,
+                'lng': bus.lng,
+                'route': bus.route,
+            },
+            ensure_ascii=False,
+        )
+        for bus in buses.values()
+        if MOSCOW.is_inside(lat=bus.lat, lng=bus.lng)
+    )
+
+
+def fleet_tick(fleet, updates):
+    fleet.write(updates, 0)
+    slots = fleet.within(MOSCOW, np.arange(len(fleet)))
+    return ', '.join(fleet.encode(slots).tolist())
+
+
+def main():
+    rnd = random.Random(0)
+
+    print('автобусов   словарь, мс   столбцы, мс   ускорение')
+    for number in BUSES_NUMBERS:
+        ticks = [make_updates(number, rnd) for _ in range(3)]
+        buses, fleet = dict(), FleetState()
+
+        dict_time = min(
+            timeit.repeat(
+                lambda: [dict_tick(buses, updates) for updates in ticks],
+                number=1,
+                repeat=3,
+            )
+        )
+        fleet_time = min(
+            timeit.repeat(
+                lambda: [fleet_tick(fleet, updates) for updates in ticks],
+                number=1,
+                repeat=3,
+            )
+        )
+        print(
+            '%9d %13.3f %13.3f %10.1fx'
+            % (
+                number,
+                dict_time * 1000 / len(ticks),
+                fleet_time * 1000 / len(ticks),
+                dict_time / fleet_time,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Пропускная способность приема координат сервером в зависимости от количества процессов приема.
+0 процессов - прием в процессе сервера (server.get_message), N - процессы ingest.py на общем порту.
+Нагрузку создают процессы имитатора (launcher.start_worker), которые шлют координаты без пауз.
+Принятые координаты попадают в хаб сервера, как в server.py, так что в замер входит и разбор буферов.
+Прирост виден только на машине с несколькими ядрами: процессы приема и имитатора делят ядра между собой.
+Отдельно замеряется потолок процесса сервера при приеме процессами: сколько записей в секунду он забирает
+из кольцевого буфера в хаб экземплярами Bus (SharedRing.decode) и столбцами (SharedRing.columns).
+Запуск: python -m benchmarks.bench_ingest_workers [количество процессов приема ...]
+"""
+
+import multiprocessing
+import socket
+import sys
+import time
+
+import numpy as np
+import trio
+from trio_websocket import serve_websocket
+
+import server
+from hub import BusesHub
+from ingest import run_ingest_workers
+from launcher import shard_routes, start_worker
+from models import Bus
+from route_store import ROUTES_DIR, RouteStore
+from shared_ring import SharedRing
+
+WORKER_COUNTS = (0, 1, 2, 4)
+EMULATORS = 2
+ROUTES_NUMBER = 100
+BUSES_PER_ROUTE = 50
+WARMUP = 3
+DURATION = 5
+DRAIN_FLEET = 50_000  # автобусов в замере разбора буфера
+DRAIN_RECORDS = 2 ** 16  # записей, забираемых из буфера за раз
+DRAIN_ROUNDS = 20
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_emulators(port: int, stats_queue) -> list:
+    options = {
+        'server': 'ws://127.0.0.1:%d/ws' % (port,),
+        'buses_per_route': BUSES_PER_ROUTE,
+        'websockets_number': 4,
+        'emulator_id': 'bench',
+        'refresh_timeout': 0,
+        'batch_size': 500,
+        'batch_latency': 0.05,
+        'encoding': 'json',
+        'report_interval': 60,
+    }
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(
+            target=start_worker,
+            args=(worker, route_indexes, options, stats_queue, 0),
+            daemon=True,
+        )
+        for worker, route_indexes in enumerate(
+            shard_routes(list(range(ROUTES_NUMBER)), EMULATORS)
+        )
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+async def measure(ingest_workers: int) -> float:
+    """Сколько координат в секунду сервер получает из канала приема и передает хабу."""
+    port = free_port()
+    send_channel, receive_channel = server.send_channel, server.receive_channel
+    hub = BusesHub()
+    received = 0
+
+    async def count():
+        nonlocal received
+        async for buses in receive_channel:
+            received += len(buses)
+            if isinstance(buses, list):
+                for bus in buses:
+                    hub.update(bus)
+            else:
+                hub.update_columns(buses)
+
+    async def tick():
+        while True:
+            await trio.sleep(1)
+            hub.tick()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(count)
+        nursery.start_soon(tick)
+        if ingest_workers:
+            nursery.start_soon(
+                run_ingest_workers, ingest_workers, '127.0.0.1', port, send_channel
+            )
+        else:
+            await nursery.start(
+                serve_websocket, server.get_message, '127.0.0.1', port, None
+            )
+        await trio.sleep(1)
+
+        stats_queue = multiprocessing.get_context('spawn').Queue()
+        emulators = start_emulators(port, stats_queue)
+        await trio.sleep(WARMUP)
+        received, started = 0, time.perf_counter()
+        await trio.sleep(DURATION)
+        rate = received / (time.perf_counter() - started)
+
+        for process in emulators:
+            process.terminate()
+        nursery.cancel_scope.cancel()
+    return rate
+
+
+def measure_drain(as_columns: bool) -> float:
+    """
+    Сколько записей в секунду процесс сервера забирает из кольцевого буфера в хаб, включая тик хаба.
+    Процессы приема пишут в буферы параллельно, а забирает записи один процесс сервера, поэтому это
+    потолок приема при любом количестве процессов.
+    """
+    rng = np.random.default_rng(0)
+    ring = SharedRing(DRAIN_RECORDS)
+    try:
+        hub = BusesHub()
+        records = SharedRing.encode(
+            [
+                Bus(
+                    str(index % DRAIN_FLEET),
+                    55.75 + rng.uniform(-0.2, 0.2),
+                    37.62 + rng.uniform(-0.3, 0.3),
+                    str(index % 500),
+                )
+                for index in range(DRAIN_RECORDS)
+            ]
+        )
+        started = time.perf_counter()
+        for _ in range(DRAIN_ROUNDS):
+            ring.write(records)
+            drained = ring.read()
+            if as_columns:
+                hub.update_columns(SharedRing.columns(drained))
+            else:
+                for bus in SharedRing.decode(drained):
+                    hub.update(bus)
+            hub.tick()
+        return DRAIN_RECORDS * DRAIN_ROUNDS / (time.perf_counter() - started)
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def main():
+    RouteStore.load(ROUTES_DIR)  # хранилище собирается один раз заранее
+    worker_counts = [int(arg) for arg in sys.argv[1:]] or WORKER_COUNTS
+
+    print('ядер: %d' % (multiprocessing.cpu_count(),))
+    print('процессов приема   координат/с')
+    for ingest_workers in worker_counts:
+        rate = trio.run(measure, ingest_workers)
+        print('%-16d %13.0f' % (ingest_workers, rate))
+
+    print('разбор буфера      записей/с')
+    print('%-16s %13.0f' % ('Bus', measure_drain(as_columns=False)))
+    print('%-16s %13.0f' % ('столбцы', measure_drain(as_columns=True)))
+
+
+if __name__ == '__main__':
+    main()
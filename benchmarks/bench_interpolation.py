@@ -0,0 +1,59 @@
+"""
+Интерполяция движения по маршрутам: сколько стоит проекция координат автобусов на маршруты (при каждых
+новых координатах) и вычисление положений вдоль маршрутов (каждый тик сервера). Автобусы стоят в случайных
+точках случайных маршрутов из хранилища.
+Запуск: python -m benchmarks.bench_interpolation
+"""
+
+import timeit
+
+import numpy as np
+
+from interpolation import RouteGeometry
+from route_store import ROUTES_DIR, RouteStore
+
+BUSES_NUMBERS = (1_000, 10_000, 60_000)
+
+
+def make_buses(store, number, rng):
+    routes = rng.integers(0, len(store), number)
+    lengths = np.diff(store.route_offsets)[routes]
+    points = store.route_offsets[routes] + (
+        rng.random(number) * (lengths - 1)
+    ).astype(np.int64)
+    lat, lng = store.points[points].T.copy()
+    return routes, lat, lng
+
+
+def main():
+    store = RouteStore.load(ROUTES_DIR)
+    geometry = RouteGeometry(store)
+    rng = np.random.default_rng(0)
+
+    print('автобусов   первая проекция, с   проекция, мс   положения, мс')
+    for number in BUSES_NUMBERS:
+        routes, lat, lng = make_buses(store, number, rng)
+        index_time = timeit.timeit(
+            lambda: geometry.project(routes, lat, lng), number=1
+        )
+        distances = geometry.project(routes, lat, lng)
+        project_time = min(
+            timeit.repeat(
+                lambda: geometry.project(routes, lat, lng, distances),
+                number=1,
+                repeat=3,
+            )
+        )
+        locate_time = min(
+            timeit.repeat(
+                lambda: geometry.locate(routes, distances), number=1, repeat=3
+            )
+        )
+        print(
+            '%9d %20.3f %14.3f %15.3f'
+            % (number, index_time, project_time * 1000, locate_time * 1000)
+        )
+
+
+if __name__ == '__main__':
+    main()
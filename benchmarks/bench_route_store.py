@@ -0,0 +1,64 @@
+"""
+Загрузка маршрутов при старте имитатора: чтение json-файлов папки routes против хранилища в памяти (mmap).
+Каждый способ запускается в отдельном процессе, чтобы честно измерить время и прирост памяти (RSS).
+Запуск: python -m benchmarks.bench_route_store
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from route_store import ROUTES_DIR, RouteStore, route_filenames
+
+
+def current_rss() -> int:
+    """Текущий размер резидентной памяти процесса в КБ."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def load_json():
+    routes = []
+    for filename in route_filenames(ROUTES_DIR):
+        with open(os.path.join(ROUTES_DIR, filename), encoding='utf8') as f:
+            routes.append(json.load(f))
+    return routes
+
+
+def load_store():
+    store = RouteStore.load(ROUTES_DIR)
+    return [store.coordinates(i) for i in range(len(store))]
+
+
+def measure(loader_name: str):
+    loader = {'json': load_json, 'store': load_store}[loader_name]
+    rss = current_rss()
+    start = time.perf_counter()
+    loader()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'time': elapsed, 'rss': current_rss() - rss}))
+
+
+def main():
+    RouteStore.load(ROUTES_DIR)  # хранилище собирается один раз заранее
+
+    print('способ    время, мс   прирост RSS, КБ')
+    for loader_name in ('json', 'store'):
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.bench_route_store', loader_name]
+        )
+        result = json.loads(output)
+        print(
+            '%-8s %10.1f %17d'
+            % (loader_name, result['time'] * 1000, result['rss'])
+        )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,42 @@
+"""
+Пропускная способность векторного имитатора автобусов на одном ядре: сдвиг всех автобусов,
+сборка JSON-координат и упаковка их в сообщения BusesBatch.
+Запуск: python -m benchmarks.bench_simulator
+"""
+
+import random
+import time
+
+from fake_bus import ROUTES_DIR, BATCH_SIZE, encode_batch, populate_fleet
+from route_store import RouteStore
+from simulator import FleetSimulator
+
+BUSES_PER_ROUTE = (100, 1_000, 4_000)
+STEPS = 5
+
+
+def bench(simulator):
+    simulator.fragments()
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        simulator.step()
+        fragments = simulator.fragments()
+        for offset in range(0, len(fragments), BATCH_SIZE):
+            encode_batch(fragments[offset:offset + BATCH_SIZE])
+    return STEPS * len(simulator) / (time.perf_counter() - start)
+
+
+def main():
+    store = RouteStore.load(ROUTES_DIR)
+    routes = [store.route(i) for i in range(len(store))]
+    print('автобусов   координат в секунду')
+    for buses_per_route in BUSES_PER_ROUTE:
+        simulator = FleetSimulator()
+        populate_fleet(
+            simulator, routes, buses_per_route, '', random.Random(0)
+        )
+        print('%9d %21.0f' % (len(simulator), bench(simulator)))
+
+
+if __name__ == '__main__':
+    main()
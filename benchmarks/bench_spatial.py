@@ -0,0 +1,96 @@
+"""
+Сравнение выборки автобусов по окну карты: перебор всех строк FleetState (FleetState.within) против
+выборки хаба по сетке GridIndex (BusesHub.slots: GridIndex.partition и проверка только ячеек на границе окна).
+Запуск: python -m benchmarks.bench_spatial
+"""
+
+import random
+import timeit
+
+import numpy as np
+
+from hub import BusesHub
+from server import Bus, WindowBounds
+
+MOSCOW = (55.55, 55.95, 37.35, 37.85)  # юг, север, запад, восток
+VIEWPORT = (0.047, 0.111)  # размер окна браузера в градусах, как в README
+BUSES_NUMBERS = (1_000, 10_000, 60_000)
+VIEWPORTS_NUMBER = 100
+
+
+def make_buses(number, rnd):
+    south, north, west, east = MOSCOW
+    return [
+        Bus(
+            busId=str(i),
+            lat=rnd.uniform(south, north),
+            lng=rnd.uniform(west, east),
+            route='120',
+        )
+        for i in range(number)
+    ]
+
+
+def make_viewports(number, rnd):
+    south, north, west, east = MOSCOW
+    height, width = VIEWPORT
+    viewports = []
+    for _ in range(number):
+        lat = rnd.uniform(south, north - height)
+        lng = rnd.uniform(west, east - width)
+        viewports.append(
+            WindowBounds(
+                south_lat=lat,
+                north_lat=lat + height,
+                west_lng=lng,
+                east_lng=lng + width,
+            )
+        )
+    return viewports
+
+
+def linear(hub, slots, viewports):
+    for bounds in viewports:
+        hub.buses.within(bounds, slots)
+
+
+def indexed(hub, viewports):
+    for bounds in viewports:
+        hub.slots(bounds)
+
+
+def main():
+    rnd = random.Random(0)
+    viewports = make_viewports(VIEWPORTS_NUMBER, rnd)
+
+    print('автобусов   линейно, мс   сетка, мс   ускорение')
+    for number in BUSES_NUMBERS:
+        hub = BusesHub()
+        for bus in make_buses(number, rnd):
+            hub.update(bus)
+        hub.tick()
+        slots = np.array(
+            [hub.buses.slot(bus_id) for bus_id in hub.buses], dtype=np.intp
+        )
+
+        linear_time = min(
+            timeit.repeat(
+                lambda: linear(hub, slots, viewports), number=1, repeat=3
+            )
+        )
+        indexed_time = min(
+            timeit.repeat(lambda: indexed(hub, viewports), number=1, repeat=3)
+        )
+        print(
+            '%9d %13.3f %11.3f %10.1fx'
+            % (
+                number,
+                linear_time * 1000 / VIEWPORTS_NUMBER,
+                indexed_time * 1000 / VIEWPORTS_NUMBER,
+                linear_time / indexed_time,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Сравнение разбора входящих сообщений автобусов: прежний двойной разбор с двумя экземплярами Bus
+против однократного разбора is_instance_valid.
+Запуск: python -m benchmarks.bench_validators
+"""
+
+import json
+import timeit
+
+from server import Bus
+from validators import is_instance_valid
+
+MESSAGES_NUMBER = 100_000
+PAYLOADS = {
+    'валидный': '{"busId": "c790сс", "lat": 55.7500, "lng": 37.600, "route": "120"}',
+    'не JSON': 'message',
+    'неверная широта': '{"busId": "c790сс", "lat": "c55.7500", "lng": 37.600, "route": "120"}',
+}
+
+
+def double_parse(message):
+    """Прежний конвейер: проверка с выбрасыванием экземпляра, затем повторный разбор для очереди."""
+    try:
+        Bus(**json.loads(message))
+    except json.JSONDecodeError:
+        return '{"errors": ["Requires valid JSON"], "msgType": "Errors"}'
+    except TypeError:
+        return '{"errors": ["Requires msgType specified"], "msgType": "Errors"}'
+    except ValueError as e:
+        return '{"errors": ["%s"], "msgType": "Errors"}' % (str(e),)
+    return Bus(**json.loads(message))
+
+
+def single_parse(message):
+    return is_instance_valid(message, Bus)[1]
+
+
+def main():
+    print('сообщение            двойной, мкс   одинарный, мкс   ускорение')
+    for name, message in PAYLOADS.items():
+        double_time = min(
+            timeit.repeat(
+                lambda: double_parse(message), number=MESSAGES_NUMBER, repeat=3
+            )
+        )
+        single_time = min(
+            timeit.repeat(
+                lambda: single_parse(message), number=MESSAGES_NUMBER, repeat=3
+            )
+        )
+        print(
+            '%-18s %14.3f %16.3f %10.1fx'
+            % (
+                name,
+                double_time * 1e6 / MESSAGES_NUMBER,
+                single_time * 1e6 / MESSAGES_NUMBER,
+                double_time / single_time,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
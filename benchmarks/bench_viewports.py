@@ -0,0 +1,83 @@
+"""
+Сколько стоит тик хаба для браузеров, которые смотрят на несколько районов Москвы с немного разными окнами:
+каждое окно отдельно против окон, расширенных до плиток сетки и разделяющих одно сообщение.
+Запуск: python -m benchmarks.bench_viewports
+"""
+
+import random
+import time
+
+from benchmarks.bench_spatial import MOSCOW, VIEWPORT, make_buses
+from hub import BusesHub
+from server import WindowBounds
+
+BUSES_NUMBER = 60_000
+DISTRICTS_NUMBER = 10
+BROWSERS_NUMBERS = (10, 100, 1000)
+JITTER = 0.005  # насколько в градусах окна браузеров одного района отличаются друг от друга
+
+
+def make_browsers(number, rnd):
+    south, north, west, east = MOSCOW
+    height, width = VIEWPORT
+    districts = [
+        (rnd.uniform(south, north - height), rnd.uniform(west, east - width))
+        for _ in range(DISTRICTS_NUMBER)
+    ]
+    browsers = []
+    for _ in range(number):
+        lat, lng = rnd.choice(districts)
+        lat += rnd.uniform(-JITTER, JITTER)
+        lng += rnd.uniform(-JITTER, JITTER)
+        browsers.append(
+            WindowBounds(
+                south_lat=lat,
+                north_lat=lat + height,
+                west_lng=lng,
+                east_lng=lng + width,
+            )
+        )
+    return browsers
+
+
+def serve_ticks(hub, ticks, browsers) -> float:
+    """Среднее время подготовки сообщений всем браузерам за тик, без приема координат."""
+    elapsed = 0
+    for buses in ticks:
+        for bus in buses:
+            hub.update(bus)
+        hub.tick()
+        started = time.perf_counter()
+        for bounds in browsers:
+            hub.payload(bounds)
+        elapsed += time.perf_counter() - started
+    return elapsed / len(ticks)
+
+
+def main():
+    rnd = random.Random(0)
+    ticks = [make_buses(BUSES_NUMBER, rnd) for _ in range(3)]
+
+    print('браузеров   окна, мс   плитки, мс   ускорение   окон')
+    for number in BROWSERS_NUMBERS:
+        browsers = make_browsers(number, rnd)
+        times = []
+        for viewport_tiles in (0, 8):
+            hub = BusesHub(cache_size=number)
+            hub.viewport_tiles = viewport_tiles
+            times.append(serve_ticks(hub, ticks, browsers))
+        exact_time, tiled_time = times
+        print(
+            '%9d %10.1f %12.1f %10.1fx %6d'
+            % (
+                number,
+                exact_time * 1000,
+                tiled_time * 1000,
+                exact_time / tiled_time,
+                hub.cached_payloads,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
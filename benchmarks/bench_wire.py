@@ -0,0 +1,73 @@
+"""
+Сравнение форматов сообщений имитатора: пачка BusesBatch в JSON против бинарного кадра (wire.py).
+Размер считается для установившегося соединения, когда словарь автобусов уже передан.
+Запуск: python -m benchmarks.bench_wire
+"""
+
+import timeit
+
+from fake_bus import encode_batch
+from route_store import ROUTES_DIR, RouteStore
+from simulator import FleetSimulator
+from wire import WireDecoder, WireEncoder, decode_bus_message
+
+BATCH_SIZE = 500
+REPEAT = 200
+
+
+def main():
+    store = RouteStore.load(ROUTES_DIR)
+    simulator = FleetSimulator()
+    for route_index in range(10):
+        index = simulator.add_route(
+            store.names[route_index], store.coordinates(route_index)
+        )
+        for bus_index in range(BATCH_SIZE // 10):
+            simulator.add_bus(index, f'{index}-{bus_index:03}', bus_index * 7)
+
+    json_message = encode_batch(simulator.fragments())
+    encoder, decoder = WireEncoder(), WireDecoder()
+    decoder.decode(encoder.encode(simulator.records()))
+    simulator.step()
+    binary_message = encoder.encode(simulator.records())
+
+    json_decoder = WireDecoder()
+    json_time = min(
+        timeit.repeat(
+            lambda: decode_bus_message(json_message, json_decoder),
+            number=REPEAT,
+            repeat=3,
+        )
+    )
+    binary_time = min(
+        timeit.repeat(
+            lambda: decode_bus_message(binary_message, decoder),
+            number=REPEAT,
+            repeat=3,
+        )
+    )
+
+    print('формат     байт/координату   разбор, мкс/координату')
+    for name, message, elapsed in (
+        ('json', json_message.encode('utf8'), json_time),
+        ('binary', binary_message, binary_time),
+    ):
+        print(
+            '%-8s %17.1f %24.3f'
+            % (
+                name,
+                len(message) / BATCH_SIZE,
+                elapsed * 1e6 / REPEAT / BATCH_SIZE,
+            )
+        )
+    print(
+        'бинарный кадр меньше в %.1f раза, разбирается быстрее в %.1f раза'
+        % (
+            len(json_message.encode('utf8')) / len(binary_message),
+            json_time / binary_time,
+        )
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+"""
+Нагрузочный тест всего пути автобус -> сервер -> браузер на localhost.
+Сервер (хаб и хэндлеры server.py) работает в процессе теста, имитатор fake_bus.py - в отдельном процессе,
+синтетические браузеры - в еще одном процессе, чтобы ресурсы процесса теста были ресурсами сервера.
+Каждый браузер смотрит на случайное окно над Москвой. В центре окна стоит свой зонд - автобус, которого
+тест двигает сам и по координате которого браузер узнает, когда зонд был отправлен.
+Результаты печатаются и сохраняются в JSON, с прошлыми результатами можно сравнить через --baseline.
+Запуск: python -m benchmarks.load_test --browsers 50 --duration 30
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+import warnings
+from contextlib import suppress
+
+import asyncclick as click
+import numpy as np
+import trio
+from trio import TrioDeprecationWarning
+from trio_websocket import (
+    ConnectionClosed,
+    open_websocket_url,
+    serve_websocket,
+)
+
+import server
+from route_store import ROUTES_DIR, RouteStore
+
+MOSCOW = (55.75, 37.62)  # центр области, над которой браузеры выбирают окна
+MOSCOW_SPAN = (0.15, 0.25)  # насколько далеко от центра Москвы может быть центр окна, градусы
+PROBE_INTERVAL = 0.05  # пауза в секундах между сдвигами зондов
+PROBE_STEP = 1e-7  # сдвиг зонда по широте на каждый номер отправки, градусы
+PROBE_SEQUENCES = 1000  # номера отправок зондов идут по кругу
+WARMUP = 5  # сколько секунд прогревать систему перед замерами
+
+warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def current_rss() -> int:
+    """Текущий размер резидентной памяти процесса в КБ."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def random_bounds(rng: random.Random) -> dict:
+    """Случайное окно карты над Москвой."""
+    lat = MOSCOW[0] + rng.uniform(-MOSCOW_SPAN[0], MOSCOW_SPAN[0])
+    lng = MOSCOW[1] + rng.uniform(-MOSCOW_SPAN[1], MOSCOW_SPAN[1])
+    half_height, half_width = rng.uniform(0.01, 0.05), rng.uniform(0.02, 0.1)
+    return {
+        'south_lat': lat - half_height,
+        'north_lat': lat + half_height,
+        'west_lng': lng - half_width,
+        'east_lng': lng + half_width,
+    }
+
+
+def probe_center(bounds: dict) -> tuple[float, float]:
+    return (
+        (bounds['south_lat'] + bounds['north_lat']) / 2,
+        (bounds['west_lng'] + bounds['east_lng']) / 2,
+    )
+
+
+class BrowserStats:
+    """Счетчики синтетических браузеров"""
+
+    def __init__(self):
+        self.measuring = False
+        self.messages = 0
+        self.bytes = 0
+        self.latencies = []  # задержки доставки положений зондов в секундах
+
+
+async def move_probes(url: str, centers: list, sent_at: list):
+    """Раз в PROBE_INTERVAL секунд сдвигает все зонды и запоминает время отправки."""
+    async with open_websocket_url(url) as ws:
+        for sequence in range(sys.maxsize):
+            index = sequence % PROBE_SEQUENCES
+            buses = [
+                {
+                    'busId': 'probe-%d' % (browser,),
+                    'lat': lat + index * PROBE_STEP,
+                    'lng': lng,
+                    'route': 'probe',
+                }
+                for browser, (lat, lng) in enumerate(centers)
+            ]
+            sent_at[index] = trio.current_time()
+            await ws.send_message(
+                json.dumps({'msgType': 'BusesBatch', 'buses': buses})
+            )
+            await trio.sleep(PROBE_INTERVAL)
+
+
+async def watch_buses(
+    url: str,
+    browser: int,
+    bounds: dict,
+    protocol: str,
+    sent_at: list,
+    stats: BrowserStats,
+):
+    """Синтетический браузер: выбирает окно и измеряет задержку доставки своего зонда."""
+    probe_id = 'probe-%d' % (browser,)
+    probe_lat, _ = probe_center(bounds)
+    async with open_websocket_url(url) as ws:
+        if protocol != 'full':
+            await ws.send_message(
+                json.dumps(
+                    {'msgType': 'setProtocol', 'data': {'mode': protocol}}
+                )
+            )
+        await ws.send_message(
+            json.dumps({'msgType': 'newBounds', 'data': bounds})
+        )
+
+        with suppress(ConnectionClosed):
+            while True:
+                message = await ws.get_message()
+                received_at = trio.current_time()
+                if not stats.measuring:
+                    continue
+                stats.messages += 1
+                stats.bytes += len(message)
+                # в скоплениях (BusClusters) отдельных автобусов нет, задержку по ним не измерить
+                for bus in json.loads(message).get('buses', ()):
+                    if bus['busId'] == probe_id:
+                        index = round((bus['lat'] - probe_lat) / PROBE_STEP)
+                        stats.latencies.append(received_at - sent_at[index])
+
+
+async def run_browsers(options: dict, results):
+    rng = random.Random(options['seed'])
+    bounds = [random_bounds(rng) for _ in range(options['browsers'])]
+    sent_at = [trio.current_time()] * PROBE_SEQUENCES
+    stats = BrowserStats()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(
+            move_probes,
+            options['bus_url'],
+            [probe_center(window) for window in bounds],
+            sent_at,
+        )
+        for browser, window in enumerate(bounds):
+            nursery.start_soon(
+                watch_buses,
+                options['browser_url'],
+                browser,
+                window,
+                options['protocol'],
+                sent_at,
+                stats,
+            )
+
+        await trio.sleep(options['warmup'])
+        stats.measuring = True
+        await trio.sleep(options['duration'])
+        nursery.cancel_scope.cancel()
+
+    results.put(
+        {
+            'messages': stats.messages,
+            'bytes': stats.bytes,
+            'latencies': stats.latencies,
+        }
+    )
+
+
+def start_browsers(options: dict, results):
+    """Точка входа процесса синтетических браузеров."""
+    with suppress(KeyboardInterrupt):
+        trio.run(run_browsers, options, results)
+
+
+def summarize(
+    options: dict, browsers: dict, ingested: int, cpu: float, rss: int
+) -> dict:
+    latencies = np.array(browsers['latencies']) * 1000
+    percentiles = (
+        dict(
+            zip(
+                ('p50', 'p90', 'p99', 'max'),
+                np.percentile(latencies, (50, 90, 99, 100)).round(2).tolist(),
+            )
+        )
+        if latencies.size
+        else {}
+    )
+    return {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': options,
+        'ingest_updates_per_sec': round(ingested / options['duration']),
+        'latency_ms': percentiles,
+        'latency_samples': int(latencies.size),
+        'browser_messages_per_sec': round(
+            browsers['messages'] / options['duration']
+        ),
+        'browser_mbytes_per_sec': round(
+            browsers['bytes'] / options['duration'] / 2**20, 2
+        ),
+        'server_cpu_percent': round(cpu / options['duration'] * 100, 1),
+        'server_rss_mb': round(rss / 1024, 1),
+        'server_max_rss_mb': round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def compare(result: dict, baseline: dict) -> list[str]:
+    """Строки сравнения с прошлым результатом: изменение каждого показателя в процентах."""
+    pairs = [
+        (key, result[key], baseline.get(key))
+        for key in (
+            'ingest_updates_per_sec',
+            'browser_messages_per_sec',
+            'server_cpu_percent',
+            'server_rss_mb',
+        )
+    ]
+    pairs.extend(
+        ('latency_ms.' + key, value, baseline.get('latency_ms', {}).get(key))
+        for key, value in result['latency_ms'].items()
+    )
+    return [
+        '%-28s %12s -> %-12s (%+.1f%%)'
+        % (key, old, new, (new - old) / old * 100 if old else 0)
+        for key, new, old in pairs
+        if old is not None
+    ]
+
+
+def server_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+@click.command()
+@click.option(
+    '--routes_number',
+    default=100,
+    show_default=True,
+    help='Количество маршрутов имитатора.',
+)
+@click.option(
+    '--buses_per_route',
+    default=50,
+    show_default=True,
+    help='Количество автобусов на каждом маршруте.',
+)
+@click.option(
+    '--websockets_number',
+    default=5,
+    show_default=True,
+    help='Количество веб-сокетов имитатора.',
+)
+@click.option(
+    '--bus_refresh_timeout',
+    type=float,
+    default=0.3,
+    show_default=True,
+    help='Пауза имитатора между отправками координат.',
+)
+@click.option(
+    '--refresh_timeout',
+    type=float,
+    default=server.REFRESH_TIMEOUT,
+    show_default=True,
+    help='Задержка в обновлении координат сервера.',
+)
+@click.option(
+    '--encoding',
+    type=click.Choice(['json', 'binary']),
+    default='json',
+    show_default=True,
+    help='Формат сообщений имитатора.',
+)
+@click.option(
+    '--browsers',
+    default=20,
+    show_default=True,
+    help='Количество синтетических браузеров.',
+)
+@click.option(
+    '--protocol',
+    type=click.Choice(['full', 'delta']),
+    default='full',
+    show_default=True,
+    help='Протокол обмена браузеров с сервером.',
+)
+@click.option(
+    '--duration',
+    type=float,
+    default=20,
+    show_default=True,
+    help='Длительность замера в секундах.',
+)
+@click.option(
+    '--warmup',
+    type=float,
+    default=WARMUP,
+    show_default=True,
+    help='Длительность прогрева в секундах.',
+)
+@click.option(
+    '--seed',
+    default=0,
+    show_default=True,
+    help='Зерно генератора окон браузеров.',
+)
+@click.option(
+    '--output',
+    default='load_test.json',
+    show_default=True,
+    help='Файл для результатов.',
+)
+@click.option(
+    '--baseline',
+    default=None,
+    help='Файл с прошлыми результатами для сравнения.',
+)
+async def main(output, baseline, **options):
+    RouteStore.load(ROUTES_DIR)  # хранилище собирается один раз заранее
+    bus_port, browser_port = free_port(), free_port()
+    options['bus_url'] = 'ws://127.0.0.1:%d/ws' % (bus_port,)
+    options['browser_url'] = 'ws://127.0.0.1:%d/ws' % (browser_port,)
+    server.REFRESH_TIMEOUT = options['refresh_timeout']
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(
+            server.hub.run, server.receive_channel, options['refresh_timeout']
+        )
+        await nursery.start(
+            serve_websocket, server.get_message, '127.0.0.1', bus_port, None
+        )
+        await nursery.start(
+            serve_websocket,
+            server.talk_to_browser,
+            '127.0.0.1',
+            browser_port,
+            None,
+        )
+
+        fleet = subprocess.Popen(
+            [
+                sys.executable,
+                'fake_bus.py',
+                '--server',
+                options['bus_url'],
+                '--routes_number',
+                str(options['routes_number']),
+                '--buses_per_route',
+                str(options['buses_per_route']),
+                '--websockets_number',
+                str(options['websockets_number']),
+                '--refresh_timeout',
+                str(options['bus_refresh_timeout']),
+                '--encoding',
+                options['encoding'],
+            ]
+        )
+        browsers = context.Process(
+            target=start_browsers, args=(options, results), daemon=True
+        )
+        browsers.start()
+        try:
+            await trio.sleep(options['warmup'])
+            updates, cpu = server.bus_updates.value, server_cpu_time()
+            await trio.sleep(options['duration'])
+            ingested = server.bus_updates.value - updates
+            cpu = server_cpu_time() - cpu
+            rss = current_rss()
+            browser_stats = await trio.to_thread.run_sync(results.get)
+        finally:
+            fleet.terminate()
+            browsers.terminate()
+            nursery.cancel_scope.cancel()
+
+    result = summarize(options, browser_stats, ingested, cpu, rss)
+    summary = {key: value for key, value in result.items() if key != 'config'}
+    print(json.dumps(summary, indent=2))
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            print('\n'.join(compare(result, json.load(f))))
+
+
+if __name__ == '__main__':
+    with suppress(KeyboardInterrupt):
+        trio.run(main(_anyio_backend='trio'))
@@ -0,0 +1,86 @@
+"""Скопления автобусов вместо отдельных автобусов для широких окон карты"""
+
+import json
+import math
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+
+CLUSTER_THRESHOLD = 3000  # Больше скольких автобусов в окне браузер получает скопления.
+CLUSTER_SPAN = 0.3  # Окно шире или выше скольких градусов показывается скоплениями.
+CLUSTER_GRID = 24  # Сколько скоплений помещается в окно по каждой стороне.
+DOMINANT_ROUTES = 3  # Сколько самых частых маршрутов скопления отправляется браузеру.
+
+
+@dataclass(slots=True)
+class CellSummary:
+    """Сводка по автобусам одной ячейки сетки"""
+
+    count: int
+    lat_sum: float
+    lng_sum: float
+    routes: dict[int, int]  # индекс маршрута -> количество автобусов
+
+
+def summarize(
+    lat: np.ndarray, lng: np.ndarray, routes: np.ndarray
+) -> CellSummary:
+    """Сводка по автобусам ячейки из столбцов их координат и индексов маршрутов."""
+    indexes, counts = np.unique(routes, return_counts=True)
+    return CellSummary(
+        count=len(lat),
+        lat_sum=float(lat.sum()),
+        lng_sum=float(lng.sum()),
+        routes=dict(zip(indexes.tolist(), counts.tolist())),
+    )
+
+
+def cluster_factor(
+    lat_cells: int, lng_cells: int, cluster_grid: int = CLUSTER_GRID
+) -> int:
+    """Сколько ячеек сетки по каждой стороне объединяется в одно скопление, чтобы их было не больше cluster_grid."""
+    return max(
+        math.ceil(lat_cells / cluster_grid),
+        math.ceil(lng_cells / cluster_grid),
+        1,
+    )
+
+
+def join_clusters(cells, factor: int, route_names: list[str]) -> str:
+    """
+    Собирает сообщение BusClusters: ячейки сетки объединяются в блоки factor x factor, у каждого блока -
+    количество автобусов, центр масс и самые частые маршруты. Блоки привязаны к сетке, а не к окну,
+    поэтому при сдвиге карты скопления не прыгают.
+    :param cells: Пары (ячейка сетки, CellSummary).
+    :param factor: Сторона блока в ячейках.
+    :param route_names: Номера маршрутов по индексам.
+    """
+    blocks = dict()
+    for (lat_cell, lng_cell), summary in cells:
+        key = (lat_cell // factor, lng_cell // factor)
+        block = blocks.get(key)
+        if block is None:
+            block = blocks[key] = [0, 0.0, 0.0, Counter()]
+        block[0] += summary.count
+        block[1] += summary.lat_sum
+        block[2] += summary.lng_sum
+        block[3].update(summary.routes)
+
+    fragments = [
+        '{"lat": %r, "lng": %r, "count": %d, "routes": [%s]}'
+        % (
+            round(lat_sum / count, 6),
+            round(lng_sum / count, 6),
+            count,
+            ', '.join(
+                json.dumps(route_names[route], ensure_ascii=False)
+                for route, _ in routes.most_common(DOMINANT_ROUTES)
+            ),
+        )
+        for count, lat_sum, lng_sum, routes in blocks.values()
+        if count
+    ]
+    return '{"msgType": "BusClusters", "clusters": [%s]}' % (
+        ', '.join(fragments),
+    )
@@ -0,0 +1,57 @@
+"""Сжатие сообщений браузерам: бинарный кадр web-сокета с JSON, сжатым zlib"""
+
+import zlib
+
+COMPRESSION_LEVEL = 6  # Уровень сжатия zlib, 0 - сообщения не сжимаются.
+COMPRESSION_THRESHOLD = 4096  # Сообщения короче скольких символов отправляются без сжатия.
+
+
+class MessageCompressor:
+    """
+    Сжатие сообщений браузерам.
+    Браузеры с одинаковым окном получают от хаба одну и ту же строку, поэтому общее сообщение сжимается
+    один раз за версию состояния хаба, а остальные браузеры получают готовый кадр из кэша.
+    Кэш сбрасывается при смене версии. Собственные сообщения браузера (изменения протокола delta)
+    сжимаются каждый раз и в кэш не попадают.
+    """
+
+    def __init__(
+        self,
+        level: int = COMPRESSION_LEVEL,
+        threshold: int = COMPRESSION_THRESHOLD,
+    ):
+        """
+        :param level: Уровень сжатия zlib от 1 до 9, 0 - не сжимать.
+        :param threshold: Сообщения короче threshold символов отправляются как есть.
+        """
+        self.level = level
+        self.threshold = threshold
+        self._frames = dict()  # сообщение -> сжатый кадр
+        self._version = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def compress(
+        self, message: str, version: int, is_shared: bool = True
+    ) -> str | bytes:
+        """
+        Кадр для отправки браузеру: сжатые байты или исходная строка, если сжимать не нужно.
+        :param message: Сообщение для браузера.
+        :param version: Версия состояния хаба, из которой собрано сообщение.
+        :param is_shared: Сообщение может достаться другим браузерам (Buses, BusClusters из кэша хаба).
+        """
+        if not self.level or len(message) < self.threshold:
+            return message
+        if not is_shared:
+            return zlib.compress(message.encode('utf8'), self.level)
+
+        if version != self._version:
+            self._frames.clear()
+            self._version = version
+        frame = self._frames.get(message)
+        if frame is None:
+            frame = self._frames[message] = zlib.compress(
+                message.encode('utf8'), self.level
+            )
+        return frame
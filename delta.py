@@ -0,0 +1,59 @@
+"""Разностный протокол обмена с браузером: только добавленные, сдвинутые и убранные автобусы"""
+
+import json
+
+from hub import join_buses
+
+KEYFRAME_INTERVAL = 25  # Через сколько тиков браузер получает полный список автобусов для сверки.
+
+
+def join_delta(fragments, removed) -> str:
+    """Собирает сообщение BusesDelta из JSON-фрагментов изменившихся автобусов и номеров убранных."""
+    return '{"msgType": "BusesDelta", "buses": [%s], "removed": %s}' % (
+        ', '.join(fragments),
+        json.dumps(removed, ensure_ascii=False),
+    )
+
+
+class DeltaEncoder:
+    """
+    Кодировщик изменений для одного браузера.
+    Помнит JSON-фрагменты автобусов, отправленные браузеру в прошлый раз. Фрагменты хаба не меняются,
+    пока автобус стоит на месте, поэтому сдвинувшийся автобус определяется сравнением ссылок на строки.
+    Раз в keyframe_interval тиков отправляет полный список автобусов (ключевой кадр).
+    """
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        """:param keyframe_interval: Через сколько тиков отправлять ключевой кадр."""
+        self.keyframe_interval = keyframe_interval
+        self._sent = dict()  # busId -> JSON-фрагмент, который видит браузер
+        self._ticks = 0
+
+    def reset(self):
+        """Забывает отправленные автобусы: следующее сообщение будет ключевым кадром."""
+        self._sent = dict()
+        self._ticks = 0
+
+    def encode(self, visible: dict[str, str]) -> str | None:
+        """
+        Сообщение для браузера в текущем тике. Возвращает None, если в окне ничего не изменилось.
+        :param visible: Автобусы окна браузера: busId -> JSON-фрагмент.
+        """
+        is_keyframe = self._ticks % self.keyframe_interval == 0
+        self._ticks += 1
+
+        if is_keyframe:
+            self._sent = dict(visible)
+            return join_buses(visible.values())
+
+        changed = [
+            fragment
+            for bus_id, fragment in visible.items()
+            if self._sent.get(bus_id) is not fragment
+        ]
+        removed = [bus_id for bus_id in self._sent if bus_id not in visible]
+        if not changed and not removed:
+            return None
+
+        self._sent = dict(visible)
+        return join_delta(changed, removed)
@@ -1,29 +1,32 @@
 """Скрипт имитации автобусов"""
 
-import itertools
-import json
 import logging
-import os
+import random
 import warnings
-from collections import deque
-from contextlib import suppress, AsyncExitStack
-from functools import wraps
-from pathlib import Path
-from random import randrange
+from contextlib import suppress
+from dataclasses import dataclass
 
 import asyncclick as click
-import asyncstdlib as a
 import trio
 import trio_websocket
-from trio import MemoryReceiveChannel, MemorySendChannel
+from trio import MemoryReceiveChannel
 from trio import TrioDeprecationWarning
 from trio_websocket import open_websocket_url
 
-ROUTES_DIR = 'routes'    # папка с маршрутами автобусов
+from route_store import RouteStore
+from simulator import FleetSimulator
+from wire import WireEncoder
+
+ROUTES_DIR = 'routes'    # папка с маршрутами автобусов, из нее собирается хранилище маршрутов
 BUS_NUM_LENGTH = 3       # количество символов в номере автобуса
 RELAUNCH_INTERVAL = (
     1  # интервал переподключения в секундах при обрыве соединения с сервером
 )
+MAX_RELAUNCH_INTERVAL = 30  # до скольких секунд растет интервал переподключения при повторных неудачах
+SENDER_QUEUE_SIZE = 4    # сколько пачек координат может ждать отправки в один web-сокет
+BATCH_SIZE = 500         # сколько координат автобусов отправлять одним сообщением
+BATCH_LATENCY = 0.05     # сколько секунд можно ждать заполнения пачки координат
+ENCODINGS = ('json', 'binary')  # форматы сообщений для сервера
 
 warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
 logging.basicConfig(
@@ -33,47 +36,78 @@ logging.basicConfig(
 logger = logging.getLogger('fake-bus')
 
 
-async def load_routes(directory_path=ROUTES_DIR):
+@dataclass
+class EmulatorStats:
+    """Счетчики имитатора: сколько координат автобусов и сообщений отправлено на сервер"""
+
+    updates: int = 0
+    frames: int = 0
+    dropped: int = 0  # координаты, отброшенные, пока их web-сокет не подключен или его очередь заполнена
+
+
+def populate_fleet(
+    simulator: FleetSimulator,
+    routes,
+    buses_per_route: int,
+    emulator_id: str,
+    rng: random.Random = random,
+):
     """
-    Генератор, который возвращает json'ы с маршрутами из файлов папки с маршрутами.
-    :param directory_path: Имя/путь папки с json-файлами, содержащими маршруты.
+    Расставляет автобусы по маршрутам: на каждом маршруте случайное количество автобусов,
+    каждый автобус начинает поездку с произвольной точки маршрута.
+    :param simulator: Имитатор парка автобусов.
+    :param routes: Маршруты в формате json-файлов папки с маршрутами.
+    :param buses_per_route: Количество автобусов на каждом маршруте.
+    :param emulator_id: Префикс к busId.
+    :param rng: Генератор случайных чисел.
     """
-    for filename in os.listdir(directory_path):
-        logger.info('Открываем файл %s' % (filename,))
-        if filename.endswith('.json'):
-            filepath = os.path.join(Path(directory_path), filename)
-            async with await trio.open_file(
-                filepath, 'r', encoding='utf8'
-            ) as afp:
-                route_full_info = await afp.read()
-                yield json.loads(route_full_info)
-
-
-async def run_bus(
-    send_channel: MemorySendChannel,
-    bus_id: str,
-    points: list,
-    route_name: str,
-    refresh_timeout: float,
-    /,
-):
+    for route in routes:
+        route_index = simulator.add_route(
+            route['name'], route['coordinates'], route.get('coordinate_texts')
+        )
+        route_length = simulator.route_length(route_index)
+
+        for bus_index in range(rng.randrange(1, buses_per_route)):
+            logger.debug(
+                'Запускаем автобус %s по маршруту %s'
+                % (
+                    bus_index,
+                    route['name'],
+                )
+            )
+            simulator.add_bus(
+                route_index,
+                generate_bus_id(route['name'], bus_index, emulator_id),
+                rng.randrange(
+                    route_length
+                ),  # поездку начинаем с произвольной точки маршрута
+            )
+
+
+async def collect_batch(
+    receive_channel: MemoryReceiveChannel,
+    batch_size: int,
+    batch_latency: float,
+) -> list:
     """
-    Хэндлер запуска автобуса в очередь trio.
-    :param send_channel: Очередь trio.
-    :param bus_id: Номер автобуса.
-    :param points: Точки маршрута.
-    :param route_name: Номер маршрута.
-    :param refresh_timeout: Интервал в секундах между перемещениями автобусов по точкам маршрутов на карте.
+    Собирает пачку JSON-координат автобусов из канала: ждет первый список координат, затем добирает остальные,
+    пока пачка не наберет batch_size координат или не истечет batch_latency секунд.
+    :param receive_channel: Канал со списками JSON-координат автобусов.
+    :param batch_size: Размер пачки, после которого сбор прекращается.
+    :param batch_latency: Сколько секунд можно ждать заполнения пачки.
     """
-    for lat, long in itertools.cycle(points):
-        coordinate = {
-            'busId': bus_id,
-            'lat': lat,
-            'lng': long,
-            'route': route_name,
-        }
-        await send_channel.send(json.dumps(coordinate))
-        await trio.sleep(refresh_timeout)
+    batch = list(await receive_channel.receive())
+    with trio.move_on_after(batch_latency):
+        while len(batch) < batch_size:
+            batch.extend(await receive_channel.receive())
+    return batch
+
+
+def encode_batch(batch: list[str]) -> str:
+    """Сообщение для сервера из JSON-координат: координаты одного автобуса или пачка BusesBatch."""
+    if len(batch) == 1:
+        return batch[0]
+    return '{"msgType": "BusesBatch", "buses": [%s]}' % (', '.join(batch),)
 
 
 def generate_bus_id(route_id, bus_index, emulator_id):
@@ -81,55 +115,230 @@ def generate_bus_id(route_id, bus_index, emulator_id):
     return f'{route_id}-{emulator_id}{str(bus_index).zfill(BUS_NUM_LENGTH)}'
 
 
-def relaunch_on_disconnect(f):
+class SocketSender:
     """
-    Декоратор, отслеживающий соединение с сервером.
-    При обнаружении разрыва соединения происходит попытка нового подключения.
+    Отправка координат по одному web-сокету.
+    Пачки для сокета ждут в собственной ограниченной очереди, так что зависший сокет задерживает только
+    свою очередь. При обрыве соединения переподключается только этот сокет, с паузой, которая удваивается
+    после каждой неудачной попытки (до MAX_RELAUNCH_INTERVAL) и случайно растягивается или сжимается,
+    чтобы сокеты не переподключались одновременно. Пачка, которую отправляли в момент обрыва, теряется.
     """
 
-    @wraps(f)
-    async def wrapper(*args, **kwds):
-        with suppress(KeyboardInterrupt):
-            while True:
-                try:
-                    await f(*args, **kwds)
-                except (
-                    trio_websocket.HandshakeError,
-                    trio_websocket.ConnectionClosed,
-                ):
-                    logger.error(
-                        'Ошибка соединения с сервером. Попытка подключения через %d сек'
-                        % (RELAUNCH_INTERVAL,)
+    def __init__(
+        self,
+        server: str,
+        encoding: str = 'json',
+        stats: EmulatorStats | None = None,
+        queue_size: int = SENDER_QUEUE_SIZE,
+        rng: random.Random = random,
+        connect=open_websocket_url,
+    ):
+        """
+        :param server: Адрес сервера.
+        :param encoding: Формат сообщений для сервера: json или binary. Словарь автобусов бинарных кадров
+        начинается заново при каждом подключении.
+        :param stats: Счетчики отправленных координат и сообщений.
+        :param queue_size: Сколько пачек может ждать отправки.
+        :param rng: Генератор случайных чисел для разброса пауз переподключения.
+        :param connect: Открывает web-сокет по адресу сервера, async with connect(server) as ws.
+        """
+        self.server = server
+        self.encoding = encoding
+        self.stats = stats or EmulatorStats()
+        self.rng = rng
+        self.connect = connect
+        self.is_connected = False
+        self._is_closed = False
+        self._send_channel, self._receive_channel = trio.open_memory_channel(
+            queue_size
+        )
+
+    def send_nowait(self, batch: list) -> bool:
+        """Ставит пачку в очередь сокета, не дожидаясь места. Ложь, если сокет не подключен или очередь заполнена."""
+        if not self.is_connected:
+            return False
+        try:
+            self._send_channel.send_nowait(batch)
+        except trio.WouldBlock:
+            return False
+        return True
+
+    def close(self):
+        """Больше пачек не будет: run отправляет оставшиеся и завершается, а без соединения - сразу."""
+        self._is_closed = True
+        self._send_channel.close()
+
+    async def run(self):
+        """Отправляет пачки из очереди, переподключаясь при обрывах, пока очередь не закрыта и не опустела."""
+        interval = RELAUNCH_INTERVAL
+        while True:
+            try:
+                async with self.connect(self.server) as ws:
+                    self.is_connected = True
+                    interval = RELAUNCH_INTERVAL
+                    encode = (
+                        WireEncoder().encode
+                        if self.encoding == 'binary'
+                        else encode_batch
                     )
-                    await trio.sleep(RELAUNCH_INTERVAL)
+                    async for batch in self._receive_channel:
+                        await ws.send_message(encode(batch))
+                        self.stats.updates += len(batch)
+                        self.stats.frames += 1
+                    return
+            except (
+                OSError,
+                trio_websocket.HandshakeError,
+                trio_websocket.ConnectionClosed,
+            ):
+                self.is_connected = False
+                if self._is_closed:
+                    return
+                delay = interval * self.rng.uniform(0.5, 1.5)
+                logger.error(
+                    'Ошибка соединения с сервером. Попытка подключения через %.1f сек'
+                    % (delay,)
+                )
+                await trio.sleep(delay)
+                interval = min(interval * 2, MAX_RELAUNCH_INTERVAL)
+            finally:
+                self.is_connected = False
+
+
+def bus_key(update) -> str:
+    """Номер автобуса или неизменное для автобуса начало его JSON-координат: '{"busId": "120-000"'."""
+    if isinstance(update, tuple):
+        return update[0]
+    return update.partition(',')[0]
 
-    return wrapper
+
+def dispatch(senders: list[SocketSender], batch: list) -> int:
+    """
+    Раскладывает координаты пачки по сокетам: каждый автобус всегда отправляется через один и тот же сокет
+    (по хэшу номера), поэтому координаты одного автобуса приходят на сервер в том порядке, в котором их
+    отправил имитатор, и хаб не получит старое положение после нового. Не ждет: координаты для неподключенного
+    сокета или сокета с заполненной очередью отбрасываются, а следующие координаты тех же автобусов все
+    равно новее. Так зависший или переподключающийся сокет не задерживает остальные, а имитатор теряет
+    только долю координат, приходящуюся на этот сокет.
+    :return: количество отброшенных координат.
+    """
+    parts = [[] for _ in senders]
+    for update in batch:
+        parts[hash(bus_key(update)) % len(senders)].append(update)
+
+    dropped = 0
+    for sender, part in zip(senders, parts):
+        if part and not sender.send_nowait(part):
+            dropped += len(part)
+    return dropped
 
 
-@relaunch_on_disconnect
 async def send_updates(
     server: str,
     websockets_number: int,
     receive_channel: MemoryReceiveChannel,
+    batch_size: int = BATCH_SIZE,
+    batch_latency: float = BATCH_LATENCY,
+    stats: EmulatorStats | None = None,
+    encoding: str = 'json',
+    rng: random.Random = random,
+    connect=open_websocket_url,
     /,
 ):
     """
-    Отправляет координаты автобуса по web-сокету. Web-сокет выбирается случайным образом из заданных.
+    Отправляет координаты автобусов пачками через пул web-сокетов: у каждого сокета своя задача отправки
+    и своя очередь, координаты каждого автобуса всегда уходят через один и тот же сокет (SocketSender, dispatch).
+    Медленный или переподключающийся сокет не останавливает отправку через остальные.
     :param server: Адрес сервера.
     :param websockets_number: Количество открытых web-сокетов.
     :param receive_channel: Канал для приема координат автобуса для последующей отправки.
+    :param batch_size: Наибольшее количество координат в одном сообщении.
+    :param batch_latency: Сколько секунд можно ждать заполнения пачки.
+    :param stats: Счетчики отправленных координат и сообщений.
+    :param encoding: json - сообщения JSON, binary - бинарные кадры (wire.py) со своим словарем автобусов
+    у каждого web-сокета.
+    :param rng: Генератор случайных чисел для разброса пауз переподключения.
+    :param connect: Открывает web-сокет по адресу сервера (SocketSender).
     """
-    async with AsyncExitStack() as stack:
-        sockets = [
-            await stack.enter_async_context(open_websocket_url(server))
-            for _ in range(websockets_number)
-        ]
-        logger.info('Открыто %d сокетов.' % (len(sockets),))
-        async for message in receive_channel:
-            with suppress(KeyboardInterrupt):
-                await sockets[randrange(websockets_number)].send_message(
-                    message
+    stats = stats or EmulatorStats()
+    senders = [
+        SocketSender(server, encoding, stats, rng=rng, connect=connect)
+        for _ in range(websockets_number)
+    ]
+    async with trio.open_nursery() as nursery:
+        for sender in senders:
+            nursery.start_soon(sender.run)
+        logger.info('Открыто %d сокетов.' % (len(senders),))
+
+        while True:
+            try:
+                batch = await collect_batch(
+                    receive_channel, batch_size, batch_latency
                 )
+            except trio.EndOfChannel:
+                break
+            for start in range(0, len(batch), batch_size):
+                frame = batch[start:start + batch_size]
+                stats.dropped += dispatch(senders, frame)
+
+        for sender in senders:
+            sender.close()
+
+
+async def emulate(
+    server: str,
+    routes: list,
+    buses_per_route: int,
+    websockets_number: int,
+    emulator_id: str,
+    refresh_timeout: float,
+    batch_size: int = BATCH_SIZE,
+    batch_latency: float = BATCH_LATENCY,
+    stats: EmulatorStats | None = None,
+    encoding: str = 'json',
+    rng: random.Random = random,
+    connect=open_websocket_url,
+):
+    """
+    Расставляет автобусы по маршрутам и отправляет их координаты на сервер.
+    :param server: Адрес сервера.
+    :param routes: Маршруты в формате json-файлов папки с маршрутами.
+    :param buses_per_route: Количество автобусов на каждом маршруте.
+    :param websockets_number: Количество открытых web-сокетов.
+    :param emulator_id: Префикс к busId.
+    :param refresh_timeout: Пауза между отправками следующих координат автобусов.
+    :param batch_size: Наибольшее количество координат в одном сообщении.
+    :param batch_latency: Сколько секунд можно ждать заполнения пачки.
+    :param stats: Счетчики отправленных координат и сообщений.
+    :param encoding: Формат сообщений для сервера: json или binary.
+    :param rng: Генератор случайных чисел для расстановки автобусов и пауз переподключения.
+    :param connect: Открывает web-сокет по адресу сервера (SocketSender).
+    """
+    send_channel, receive_channel = trio.open_memory_channel(0)
+
+    simulator = FleetSimulator()
+    populate_fleet(simulator, routes, buses_per_route, emulator_id, rng)
+    logger.info(
+        'Запущено %d автобусов на %d маршрутах'
+        % (len(simulator), len(routes))
+    )
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(
+            send_updates,
+            server,
+            websockets_number,
+            receive_channel,
+            batch_size,
+            batch_latency,
+            stats,
+            encoding,
+            rng,
+            connect,
+        )
+        nursery.start_soon(
+            simulator.run, send_channel, refresh_timeout, batch_size, encoding
+        )
 
 
 def validate_routes_number(ctx, param, value) -> int:
@@ -193,6 +402,26 @@ def get_log_level(ctx, param, value) -> int:
     show_default=True,
     help='Пауза между отправками следующих координат фейковых автобусов.',
 )
+@click.option(
+    '--batch_size',
+    default=BATCH_SIZE,
+    show_default=True,
+    help='Наибольшее количество координат автобусов в одном сообщении (1 - без пачек).',
+)
+@click.option(
+    '--batch_latency',
+    type=float,
+    default=BATCH_LATENCY,
+    show_default=True,
+    help='Сколько секунд можно ждать заполнения пачки координат.',
+)
+@click.option(
+    '--encoding',
+    type=click.Choice(ENCODINGS),
+    default='json',
+    show_default=True,
+    help='Формат сообщений для сервера.',
+)
 @click.option(
     '-v',
     '--verbose',
@@ -207,49 +436,28 @@ async def main(
     websockets_number,
     emulator_id,
     refresh_timeout,
+    batch_size,
+    batch_latency,
+    encoding,
     verbose,
 ):
 
     logger.setLevel(verbose)
 
-    send_channel, receive_channel = trio.open_memory_channel(0)
-
-    async with trio.open_nursery() as nursery:
-        nursery.start_soon(
-            send_updates, server, websockets_number, receive_channel
-        )
-
-        async for i, route in a.enumerate(load_routes()):
-            if i == routes_number:
-                break
-
-            coordinates = (
-                route['coordinates'] + route['coordinates'][::-1]
-            )  # добавляем обратный путь
-
-            points = deque(coordinates)
-
-            for bus_index in range(randrange(1, buses_per_route)):
-                logger.debug(
-                    'Запускаем автобус %s по маршруту %s'
-                    % (
-                        bus_index,
-                        route['name'],
-                    )
-                )
-
-                points.rotate(
-                    randrange(len(coordinates))
-                )  # поездку начинаем с произвольной точки маршрута
-
-                nursery.start_soon(
-                    run_bus,
-                    send_channel,
-                    generate_bus_id(route['name'], bus_index, emulator_id),
-                    points.copy(),
-                    route['name'],
-                    refresh_timeout,
-                )
+    store = RouteStore.load(ROUTES_DIR)
+    routes = [store.route(i) for i in range(routes_number)]
+
+    await emulate(
+        server,
+        routes,
+        buses_per_route,
+        websockets_number,
+        emulator_id,
+        refresh_timeout,
+        batch_size,
+        batch_latency,
+        encoding=encoding,
+    )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,252 @@
+"""Состояние парка автобусов в столбцах NumPy"""
+
+import json
+import sys
+from collections import defaultdict
+from collections.abc import Iterator, Mapping
+from itertools import chain
+
+import numpy as np
+
+from models import Bus
+
+INITIAL_CAPACITY = 1024  # Сколько автобусов помещается в столбцы до первого расширения.
+COLUMNS = (
+    'bus_ids',
+    'lat',
+    'lng',
+    'route',
+    'updated',
+    'prefixes',
+    'fragments',
+)
+
+
+def encode_prefix(bus_id: str, route: str) -> str:
+    """Начало JSON-фрагмента автобуса: номер автобуса и маршрута, которые не меняются между тиками."""
+    return '{"busId": %s, "route": %s, ' % (
+        json.dumps(bus_id, ensure_ascii=False),
+        json.dumps(route, ensure_ascii=False),
+    )
+
+
+class FleetState(Mapping):
+    """
+    Автобусы на карте в параллельных массивах.
+    Номер автобуса закрепляется за строкой столбцов (интернируется) при первых координатах, номер маршрута -
+    за индексом в списке маршрутов. Новые координаты записываются в строку автобуса на месте, а строки
+    убранных автобусов используются повторно, поэтому память не растет от смены автобусов.
+    Снаружи состояние выглядит как словарь busId -> Bus, экземпляры Bus собираются из столбцов по запросу.
+    Для выборки по маршрутам строки автобусов каждого маршрута хранятся в отдельном множестве.
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        """:param capacity: Начальная емкость столбцов в автобусах."""
+        self._slots = dict()  # busId -> строка столбцов
+        self._free = []  # освободившиеся строки
+        self._routes = dict()  # номер маршрута -> индекс в route_names
+        self.route_names = []
+        self._route_slots = defaultdict(set)  # индекс маршрута -> строки его автобусов
+        self.bus_ids = np.full(capacity, None, dtype=object)
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+        self.route = np.zeros(capacity, dtype=np.int32)
+        self.updated = np.zeros(capacity, dtype=np.float64)  # время последних координат
+        self.prefixes = np.full(capacity, None, dtype=object)  # начала JSON-фрагментов
+        self.fragments = np.full(capacity, None, dtype=object)  # JSON автобусов, None - устарел
+
+    @property
+    def capacity(self) -> int:
+        return len(self.lat)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    def __contains__(self, bus_id) -> bool:
+        return bus_id in self._slots
+
+    def __getitem__(self, bus_id: str) -> Bus:
+        return self.bus(self._slots[bus_id])
+
+    def slot(self, bus_id: str) -> int | None:
+        """Строка столбцов автобуса."""
+        return self._slots.get(bus_id)
+
+    def bus(self, slot: int) -> Bus:
+        """Автобус, собранный из строки столбцов."""
+        return Bus(
+            self.bus_ids[slot],
+            float(self.lat[slot]),
+            float(self.lng[slot]),
+            self.route_names[self.route[slot]],
+        )
+
+    def _route_index(self, route: str) -> int:
+        index = self._routes.get(route)
+        if index is None:
+            index = self._routes[route] = len(self.route_names)
+            self.route_names.append(sys.intern(route))
+        return index
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        for name in COLUMNS:
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[len(column):] = None if column.dtype == object else 0
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    def _allocate(self, bus_id: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._slots)
+            if slot == self.capacity:
+                self._grow()
+        self._slots[bus_id] = slot
+        self.bus_ids[slot] = sys.intern(bus_id)
+        return slot
+
+    def write(self, buses, now: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Записывает координаты автобусов в их строки (write_columns).
+        :param buses: Автобусы с новыми координатами, номера автобусов не повторяются.
+        :param now: Время получения координат.
+        """
+        return self.write_columns(
+            [bus.busId for bus in buses],
+            [bus.route for bus in buses],
+            [bus.lat for bus in buses],
+            [bus.lng for bus in buses],
+            now,
+        )
+
+    def write_columns(
+        self, bus_ids, routes, lat, lng, now: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Записывает координаты автобусов в их строки, при необходимости выделяя новые. Номера автобусов
+        и маршрутов переводятся в строки и индексы словарями, координаты сравниваются и записываются
+        целыми столбцами.
+        :param bus_ids: Номера автобусов, без повторов.
+        :param routes: Номера маршрутов автобусов.
+        :param lat: Широты автобусов, список или массив.
+        :param lng: Долготы автобусов, список или массив.
+        :param now: Время получения координат.
+        :return: кортеж из строк автобусов и маски изменившихся: автобус не изменился, если уже стоял
+        в этой точке на этом маршруте.
+        """
+        slots, route_indexes, is_new = [], [], []
+        for bus_id, route in zip(bus_ids, routes):
+            slot = self._slots.get(bus_id)
+            is_new.append(slot is None)
+            slots.append(self._allocate(bus_id) if slot is None else slot)
+            route_indexes.append(self._route_index(route))
+        rows = np.array(slots, dtype=np.intp)
+        route = np.array(route_indexes, dtype=np.int32)
+        is_new = np.array(is_new, dtype=bool)
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+
+        new_route = is_new | (self.route[rows] != route)
+        is_changed = (
+            new_route | (self.lat[rows] != lat) | (self.lng[rows] != lng)
+        )
+        for slot, old_route, is_moved in zip(
+            rows[new_route].tolist(),
+            self.route[rows[new_route]].tolist(),
+            (~is_new[new_route]).tolist(),
+        ):
+            if is_moved:
+                self._route_slots[old_route].discard(slot)
+        self.updated[rows] = now
+        changed = rows[is_changed]
+        self.lat[changed] = lat[is_changed]
+        self.lng[changed] = lng[is_changed]
+        self.route[changed] = route[is_changed]
+        self.fragments[changed] = None
+        for slot, index in zip(
+            rows[new_route].tolist(), self.route[rows[new_route]].tolist()
+        ):
+            self._route_slots[index].add(slot)
+            self.prefixes[slot] = encode_prefix(
+                self.bus_ids[slot], self.route_names[index]
+            )
+        return rows, is_changed
+
+    def move(
+        self, slots: np.ndarray, lat: np.ndarray, lng: np.ndarray
+    ) -> np.ndarray:
+        """
+        Сдвигает автобусы без новых координат от имитатора (время последних координат не меняется).
+        Возвращает строки автобусов, которые действительно сдвинулись.
+        """
+        is_changed = (self.lat[slots] != lat) | (self.lng[slots] != lng)
+        changed = slots[is_changed]
+        self.lat[changed] = lat[is_changed]
+        self.lng[changed] = lng[is_changed]
+        self.fragments[changed] = None
+        return changed
+
+    def remove(self, bus_id: str) -> int | None:
+        """Убирает автобус и освобождает его строку. Возвращает освободившуюся строку."""
+        slot = self._slots.pop(bus_id, None)
+        if slot is not None:
+            self._route_slots[int(self.route[slot])].discard(slot)
+            self.bus_ids[slot] = None
+            self.prefixes[slot] = None
+            self.fragments[slot] = None
+            self._free.append(slot)
+        return slot
+
+    def route_slots(self, routes) -> np.ndarray:
+        """Строки автобусов на заданных маршрутах."""
+        indexes = (self._routes.get(route) for route in routes)
+        return np.fromiter(
+            chain.from_iterable(
+                self._route_slots[index]
+                for index in indexes
+                if index is not None
+            ),
+            dtype=np.intp,
+        )
+
+    def within(self, bounds, slots: np.ndarray) -> np.ndarray:
+        """
+        Строки автобусов, которые попадают в окно карты.
+        :param bounds: Координаты окна карты (WindowBounds).
+        :param slots: Строки, среди которых выбирать.
+        """
+        lat, lng = self.lat[slots], self.lng[slots]
+        return slots[
+            (bounds.south_lat < lat)
+            & (lat < bounds.north_lat)
+            & (bounds.west_lng < lng)
+            & (lng < bounds.east_lng)
+        ]
+
+    def encode(self, slots: np.ndarray) -> np.ndarray:
+        """
+        JSON-фрагменты автобусов для сообщения Buses. Устаревшие фрагменты собираются заново одним
+        проходом по столбцам, остальные берутся готовыми - это те же строки, что и в прошлый раз.
+        :param slots: Строки автобусов.
+        """
+        fragments = self.fragments[slots]
+        stale = slots[np.equal(fragments, None)]
+        if stale.size:
+            coordinates = np.array(
+                [
+                    '"lat": %r, "lng": %r}' % point
+                    for point in zip(
+                        self.lat[stale].tolist(), self.lng[stale].tolist()
+                    )
+                ],
+                dtype=object,
+            )
+            self.fragments[stale] = self.prefixes[stale] + coordinates
+            fragments = self.fragments[slots]
+        return fragments
@@ -0,0 +1,485 @@
+"""Широковещательная рассылка координат автобусов браузерам"""
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, suppress
+from itertools import chain
+
+import numpy as np
+import trio
+from trio import MemoryReceiveChannel
+
+from clusters import (
+    CLUSTER_SPAN,
+    CLUSTER_THRESHOLD,
+    cluster_factor,
+    join_clusters,
+    summarize,
+)
+from fleet import FleetState
+from interpolation import RouteInterpolator
+from models import BusColumns
+from spatial import VIEWPORT_TILES, GridIndex, snap_bounds
+from tracks import TrackStore, join_track
+
+SUBSCRIBER_BUFFER_SIZE = 1  # Сколько непрочитанных оповещений может накопить один браузер.
+BUS_TTL = 60  # Через сколько секунд без координат автобус убирается с карты.
+VIEWPORT_CACHE_SIZE = 128  # Сколько окон карты помнит кэш сообщений.
+
+logger = logging.getLogger('server.hub')
+
+
+def join_buses(fragments) -> str:
+    """Собирает сообщение Buses из готовых JSON-фрагментов автобусов."""
+    return '{"msgType": "Buses", "buses": [%s]}' % (', '.join(fragments),)
+
+
+class BusesHub:
+    """
+    Хаб рассылки автобусов.
+    Единственный потребитель канала входящих координат накапливает обновления, а раз в тик применяет их
+    к состоянию всех автобусов и оповещает подписчиков (браузеры). В течение тика состояние не меняется,
+    поэтому JSON каждого автобуса, каждой ячейки сетки и каждого окна карты кодируется не больше одного раза
+    и переиспользуется всеми браузерами. Состояние автобусов хранится в столбцах FleetState, в ячейках сетки
+    лежат строки столбцов, а выборка по окну и сборка JSON идут по массивам NumPy.
+    Окна браузеров расширяются до плиток сетки окон, так что браузеры, которые смотрят на один район, делят одну
+    выборку и одно сообщение, и работа хаба растет с количеством разных окон, а не браузеров.
+    Для широкого окна или окна с большим количеством автобусов вместо автобусов собираются скопления из сводок
+    по ячейкам сетки. Сводка ячейки считается заново, только когда в ячейке сдвинулся автобус.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = SUBSCRIBER_BUFFER_SIZE,
+        bus_ttl: float = BUS_TTL,
+        clock=time.monotonic,
+        interpolator: RouteInterpolator | None = None,
+        viewport_tiles: int = VIEWPORT_TILES,
+        cache_size: int = VIEWPORT_CACHE_SIZE,
+        cluster_threshold: int = CLUSTER_THRESHOLD,
+        cluster_span: float = CLUSTER_SPAN,
+        tracks: TrackStore | None = None,
+    ):
+        """
+        :param buffer_size: Размер буфера каждого подписчика. Если браузер не успевает забирать оповещения,
+        новые оповещения для него отбрасываются, не задерживая остальных.
+        :param bus_ttl: Через сколько секунд без координат автобус убирается с карты, 0 - никогда.
+        :param clock: Функция текущего времени в секундах.
+        :param interpolator: Интерполятор движения по маршрутам, None - автобусы стоят до новых координат.
+        :param viewport_tiles: Сколько плиток сетки окон помещается в окно карты, 0 - окна не расширяются.
+        :param cache_size: Сколько окон карты помнит кэш сообщений, давно не запрашиваемые окна вытесняются.
+        :param cluster_threshold: Больше скольких автобусов в окне отправляются скопления, 0 - никогда.
+        :param cluster_span: Окно шире или выше скольких градусов показывается скоплениями, 0 - по размеру
+        окна не показывается.
+        :param tracks: Хранилище недавних путей автобусов, None - пути не запоминаются.
+        """
+        self.bus_ttl = bus_ttl
+        self.clock = clock
+        self.interpolator = interpolator
+        self.tracks = tracks
+        self.viewport_tiles = viewport_tiles
+        self.cache_size = cache_size
+        self.cluster_threshold = cluster_threshold
+        self.cluster_span = cluster_span
+        self.buses = FleetState()
+        self.grid = GridIndex()
+        self.version = 0
+        self._pending = dict()  # обновления, пришедшие с прошлого тика: busId -> (маршрут, широта, долгота)
+        self._last_seen = OrderedDict()  # busId -> время последних координат, от давних к свежим
+        self._chunks = dict()  # ячейка -> JSON всех ее автобусов, пока ячейка не изменилась
+        self._payloads = OrderedDict()  # плитки окна -> (версия, сообщение Buses), от давних к свежим
+        self._visible = OrderedDict()  # плитки окна -> (версия, {busId: JSON автобуса})
+        self._summaries = dict()  # ячейка -> CellSummary, пока ячейка не изменилась
+        self._clusters = OrderedDict()  # плитки окна -> (версия, сообщение BusClusters или None)
+        self._buffer_size = buffer_size
+        self._subscribers = set()
+
+    @property
+    def pending(self) -> int:
+        """Количество автобусов с новыми координатами, ожидающих тика."""
+        return len(self._pending)
+
+    @property
+    def cached_payloads(self) -> int:
+        """Количество окон карты в кэше сообщений Buses."""
+        return len(self._payloads)
+
+    def update(self, bus):
+        """Запоминает новое положение автобуса до следующего тика. Из нескольких положений остается последнее."""
+        self._pending[bus.busId] = (bus.route, bus.lat, bus.lng)
+
+    def update_columns(self, columns: BusColumns):
+        """То же, что update для каждого автобуса пачки, но без экземпляров Bus и без цикла на Python."""
+        self._pending.update(
+            zip(columns.bus_ids, zip(columns.routes, columns.lat, columns.lng))
+        )
+
+    def apply(self) -> bool:
+        """
+        Применяет накопленные обновления к состоянию, убирает замолчавшие автобусы, сдвигает автобусы
+        вдоль маршрутов (если задан интерполятор) и сбрасывает устаревшие JSON-фрагменты.
+        Возвращает Истину, если состояние изменилось.
+        """
+        now = self.clock()
+        expired = self.expire(now)
+        reported = len(self._pending)
+        if reported:
+            self._report(now)
+        moved = self._interpolate(now) if self.interpolator is not None else 0
+        if not reported and not expired and not moved:
+            return False
+
+        self.version += 1
+        return True
+
+    def _report(self, now: float):
+        """Записывает накопленные координаты в состояние и передает их интерполятору и хранилищу путей."""
+        for bus_id in self._pending:
+            self._last_seen[bus_id] = now
+            self._last_seen.move_to_end(bus_id)
+
+        bus_ids = list(self._pending)
+        routes, lat, lng = zip(*self._pending.values())
+        self._pending.clear()
+        slots, is_changed = self.buses.write_columns(
+            bus_ids, routes, lat, lng, now
+        )
+        self._relocate(slots[is_changed])
+        if self.interpolator is not None:
+            self.interpolator.report(
+                slots,
+                routes,
+                self.buses.lat[slots],
+                self.buses.lng[slots],
+                now,
+            )
+        if self.tracks is not None:
+            self.tracks.record(
+                slots, self.buses.lat[slots], self.buses.lng[slots], now
+            )
+
+    def _interpolate(self, now: float) -> int:
+        """Сдвигает автобусы вдоль маршрутов между координатами. Возвращает количество сдвинутых."""
+        slots, lat, lng = self.interpolator.positions(now)
+        moved = self.buses.move(slots, lat, lng)
+        self._relocate(moved)
+        return len(moved)
+
+    def _relocate(self, slots: np.ndarray):
+        """Переносит сдвинувшиеся автобусы в ячейки сетки по их координатам и сбрасывает кэш затронутых ячеек."""
+        buses = self.buses
+        for slot, bus_id, lat, lng in zip(
+            slots.tolist(),
+            buses.bus_ids[slots].tolist(),
+            buses.lat[slots].tolist(),
+            buses.lng[slots].tolist(),
+        ):
+            old_cell = self.grid.locate(bus_id)
+            self.grid.place(bus_id, lat, lng, slot)
+            self._invalidate(old_cell)
+            self._invalidate(self.grid.locate(bus_id))
+
+    def _invalidate(self, cell):
+        """Сбрасывает JSON и сводку ячейки сетки."""
+        self._chunks.pop(cell, None)
+        self._summaries.pop(cell, None)
+
+    def expire(self, now: float) -> int:
+        """
+        Убирает автобусы, от которых не было координат дольше bus_ttl секунд. Возвращает количество убранных.
+        Автобусы в _last_seen упорядочены по времени последних координат, поэтому просматриваются только
+        убираемые автобусы и один свежий.
+        """
+        if not self.bus_ttl:
+            return 0
+
+        deadline = now - self.bus_ttl
+        expired = 0
+        while self._last_seen:
+            bus_id, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > deadline:
+                break
+            self._last_seen.popitem(last=False)
+            self._remove(bus_id)
+            expired += 1
+
+        if expired:
+            logger.debug('Убрано %d замолчавших автобусов' % (expired,))
+        return expired
+
+    def _remove(self, bus_id: str):
+        self._invalidate(self.grid.locate(bus_id))
+        self.grid.remove(bus_id)
+        slot = self.buses.remove(bus_id)
+        if slot is None:
+            return
+        if self.interpolator is not None:
+            self.interpolator.forget(slot)
+        if self.tracks is not None:
+            self.tracks.forget(slot)
+
+    def _cell_slots(self, cells) -> np.ndarray:
+        """Строки столбцов автобусов из ячеек сетки."""
+        return np.fromiter(
+            chain.from_iterable(self.grid.cell_buses(cell) for cell in cells),
+            dtype=np.intp,
+        )
+
+    def _edge_slots(self, bounds, edge_cells) -> np.ndarray:
+        return self.buses.within(bounds, self._cell_slots(edge_cells))
+
+    def slots(self, bounds, routes=None) -> np.ndarray:
+        """
+        Строки столбцов автобусов внутри окна карты.
+        :param routes: Номера маршрутов, автобусы которых нужны, None - все маршруты. Автобусы выбранных маршрутов
+        берутся из индекса маршрутов FleetState, и по окну проверяются только они.
+        """
+        if routes is not None:
+            return self.buses.within(bounds, self.buses.route_slots(routes))
+        inner_cells, edge_cells = self.grid.partition(bounds)
+        return np.concatenate(
+            [
+                self._cell_slots(inner_cells),
+                self._edge_slots(bounds, edge_cells),
+            ]
+        )
+
+    def query(self, bounds, routes=None):
+        """Автобусы внутри окна карты, если задано - только на маршрутах routes."""
+        return (
+            self.buses.bus(slot)
+            for slot in self.slots(bounds, routes).tolist()
+        )
+
+    def _chunk(self, cell) -> str:
+        chunk = self._chunks.get(cell)
+        if chunk is None:
+            chunk = self._chunks[cell] = ', '.join(
+                self.buses.encode(self._cell_slots([cell])).tolist()
+            )
+        return chunk
+
+    def _summary(self, cell):
+        summary = self._summaries.get(cell)
+        if summary is None:
+            slots = self._cell_slots([cell])
+            summary = self._summaries[cell] = summarize(
+                self.buses.lat[slots],
+                self.buses.lng[slots],
+                self.buses.route[slots],
+            )
+        return summary
+
+    def _slot_summaries(self, slots: np.ndarray):
+        """Пары (ячейка сетки, сводка) для заданных строк автобусов, сгруппированных по ячейкам."""
+        cells = dict()
+        for slot, bus_id in zip(
+            slots.tolist(), self.buses.bus_ids[slots].tolist()
+        ):
+            cells.setdefault(self.grid.locate(bus_id), []).append(slot)
+        for cell, cell_slots in cells.items():
+            cell_slots = np.array(cell_slots, dtype=np.intp)
+            yield cell, summarize(
+                self.buses.lat[cell_slots],
+                self.buses.lng[cell_slots],
+                self.buses.route[cell_slots],
+            )
+
+    def viewport(self, bounds) -> tuple[tuple, object]:
+        """Ключ кэша и окно, для которого собирается выборка: окно, расширенное до плиток, или исходное."""
+        if not self.viewport_tiles:
+            key = (
+                bounds.south_lat,
+                bounds.north_lat,
+                bounds.west_lng,
+                bounds.east_lng,
+            )
+            return key, bounds
+        return snap_bounds(bounds, self.viewport_tiles)
+
+    def _cached(self, cache: OrderedDict, bounds, build, routes=None):
+        """
+        Значение для окна карты и маршрутов в текущем тике из LRU-кэша. Если окна нет в кэше или значение
+        собрано в прошлых тиках, оно собирается заново вызовом build(окно, маршруты).
+        """
+        key, bounds = self.viewport(bounds)
+        key = (key, routes)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == self.version:
+            cache.move_to_end(key)
+            return entry[1]
+
+        value = build(bounds, routes)
+        cache[key] = (self.version, value)
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+
+    def _build_visible(self, bounds, routes) -> dict[str, str]:
+        slots = self.slots(bounds, routes)
+        return dict(
+            zip(
+                self.buses.bus_ids[slots].tolist(),
+                self.buses.encode(slots).tolist(),
+            )
+        )
+
+    def _build_payload(self, bounds, routes) -> str:
+        if routes is not None:
+            slots = self.slots(bounds, routes)
+            return join_buses(self.buses.encode(slots).tolist())
+        inner_cells, edge_cells = self.grid.partition(bounds)
+        fragments = [self._chunk(cell) for cell in inner_cells]
+        edge_slots = self._edge_slots(bounds, edge_cells)
+        fragments.extend(self.buses.encode(edge_slots).tolist())
+        return join_buses(fragments)
+
+    def _is_wide(self, bounds, counts) -> bool:
+        """
+        Показывать ли окно скоплениями: оно шире cluster_span или в нем больше cluster_threshold автобусов.
+        :param counts: Количества автобусов по частям окна, суммируются до превышения порога.
+        """
+        if self.cluster_span and max(
+            bounds.north_lat - bounds.south_lat,
+            bounds.east_lng - bounds.west_lng,
+        ) > self.cluster_span:
+            return True
+        total = 0
+        for count in counts:
+            total += count
+            if total > self.cluster_threshold:
+                return True
+        return False
+
+    def _build_clusters(self, bounds, routes) -> str | None:
+        if not self.cluster_threshold:
+            return None
+        if routes is None:
+            inner_cells, edge_cells = self.grid.partition(bounds)
+            cells = inner_cells + edge_cells
+            counts = (len(self.grid.cell_buses(cell)) for cell in cells)
+            if not self._is_wide(bounds, counts):
+                return None
+            summaries = ((cell, self._summary(cell)) for cell in cells)
+        else:
+            # выбранные маршруты видны по одному во всем городе, пока их автобусов не слишком много
+            slots = self.slots(bounds, routes)
+            if len(slots) <= self.cluster_threshold:
+                return None
+            summaries = self._slot_summaries(slots)
+        lat_cells, lng_cells = self.grid.cells(bounds)
+        return join_clusters(
+            summaries,
+            cluster_factor(len(lat_cells), len(lng_cells)),
+            self.buses.route_names,
+        )
+
+    def clusters(self, bounds, routes=None) -> str | None:
+        """
+        Сообщение BusClusters для окна карты в текущем тике или None, если окно показывается автобусами.
+        Ячейки сетки объединяются так, чтобы по каждой стороне окна было не больше CLUSTER_GRID скоплений,
+        поэтому размер сообщения не зависит от количества автобусов.
+        :param routes: Номера маршрутов без повторов в одном порядке, None - все маршруты.
+        """
+        return self._cached(
+            self._clusters, bounds, self._build_clusters, routes
+        )
+
+    def visible(self, bounds, routes=None) -> dict[str, str]:
+        """JSON-фрагменты автобусов окна карты и маршрутов routes в текущем тике: busId -> фрагмент."""
+        return self._cached(
+            self._visible, bounds, self._build_visible, routes
+        )
+
+    def payload(self, bounds, routes=None) -> str:
+        """
+        Сообщение Buses для окна карты в текущем тике.
+        Браузеры с одинаковыми плитками окна получают одну и ту же строку, ячейки внутри окна берутся целиком
+        из кэша ячеек, и только автобусы в ячейках на границе окна проверяются по одному.
+        Браузеры с фильтром маршрутов делят сообщение, если у них одинаковые и плитки, и маршруты.
+        """
+        return self._cached(
+            self._payloads, bounds, self._build_payload, routes
+        )
+
+    def track(
+        self,
+        bus_id: str,
+        since: float = -np.inf,
+        until: float = np.inf,
+        offset: float = 0,
+    ) -> str:
+        """
+        Сообщение Track с недавним путем автобуса от since до until. Путь неизвестного автобуса
+        или при выключенном хранилище путей пустой. Запрос только читает кольцо автобуса.
+        :param offset: Разница между часами запроса и часами хаба: на нее сдвигаются границы и время точек.
+        """
+        slot = self.buses.slot(bus_id)
+        if self.tracks is None or slot is None:
+            empty = np.zeros(0)
+            return join_track(bus_id, empty, empty, empty)
+        times, lat, lng = self.tracks.track(
+            slot, since - offset, until - offset
+        )
+        return join_track(bus_id, times + offset, lat, lng)
+
+    @contextmanager
+    def subscribe(self) -> MemoryReceiveChannel:
+        """Подписка на изменения состояния автобусов. Возвращает канал, из которого читаются номера версий."""
+        send_channel, receive_channel = trio.open_memory_channel(
+            self._buffer_size
+        )
+        self._subscribers.add(send_channel)
+        try:
+            with receive_channel:
+                yield receive_channel
+        finally:
+            self._subscribers.discard(send_channel)
+            send_channel.close()
+
+    def tick(self):
+        """
+        Применяет накопленные обновления и оповещает подписчиков о новой версии состояния,
+        если оно изменилось с прошлого тика. Переполненные буферы пропускаются.
+        """
+        if not self.apply():
+            return
+
+        logger.debug(
+            'Версия %d из %d автобусов для %d браузеров'
+            % (self.version, len(self.buses), len(self._subscribers))
+        )
+        for subscriber in self._subscribers:
+            with suppress(trio.WouldBlock):
+                subscriber.send_nowait(self.version)
+
+    async def ingest(self, receive_channel: MemoryReceiveChannel):
+        """
+        Получает координаты автобусов из канала и накапливает их до следующего тика.
+        :param receive_channel: Канал, из которого читаются списки валидированных автобусов.
+        """
+        async for buses in receive_channel:
+            if isinstance(buses, BusColumns):
+                self.update_columns(buses)
+                continue
+            for bus in buses:
+                self.update(bus)
+
+    async def broadcast(self, refresh_timeout: float):
+        """
+        Планировщик тиков: раз в refresh_timeout секунд применяет обновления и оповещает подписчиков.
+        :param refresh_timeout: Интервал в секундах между тиками.
+        """
+        while True:
+            self.tick()
+            await trio.sleep(refresh_timeout)
+
+    async def run(
+        self, receive_channel: MemoryReceiveChannel, refresh_timeout: float
+    ):
+        """Запускает прием координат и планировщик тиков."""
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(self.ingest, receive_channel)
+            nursery.start_soon(self.broadcast, refresh_timeout)
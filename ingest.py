@@ -0,0 +1,149 @@
+"""Прием координат автобусов в нескольких процессах"""
+
+import logging
+import multiprocessing
+import warnings
+from contextlib import suppress
+from functools import partial
+
+import trio
+from trio import MemorySendChannel, TrioDeprecationWarning
+from trio_websocket import ConnectionClosed, WebSocketServer
+
+from shared_ring import RING_CAPACITY, SharedRing
+from validators import ValidationError
+from wire import WireDecoder, decode_bus_message
+
+POLL_INTERVAL = 0.005  # Пауза в секундах между опросами буферов процессов приема.
+RING_RETRY_INTERVAL = 0.001  # Пауза в секундах перед повторной записью в заполненный буфер.
+
+warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
+logger = logging.getLogger('server.ingest')
+
+
+async def open_shared_listener(host: str, port: int) -> trio.SocketListener:
+    """
+    Открывает порт с SO_REUSEPORT: несколько процессов слушают один порт,
+    и ядро распределяет между ними входящие соединения.
+    """
+    sock = trio.socket.socket(trio.socket.AF_INET, trio.socket.SOCK_STREAM)
+    sock.setsockopt(trio.socket.SOL_SOCKET, trio.socket.SO_REUSEADDR, 1)
+    sock.setsockopt(trio.socket.SOL_SOCKET, trio.socket.SO_REUSEPORT, 1)
+    await sock.bind((host, port))
+    sock.listen()
+    return trio.SocketListener(sock)
+
+
+async def accept_buses(ring: SharedRing, request):
+    """
+    Хэндлер процесса приема: валидирует сообщения имитатора и дописывает автобусы в буфер процесса.
+    Сообщения и ошибки валидации считаются в счетчиках буфера, их забирает процесс сервера.
+    Если сервер не успевает разбирать буфер, хэндлер ждет, не читая новых сообщений из сокета.
+    """
+    ws = await request.accept()
+    decoder = WireDecoder()
+
+    with suppress(ConnectionClosed):
+        while message := await ws.get_message():
+
+            ring.count('messages')
+            is_valid, buses = decode_bus_message(message, decoder)
+            if not is_valid:
+                ring.count(buses.reason)
+                await ws.send_message(buses)
+                continue
+
+            try:
+                records = SharedRing.encode(buses)
+            except ValueError as e:
+                error = ValidationError('value', str(e))
+                ring.count(error.reason)
+                await ws.send_message(error)
+                continue
+
+            while records.size:
+                records = records[ring.write(records):]
+                if records.size:
+                    await trio.sleep(RING_RETRY_INTERVAL)
+
+
+async def serve_ingest(ring_name: str, capacity: int, host: str, port: int):
+    """Web-сокет сервер одного процесса приема."""
+    ring = SharedRing(capacity, name=ring_name)
+    listener = await open_shared_listener(host, port)
+    server = WebSocketServer(partial(accept_buses, ring), [listener])
+    await server.run()
+
+
+def start_ingest_worker(
+    ring_name: str, capacity: int, host: str, port: int, verbose: int
+):
+    """Точка входа процесса приема."""
+    logging.basicConfig(
+        format='%(asctime)s - %(levelname)s: %(name)s: %(message)s',
+        datefmt='%m/%d/%Y %H:%M:%S',
+    )
+    logger.setLevel(verbose)
+    with suppress(KeyboardInterrupt):
+        trio.run(serve_ingest, ring_name, capacity, host, port)
+
+
+async def run_ingest_workers(
+    workers: int,
+    host: str,
+    port: int,
+    send_channel: MemorySendChannel,
+    verbose: int = logging.ERROR,
+    capacity: int = RING_CAPACITY,
+    observe=None,
+):
+    """
+    Запускает процессы приема координат на одном порту и переправляет принятые ими автобусы в канал сервера.
+    У каждого процесса свой кольцевой буфер в разделяемой памяти: процесс только пишет в него, сервер только
+    читает, поэтому обмен обходится без блокировок и без сериализации через pipe.
+    :param workers: Количество процессов приема.
+    :param host: Адрес, на котором процессы принимают web-сокеты имитатора.
+    :param port: Порт для имитатора автобусов, общий для всех процессов.
+    :param send_channel: Канал, в который отправляются списки валидированных автобусов.
+    :param verbose: Уровень логирования процессов приема.
+    :param capacity: Емкость буфера каждого процесса в записях.
+    :param observe: Функция, которую процесс сервера вызывает с принятым процессом приема с прошлого опроса:
+    observe(columns, counters) - автобусы столбцами (BusColumns, может быть пустым) и приросты счетчиков
+    сообщений и ошибок валидации (SharedRing.take_counters). Так сервер ведет метрики и журнал координат.
+    """
+    context = multiprocessing.get_context('spawn')
+    rings = [SharedRing(capacity) for _ in range(workers)]
+    processes = [
+        context.Process(
+            target=start_ingest_worker,
+            args=(ring.name, capacity, host, port, verbose),
+            daemon=True,
+        )
+        for ring in rings
+    ]
+    try:
+        for process in processes:
+            process.start()
+        logger.info('Запущено %d процессов приема координат' % (workers,))
+
+        while True:
+            for ring in rings:
+                records = ring.read()
+                counters = ring.take_counters()
+                if not records.size and not any(counters.values()):
+                    continue
+                columns = SharedRing.columns(records)
+                if observe is not None:
+                    observe(columns, counters)
+                if len(columns):
+                    await send_channel.send(columns)
+            if not all(process.is_alive() for process in processes):
+                raise RuntimeError('Процесс приема координат остановился.')
+            await trio.sleep(POLL_INTERVAL)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        for ring in rings:
+            ring.close()
+            ring.unlink()
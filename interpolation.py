@@ -0,0 +1,296 @@
+"""Плавное движение автобусов между координатами от имитатора по геометрии маршрутов"""
+
+import math
+
+import numpy as np
+
+from route_store import RouteStore
+
+METERS_PER_DEGREE = 111_320  # Длина градуса широты в метрах.
+SEGMENT_CELL_SIZE = 100  # Размер ячейки индекса отрезков маршрута в метрах.
+MAX_OFFSET = 50  # Дальше скольких метров от маршрута автобус считается сошедшим с него.
+MAX_SPEED = 40  # Быстрее скольких м/с автобус не ездит: большая скорость - перескок, а не движение.
+INTERPOLATION_HORIZON = 5  # Сколько секунд после последних координат автобус продолжает двигаться.
+
+
+class RouteGeometry:
+    """
+    Геометрия маршрутов для проекции автобусов на маршрут и обратно.
+    Точки всех маршрутов хранилища переводятся в метры (равнопромежуточная проекция у средней широты),
+    для них считается накопленное расстояние вдоль маршрута. Отрезки каждого маршрута раскладываются
+    по ячейкам сетки при первой проекции на этот маршрут, так что проекция проверяет только отрезки
+    из ячейки автобуса, а не весь маршрут.
+    """
+
+    def __init__(
+        self,
+        store: RouteStore,
+        cell_size: float = SEGMENT_CELL_SIZE,
+        max_offset: float = MAX_OFFSET,
+    ):
+        """
+        :param store: Хранилище маршрутов.
+        :param cell_size: Размер ячейки индекса отрезков в метрах.
+        :param max_offset: Наибольшее расстояние от автобуса до маршрута в метрах.
+        """
+        self.cell_size = cell_size
+        self.max_offset = max_offset
+        self.indexes = {name: index for index, name in enumerate(store.names)}
+        self.offsets = np.asarray(store.route_offsets, dtype=np.int64)
+        self.points = np.asarray(store.points, dtype=np.float64)
+
+        mean_lat = float(self.points[:, 0].mean()) if len(self.points) else 0.0
+        self.scale = np.array(
+            [
+                METERS_PER_DEGREE,
+                METERS_PER_DEGREE * math.cos(math.radians(mean_lat)),
+            ]
+        )
+        self.xy = self.points * self.scale
+
+        # отрезки между последней точкой маршрута и первой точкой следующего имеют нулевую длину
+        lengths = np.hypot(*np.diff(self.xy, axis=0).T)
+        lengths[self.offsets[1:-1] - 1] = 0
+        self.distances = np.concatenate([[0.0], np.cumsum(lengths)])
+        self.starts = self.distances[self.offsets[:-1]]
+        self.lengths = (
+            self.distances[np.maximum(self.offsets[1:] - 1, 0)] - self.starts
+        )
+        self._segments = dict()  # маршрут -> {ячейка: номера начальных точек отрезков}
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _segment_index(self, route: int) -> dict:
+        """Отрезки маршрута по ячейкам сетки. Отрезок попадает во все ячейки рамки, расширенной на max_offset."""
+        index = self._segments.get(route)
+        if index is not None:
+            return index
+
+        cells = dict()
+        start, stop = int(self.offsets[route]), int(self.offsets[route + 1])
+        for segment in range(start, stop - 1):
+            (x0, y0), (x1, y1) = self.xy[segment:segment + 2].tolist()
+            south, west = self._cell(
+                min(x0, x1) - self.max_offset, min(y0, y1) - self.max_offset
+            )
+            north, east = self._cell(
+                max(x0, x1) + self.max_offset, max(y0, y1) + self.max_offset
+            )
+            for cell_x in range(south, north + 1):
+                for cell_y in range(west, east + 1):
+                    cells.setdefault((cell_x, cell_y), []).append(segment)
+
+        index = self._segments[route] = {
+            cell: np.array(segments, dtype=np.int64)
+            for cell, segments in cells.items()
+        }
+        return index
+
+    def project(
+        self,
+        routes: np.ndarray,
+        lat: np.ndarray,
+        lng: np.ndarray,
+        hints: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """
+        Расстояния от начала маршрута до проекций автобусов на их маршруты, в метрах.
+        NaN - маршрут неизвестен (-1) или автобус дальше max_offset от маршрута.
+        :param routes: Номера маршрутов хранилища.
+        :param lat: Широты автобусов.
+        :param lng: Долготы автобусов.
+        :param hints: Ожидаемые расстояния (NaN - нет ожиданий). Если маршрут проходит рядом с автобусом
+        несколько раз, выбирается проекция, ближайшая к ожидаемой, иначе - ближайшая к автобусу.
+        """
+        count = len(routes)
+        points = np.column_stack([lat, lng]) * self.scale
+        cells = np.floor(points / self.cell_size).astype(np.int64).tolist()
+        candidates, buses, counts = [], [], []
+        for bus, (route, cell) in enumerate(zip(routes.tolist(), cells)):
+            if route < 0:
+                continue
+            segments = self._segment_index(route).get(tuple(cell))
+            if segments is not None:
+                candidates.append(segments)
+                buses.append(bus)
+                counts.append(len(segments))
+
+        distances = np.full(count, np.nan)
+        if not candidates:
+            return distances
+        segments = np.concatenate(candidates)
+        owners = np.repeat(buses, counts)
+
+        a, b = self.xy[segments], self.xy[segments + 1]
+        ab = b - a
+        squared = (ab * ab).sum(axis=1)
+        t = np.zeros(len(segments))
+        np.divide(
+            ((points[owners] - a) * ab).sum(axis=1),
+            squared,
+            out=t,
+            where=squared > 0,
+        )
+        t = np.clip(t, 0, 1)
+        offsets = np.hypot(*(points[owners] - a - t[:, None] * ab).T)
+        along = (
+            self.distances[segments]
+            + t * (self.distances[segments + 1] - self.distances[segments])
+            - self.starts[routes[owners]]
+        )
+
+        scores = offsets.copy()
+        if hints is not None:
+            has_hint = ~np.isnan(hints[owners])
+            scores[has_hint] = np.abs(along - hints[owners])[has_hint]
+        scores[offsets > self.max_offset] = np.inf
+
+        # кандидаты каждого автобуса идут подряд: лучший ищется без сортировки
+        starts = np.cumsum(counts) - counts
+        best = np.minimum.reduceat(scores, starts)
+        first = np.flatnonzero(scores == np.repeat(best, counts))
+        first = first[np.diff(owners[first], prepend=-1) != 0]
+        found = np.isfinite(scores[first])
+        distances[owners[first][found]] = along[first][found]
+        return distances
+
+    def locate(
+        self, routes: np.ndarray, distances: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Координаты точек маршрутов на заданном расстоянии от начала.
+        :param routes: Номера маршрутов хранилища.
+        :param distances: Расстояния от начала маршрутов в метрах, обрезаются по длине маршрута.
+        :return: кортеж из массивов широт и долгот.
+        """
+        distances = (
+            np.clip(distances, 0, self.lengths[routes]) + self.starts[routes]
+        )
+        first, last = self.offsets[routes], self.offsets[routes + 1] - 1
+        ends = np.clip(
+            np.searchsorted(self.distances, distances, side='right'),
+            first + 1,
+            np.maximum(last, first + 1),
+        )
+        ends = np.minimum(ends, last)
+        begins = np.maximum(ends - 1, first)
+        spans = self.distances[ends] - self.distances[begins]
+        t = np.zeros(len(routes))
+        np.divide(
+            distances - self.distances[begins], spans, out=t, where=spans > 0
+        )
+        t = np.clip(t, 0, 1)[:, None]
+        points = self.points[begins] * (1 - t) + self.points[ends] * t
+        return points[:, 0], points[:, 1]
+
+
+class RouteInterpolator:
+    """
+    Движение автобусов вдоль маршрутов между координатами от имитатора.
+    Для каждой строки столбцов FleetState хранит маршрут, расстояние от его начала в момент последних координат,
+    скорость вдоль маршрута и время последних координат. Скорость считается по двум последним проекциям.
+    Между координатами автобус сдвигается по маршруту с этой скоростью, но не дольше horizon секунд.
+    """
+
+    def __init__(
+        self,
+        geometry: RouteGeometry,
+        horizon: float = INTERPOLATION_HORIZON,
+        max_speed: float = MAX_SPEED,
+        capacity: int = 0,
+    ):
+        """
+        :param geometry: Геометрия маршрутов.
+        :param horizon: Сколько секунд после последних координат автобус продолжает двигаться.
+        :param max_speed: Наибольшая скорость автобуса в м/с, при большей автобус не сдвигается до следующих координат.
+        :param capacity: Начальная емкость столбцов в автобусах.
+        """
+        self.geometry = geometry
+        self.horizon = horizon
+        self.max_speed = max_speed
+        self.route = np.full(capacity, -1, dtype=np.int64)  # -1 - автобус не на известном маршруте
+        self.distance = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.reported = np.zeros(capacity)
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.route):
+            return
+        grown = max(capacity, len(self.route) * 2)
+        for name, fill in (
+            ('route', -1),
+            ('distance', 0),
+            ('speed', 0),
+            ('reported', 0),
+        ):
+            column = getattr(self, name)
+            new_column = np.full(grown, fill, dtype=column.dtype)
+            new_column[:len(column)] = column
+            setattr(self, name, new_column)
+
+    def forget(self, slot: int):
+        """Сбрасывает состояние строки убранного автобуса."""
+        if slot < len(self.route):
+            self.route[slot] = -1
+            self.speed[slot] = 0
+
+    def report(
+        self,
+        slots: np.ndarray,
+        routes: list[str],
+        lat: np.ndarray,
+        lng: np.ndarray,
+        now: float,
+    ):
+        """
+        Учитывает новые координаты автобусов.
+        :param slots: Строки автобусов в столбцах FleetState.
+        :param routes: Номера маршрутов автобусов.
+        :param lat: Широты автобусов.
+        :param lng: Долготы автобусов.
+        :param now: Время получения координат.
+        """
+        if not len(slots):
+            return
+        self._reserve(int(slots.max()) + 1)
+        indexes = self.geometry.indexes
+        routes = np.array(
+            [indexes.get(route, -1) for route in routes], dtype=np.int64
+        )
+
+        same_route = (self.route[slots] == routes) & (routes >= 0)
+        elapsed = now - self.reported[slots]
+        expected = self.distance[slots] + self.speed[slots] * np.minimum(
+            elapsed, self.horizon
+        )
+        hints = np.where(same_route, expected, np.nan)
+        distances = self.geometry.project(routes, lat, lng, hints)
+
+        speed = np.zeros(len(slots))
+        moving = same_route & (elapsed > 0) & ~np.isnan(distances)
+        speed[moving] = (
+            distances[moving] - self.distance[slots][moving]
+        ) / elapsed[moving]
+        speed[np.abs(speed) > self.max_speed] = 0
+
+        found = ~np.isnan(distances)
+        self.route[slots] = np.where(found, routes, -1)
+        self.distance[slots] = np.where(found, distances, 0)
+        self.speed[slots] = speed
+        self.reported[slots] = now
+
+    def positions(
+        self, now: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Координаты движущихся автобусов в момент now.
+        :return: кортеж из строк автобусов, широт и долгот.
+        """
+        slots = np.flatnonzero((self.route >= 0) & (self.speed != 0))
+        elapsed = np.clip(now - self.reported[slots], 0, self.horizon)
+        lat, lng = self.geometry.locate(
+            self.route[slots],
+            self.distance[slots] + self.speed[slots] * elapsed,
+        )
+        return slots, lat, lng
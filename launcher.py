@@ -0,0 +1,263 @@
+"""Скрипт запуска имитатора автобусов в нескольких процессах"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import warnings
+from contextlib import suppress
+
+import asyncclick as click
+import trio
+from trio import TrioDeprecationWarning
+
+import fake_bus
+from fake_bus import (
+    BATCH_LATENCY,
+    BATCH_SIZE,
+    ENCODINGS,
+    ROUTES_DIR,
+    EmulatorStats,
+    emulate,
+)
+from route_store import RouteStore
+
+REPORT_INTERVAL = 5  # интервал в секундах между отчетами о пропускной способности
+
+warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%m/%d/%Y %H:%M:%S',
+)
+logger = logging.getLogger('launcher')
+
+
+def shard_routes(routes: list, workers: int) -> list:
+    """Раскладывает маршруты по процессам по очереди. Процессы без маршрутов не запускаются."""
+    shards = [routes[worker::workers] for worker in range(workers)]
+    return [shard for shard in shards if shard]
+
+
+async def report_stats(
+    worker: int, stats: EmulatorStats, stats_queue, interval: float
+):
+    """Раз в interval секунд отправляет координатору счетчики процесса."""
+    while True:
+        await trio.sleep(interval)
+        stats_queue.put((worker, stats.updates, stats.frames))
+
+
+async def run_shard(
+    worker: int, route_indexes: list, options: dict, stats_queue
+):
+    """
+    Имитатор одного процесса: свои маршруты, свой префикс busId, своя доля web-сокетов.
+    Координаты маршрутов читаются из общего для всех процессов хранилища, отображенного в память.
+    """
+    store = RouteStore.load(ROUTES_DIR)
+    routes = [store.route(i) for i in route_indexes]
+    stats = EmulatorStats()
+
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(
+            report_stats, worker, stats, stats_queue, options['report_interval']
+        )
+        await emulate(
+            options['server'],
+            routes,
+            options['buses_per_route'],
+            options['websockets_number'],
+            '%s%d-' % (options['emulator_id'], worker),
+            options['refresh_timeout'],
+            options['batch_size'],
+            options['batch_latency'],
+            stats,
+            options['encoding'],
+        )
+
+
+def start_worker(
+    worker: int, route_indexes: list, options: dict, stats_queue, verbose: int
+):
+    """Точка входа процесса имитатора."""
+    fake_bus.logger.setLevel(verbose)
+    with suppress(KeyboardInterrupt):
+        trio.run(run_shard, worker, route_indexes, options, stats_queue)
+
+
+class StatsReport:
+    """Сводка пропускной способности процессов имитатора"""
+
+    def __init__(self, workers: int):
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.totals = {worker: (0, 0) for worker in range(workers)}
+        self.last_totals = dict(self.totals)
+
+    def collect(self, stats_queue):
+        """Забирает из очереди последние счетчики процессов."""
+        with suppress(queue.Empty):
+            while True:
+                worker, updates, frames = stats_queue.get_nowait()
+                self.totals[worker] = (updates, frames)
+
+    def format(self) -> str:
+        """Строка отчета: скорость каждого процесса и общая скорость с прошлого отчета."""
+        now = time.monotonic()
+        elapsed = max(now - self.reported, 1e-9)
+        rates = {
+            worker: (
+                (updates - self.last_totals[worker][0]) / elapsed,
+                (frames - self.last_totals[worker][1]) / elapsed,
+            )
+            for worker, (updates, frames) in self.totals.items()
+        }
+        self.reported, self.last_totals = now, dict(self.totals)
+
+        total_updates = sum(updates for updates, _ in rates.values())
+        total_frames = sum(frames for _, frames in rates.values())
+        workers = ', '.join(
+            '#%d: %.0f' % (worker, updates)
+            for worker, (updates, _) in rates.items()
+        )
+        return (
+            'Всего %.0f координат/с, %.0f сообщений/с. По процессам: %s'
+            % (total_updates, total_frames, workers)
+        )
+
+    def format_totals(self) -> str:
+        """Итоговая строка: сколько отправлено за все время работы."""
+        updates = sum(updates for updates, _ in self.totals.values())
+        frames = sum(frames for _, frames in self.totals.values())
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return 'Итого %d координат, %d сообщений за %.0f сек (%.0f координат/с)' % (
+            updates,
+            frames,
+            elapsed,
+            updates / elapsed,
+        )
+
+
+@click.command()
+@click.option(
+    '--workers',
+    type=click.IntRange(1),
+    default=os.cpu_count(),
+    show_default=True,
+    help='Количество процессов имитатора.',
+)
+@click.option(
+    '--server',
+    default='ws://127.0.0.1:8080/ws',
+    show_default=True,
+    help='Адрес сервера.',
+)
+@click.option(
+    '--routes_number',
+    default=595,
+    show_default=True,
+    callback=fake_bus.validate_routes_number,
+    help='Количество маршрутов (от 1 до 595).',
+)
+@click.option(
+    '--buses_per_route',
+    default=100,
+    show_default=True,
+    help='Количество автобусов на каждом маршруте.',
+)
+@click.option(
+    '--websockets_number',
+    default=10,
+    show_default=True,
+    help='Общее количество открытых веб-сокетов, делится между процессами.',
+)
+@click.option(
+    '--emulator_id',
+    default='',
+    help='Префикс к busId, к нему добавляется номер процесса.',
+)
+@click.option(
+    '--refresh_timeout',
+    type=float,
+    default=0.3,
+    show_default=True,
+    help='Пауза между отправками следующих координат фейковых автобусов.',
+)
+@click.option(
+    '--batch_size',
+    default=BATCH_SIZE,
+    show_default=True,
+    help='Наибольшее количество координат автобусов в одном сообщении.',
+)
+@click.option(
+    '--batch_latency',
+    type=float,
+    default=BATCH_LATENCY,
+    show_default=True,
+    help='Сколько секунд можно ждать заполнения пачки координат.',
+)
+@click.option(
+    '--encoding',
+    type=click.Choice(ENCODINGS),
+    default='json',
+    show_default=True,
+    help='Формат сообщений для сервера.',
+)
+@click.option(
+    '--report_interval',
+    type=float,
+    default=REPORT_INTERVAL,
+    show_default=True,
+    help='Интервал в секундах между отчетами о пропускной способности.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    callback=fake_bus.get_log_level,
+    help='Настройка логирования.',
+)  # https://click.palletsprojects.com/en/8.1.x/options/#counting
+async def main(workers, verbose, **options):
+
+    logger.setLevel(min(verbose, logging.INFO))
+
+    RouteStore.load(ROUTES_DIR)  # собираем хранилище до запуска процессов
+    shards = shard_routes(list(range(options['routes_number'])), workers)
+    options['websockets_number'] = max(
+        options['websockets_number'] // len(shards), 1
+    )
+
+    context = multiprocessing.get_context('spawn')
+    stats_queue = context.Queue()
+    processes = [
+        context.Process(
+            target=start_worker,
+            args=(worker, route_indexes, options, stats_queue, verbose),
+            daemon=True,
+        )
+        for worker, route_indexes in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(
+        'Запущено %d процессов по %d сокетов'
+        % (len(processes), options['websockets_number'])
+    )
+
+    report = StatsReport(len(processes))
+    try:
+        while any(process.is_alive() for process in processes):
+            await trio.sleep(options['report_interval'])
+            report.collect(stats_queue)
+            logger.info(report.format())
+    finally:
+        for process in processes:
+            process.terminate()
+        report.collect(stats_queue)
+        logger.info(report.format_totals())
+
+
+if __name__ == '__main__':
+    with suppress(KeyboardInterrupt):
+        trio.run(main(_anyio_backend='trio'))
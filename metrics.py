@@ -0,0 +1,273 @@
+"""Метрики сервера в текстовом формате Prometheus"""
+
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import suppress
+from functools import partial
+
+import trio
+
+# Границы корзин гистограмм по умолчанию: длительности в секундах.
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+# Границы корзин для размеров сообщений в байтах.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+REQUEST_TIMEOUT = 5  # Сколько секунд ждать запрос к странице метрик.
+MAX_REQUEST_SIZE = 8192  # Наибольший размер заголовков запроса к странице метрик в байтах.
+
+logger = logging.getLogger('server.metrics')
+
+
+class Registry:
+    """Набор метрик, которые отдаются одной страницей."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for suffix, labels, value in metric.samples():
+                lines.append(
+                    '%s%s%s %s'
+                    % (
+                        metric.name,
+                        suffix,
+                        format_labels(labels),
+                        format_value(value),
+                    )
+                )
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def escape_label(value) -> str:
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{%s}' % (
+        ','.join(
+            '%s="%s"' % (name, escape_label(value)) for name, value in labels
+        ),
+    )
+
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return '%d' % (value,)
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """
+    Основа метрик. Значения хранятся в обычных атрибутах и меняются только из цикла событий trio,
+    поэтому блокировки не нужны. Метрика с метками хранит дочерние метрики для каждого набора значений меток.
+    """
+
+    type = 'untyped'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        registry=REGISTRY,
+    ):
+        """
+        :param name: Имя метрики.
+        :param documentation: Описание метрики для строки HELP.
+        :param labelnames: Имена меток.
+        :param registry: Набор метрик, None - метрика не отдается на странице.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = dict()
+        if registry is not None:
+            registry.register(self)
+
+    def _child(self):
+        return type(self)(self.name, self.documentation, registry=None)
+
+    def labels(self, *values):
+        """Дочерняя метрика для значений меток. Дочерние метрики создаются один раз и переиспользуются."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f'{self.name}: Ожидаются значения меток {", ".join(self.labelnames)}.'
+                )
+            child = self._children[values] = self._child()
+        return child
+
+    def samples(self):
+        """Строки метрики: суффикс имени, метки, значение."""
+        if not self.labelnames:
+            yield from self._samples(())
+            return
+        for values, child in self._children.items():
+            yield from child._samples(tuple(zip(self.labelnames, values)))
+
+    @abstractmethod
+    def _samples(self, labels: tuple):
+        """Строки метрики без меток дочерних метрик: суффикс имени, метки, значение."""
+
+
+class Counter(Metric):
+    """Счетчик, который только растет."""
+
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _samples(self, labels: tuple):
+        yield '', labels, self.value
+
+
+class Gauge(Metric):
+    """Текущее значение. Может вычисляться функцией в момент чтения метрик."""
+
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0
+        self._function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """:param function: Функция без аргументов, которая возвращает текущее значение."""
+        self._function = function
+
+    def _samples(self, labels: tuple):
+        if self._function is None:
+            yield '', labels, self.value
+        else:
+            yield '', labels, self._function()
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам, а также их сумма и количество."""
+
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: tuple = DURATION_BUCKETS, **kwargs):
+        """:param buckets: Верхние границы корзин по возрастанию."""
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # последняя корзина - больше всех границ
+        self.sum = 0
+        self.count = 0
+
+    def _child(self):
+        return Histogram(
+            self.name, self.documentation, buckets=self.buckets, registry=None
+        )
+
+    def observe(self, value: float):
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _samples(self, labels: tuple):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self._counts):
+            cumulative += count
+            bucket_labels = labels + (('le', format_value(bound)),)
+            yield '_bucket', bucket_labels, cumulative
+        yield '_sum', labels, self.sum
+        yield '_count', labels, self.count
+
+
+async def respond_metrics(registry: Registry, stream: trio.SocketStream):
+    """
+    Отвечает на один HTTP-запрос: GET /metrics - метрики, остальное - 404.
+    Оборванное клиентом соединение просто закрывается: ошибка не должна остановить serve_tcp и сервер вместе с ним.
+    """
+    try:
+        with suppress(trio.BrokenResourceError, trio.ClosedResourceError):
+            request = b''
+            with trio.move_on_after(REQUEST_TIMEOUT):
+                while (
+                    b'\r\n\r\n' not in request
+                    and len(request) < MAX_REQUEST_SIZE
+                ):
+                    data = await stream.receive_some(MAX_REQUEST_SIZE)
+                    if not data:
+                        break
+                    request += data
+
+            method, _, path = request.partition(b'\r\n')[0].partition(b' ')
+            if (
+                method == b'GET'
+                and path.split(b' ')[0].split(b'?')[0] == b'/metrics'
+            ):
+                status, body = b'200 OK', registry.render().encode('utf8')
+            else:
+                status, body = b'404 Not Found', b'Not Found\n'
+
+            with trio.move_on_after(REQUEST_TIMEOUT):
+                await stream.send_all(
+                    b'HTTP/1.1 %s\r\n'
+                    b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                    b'Content-Length: %d\r\n'
+                    b'Connection: close\r\n\r\n%s'
+                    % (status, len(body), body)
+                )
+    finally:
+        await stream.aclose()
+
+
+async def serve_metrics(
+    host: str,
+    port: int,
+    registry: Registry = REGISTRY,
+    *,
+    task_status=trio.TASK_STATUS_IGNORED,
+):
+    """
+    Страница метрик для Prometheus: http://host:port/metrics.
+    :param host: Адрес для страницы метрик.
+    :param port: Порт для страницы метрик.
+    :param registry: Набор метрик.
+    """
+    logger.info('Метрики доступны на http://%s:%d/metrics' % (host, port))
+    await trio.serve_tcp(
+        partial(respond_metrics, registry),
+        port,
+        host=host,
+        task_status=task_status,
+    )
@@ -0,0 +1,316 @@
+"""Сообщения от имитатора автобусов и от фронтенда"""
+
+import math
+from dataclasses import dataclass
+
+PROTOCOL_MODES = ('full', 'delta')  # Протоколы обмена с браузером.
+
+
+@dataclass(slots=True)
+class Bus:
+    """Автобус на карте"""
+
+    busId: str  # номер автобуса
+    lat: float  # географическая ширина местоположения автобуса
+    lng: float  # географическая долгота местоположения автобуса
+    route: str  # номер маршрута
+
+    def __post_init__(self):
+        if not isinstance(self.busId, str):
+            raise ValueError(
+                f'{self.busId}: Номер автобуса должен быть задан строкой.'
+            )
+        if not isinstance(self.lat, float):
+            raise ValueError(
+                f'{self.lat}: Географическая широта местоположения автобуса должна быть числом с плавающей точкой.'
+            )
+        if not isinstance(self.lng, float):
+            raise ValueError(
+                f'{self.lng}: Географическая долгота местоположения автобуса должна быть числом с плавающей точкой.'
+            )
+        if not (math.isfinite(self.lat) and math.isfinite(self.lng)):
+            raise ValueError(
+                f'{self.lat}, {self.lng}: Координаты автобуса должны быть конечными числами.'
+            )
+        if not isinstance(self.route, str):
+            raise ValueError(
+                f'{self.route}: Номер маршрута должен быть задан строкой.'
+            )
+
+
+@dataclass(slots=True)
+class BusesBatch:
+    """Пачка координат автобусов от имитатора"""
+
+    msgType: str
+    buses: list[Bus]
+
+    def __post_init__(self):
+        if not (
+            isinstance(self.msgType, str) and self.msgType == 'BusesBatch'
+        ):
+            raise ValueError(
+                f'{self.msgType}: Тип сообщения должен быть строкой "BusesBatch".'
+            )
+        if not isinstance(self.buses, list):
+            raise ValueError(
+                f'{self.buses}: Координаты автобусов должны быть заданы списком.'
+            )
+
+        self.buses = [Bus(**bus) for bus in self.buses]
+
+
+@dataclass(slots=True)
+class BusColumns:
+    """
+    Координаты пачки автобусов столбцами, без экземпляров Bus.
+    Так процесс сервера получает автобусы, уже провалидированные процессами приема (ingest.py).
+    """
+
+    bus_ids: list[str]  # номера автобусов
+    routes: list[str]  # номера маршрутов
+    lat: list[float]  # географические широты
+    lng: list[float]  # географические долготы
+
+    def __len__(self):
+        return len(self.bus_ids)
+
+
+BUS_MESSAGES = {
+    None: Bus,
+    'BusesBatch': BusesBatch,
+}
+
+
+@dataclass(slots=True)
+class WindowBounds:
+    """Координаты окна карты фронтенда"""
+
+    south_lat: float | None = None
+    north_lat: float | None = None
+    west_lng: float | None = None
+    east_lng: float | None = None
+
+    def is_inside(self, lat: float, lng: float) -> bool:
+        """Находится ли заданная координата внутри окна?
+        :param lat: Географиеская ширина координаты.
+        :param lng: Географиеская долгота координаты.
+        """
+        return (
+            self.south_lat < lat < self.north_lat
+            and self.west_lng < lng < self.east_lng
+        )
+
+    def is_none(self) -> bool:
+        """Возвращает значение Истина, если хотя бы одна из координат окна не определена."""
+        return (
+            self.south_lat is None
+            or self.north_lat is None
+            or self.west_lng is None
+            or self.east_lng is None
+        )
+
+    def update(
+        self,
+        south_lat: float = None,
+        north_lat: float = None,
+        west_lng: float = None,
+        east_lng: float = None,
+    ):
+        self.south_lat = south_lat
+        self.north_lat = north_lat
+        self.west_lng = west_lng
+        self.east_lng = east_lng
+
+    def __post_init__(self):
+
+        if not (self.south_lat is None or isinstance(self.south_lat, float)):
+            raise ValueError(
+                f'{self.south_lat}: Нижняя граница карты быть числом с плавающей точкой.'
+            )
+        if not (self.north_lat is None or isinstance(self.north_lat, float)):
+            raise ValueError(
+                f'{self.north_lat}: Верхняя граница карты должна быть числом с плавающей точкой.'
+            )
+        if not (self.west_lng is None or isinstance(self.west_lng, float)):
+            raise ValueError(
+                f'{self.west_lng}: Левая граница карты должна быть числом с плавающей точкой.'
+            )
+        if not (self.east_lng is None or isinstance(self.east_lng, float)):
+            raise ValueError(
+                f'{self.east_lng}: Правая граница карты должна быть числом с плавающей точкой.'
+            )
+        for bound in (
+            self.south_lat,
+            self.north_lat,
+            self.west_lng,
+            self.east_lng,
+        ):
+            if bound is not None and not math.isfinite(bound):
+                raise ValueError(
+                    f'{bound}: Границы карты должны быть конечными числами.'
+                )
+        self._check_range()
+
+    def _check_range(self):
+        """Проверяет, что заданные границы лежат на карте и не перепутаны местами."""
+        for bound in (self.south_lat, self.north_lat):
+            if bound is not None and not -90 <= bound <= 90:
+                raise ValueError(
+                    f'{bound}: Широта границы карты должна быть от -90 до 90.'
+                )
+        for bound in (self.west_lng, self.east_lng):
+            if bound is not None and not -180 <= bound <= 180:
+                raise ValueError(
+                    f'{bound}: Долгота границы карты должна быть от -180 до 180.'
+                )
+        if (
+            self.south_lat is not None
+            and self.north_lat is not None
+            and self.south_lat > self.north_lat
+        ):
+            raise ValueError(
+                f'{self.south_lat}, {self.north_lat}: Нижняя граница карты должна быть не выше верхней.'
+            )
+        if (
+            self.west_lng is not None
+            and self.east_lng is not None
+            and self.west_lng > self.east_lng
+        ):
+            raise ValueError(
+                f'{self.west_lng}, {self.east_lng}: Левая граница карты должна быть не правее правой.'
+            )
+
+
+@dataclass(slots=True)
+class Bounds:
+    """Ответ фронтенда"""
+
+    msgType: str
+    data: WindowBounds
+
+    def __post_init__(self):
+        if not (isinstance(self.msgType, str) and self.msgType == 'newBounds'):
+            raise ValueError(
+                f'{self.msgType}: Тип сообщения должен быть строкой "newBounds".'
+            )
+
+        self.data = WindowBounds(**self.data)
+
+
+@dataclass(slots=True)
+class ProtocolMode:
+    """Протокол обмена сообщениями с фронтендом"""
+
+    mode: str  # full - полный список автобусов, delta - только изменения
+    compress: bool = False  # браузер умеет распаковывать сжатые бинарные кадры
+
+    def __post_init__(self):
+        if self.mode not in PROTOCOL_MODES:
+            raise ValueError(
+                f'{self.mode}: Протокол должен быть одной из строк "full", "delta".'
+            )
+        if not isinstance(self.compress, bool):
+            raise ValueError(
+                f'{self.compress}: Признак сжатия должен быть логическим значением.'
+            )
+
+
+@dataclass(slots=True)
+class Protocol:
+    """Выбор протокола фронтендом"""
+
+    msgType: str
+    data: ProtocolMode
+
+    def __post_init__(self):
+        if not (
+            isinstance(self.msgType, str) and self.msgType == 'setProtocol'
+        ):
+            raise ValueError(
+                f'{self.msgType}: Тип сообщения должен быть строкой "setProtocol".'
+            )
+
+        self.data = ProtocolMode(**self.data)
+
+
+@dataclass(slots=True)
+class RouteFilter:
+    """Маршруты, автобусы которых показываются на карте фронтенда"""
+
+    routes: list[str]  # номера маршрутов, пустой список - все маршруты
+
+    def __post_init__(self):
+        if not (
+            isinstance(self.routes, list)
+            and all(isinstance(route, str) for route in self.routes)
+        ):
+            raise ValueError(
+                f'{self.routes}: Маршруты должны быть заданы списком строк.'
+            )
+
+    def key(self) -> tuple[str, ...] | None:
+        """Маршруты без повторов в одном порядке, None - фильтра нет."""
+        return tuple(sorted(set(self.routes))) or None
+
+
+@dataclass(slots=True)
+class Filters:
+    """Выбор маршрутов фронтендом"""
+
+    msgType: str
+    data: RouteFilter
+
+    def __post_init__(self):
+        if not (
+            isinstance(self.msgType, str) and self.msgType == 'newFilters'
+        ):
+            raise ValueError(
+                f'{self.msgType}: Тип сообщения должен быть строкой "newFilters".'
+            )
+
+        self.data = RouteFilter(**self.data)
+
+
+@dataclass(slots=True)
+class TrackQuery:
+    """Автобус и промежуток времени, за который нужен его путь"""
+
+    busId: str  # номер автобуса
+    since: float | None = None  # начало промежутка, Unix-время в секундах, None - с самой старой точки
+    until: float | None = None  # конец промежутка, None - до последней точки
+
+    def __post_init__(self):
+        if not isinstance(self.busId, str):
+            raise ValueError(
+                f'{self.busId}: Номер автобуса должен быть задан строкой.'
+            )
+        for moment in (self.since, self.until):
+            if not (moment is None or isinstance(moment, (int, float))):
+                raise ValueError(
+                    f'{moment}: Границы промежутка должны быть числами.'
+                )
+
+
+@dataclass(slots=True)
+class GetTrack:
+    """Запрос пути автобуса фронтендом"""
+
+    msgType: str
+    data: TrackQuery
+
+    def __post_init__(self):
+        if not (isinstance(self.msgType, str) and self.msgType == 'getTrack'):
+            raise ValueError(
+                f'{self.msgType}: Тип сообщения должен быть строкой "getTrack".'
+            )
+
+        self.data = TrackQuery(**self.data)
+
+
+BROWSER_MESSAGES = {
+    'newBounds': Bounds,
+    'setProtocol': Protocol,
+    'newFilters': Filters,
+    'getTrack': GetTrack,
+}
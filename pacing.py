@@ -0,0 +1,58 @@
+"""Темп отправки сообщений медленным браузерам"""
+
+MAX_SEND_INTERVAL = 5  # Реже, чем раз в столько секунд, браузер сообщения не получает.
+LAG_LIMIT = 30  # Сколько секунд браузер может не успевать за отправкой, прежде чем его отключат.
+
+
+class SendPacer:
+    """
+    Темп отправки для одного браузера.
+    Пока браузер успевает забирать сообщения, они отправляются каждый тик. Если отправка длится дольше
+    интервала между отправками, интервал удваивается (до max_interval), а когда браузер снова успевает -
+    уменьшается вдвое до refresh_timeout. Пропущенные тики не копятся: после паузы отправляется последнее
+    состояние. Браузер, который не успевает дольше lag_limit секунд подряд, отключается.
+    """
+
+    def __init__(
+        self,
+        refresh_timeout: float,
+        max_interval: float = MAX_SEND_INTERVAL,
+        lag_limit: float = LAG_LIMIT,
+    ):
+        """
+        :param refresh_timeout: Интервал между тиками хаба, чаще браузер сообщения не получает.
+        :param max_interval: Наибольший интервал между отправками.
+        :param lag_limit: Сколько секунд подряд браузер может не успевать.
+        """
+        self.refresh_timeout = refresh_timeout
+        self.max_interval = max(max_interval, refresh_timeout)
+        self.lag_limit = lag_limit
+        self.interval = refresh_timeout
+        self.lagging_since = None  # время начала отправки, с которой браузер перестал успевать
+
+    def record(self, started: float, finished: float):
+        """
+        Учитывает длительность очередной отправки.
+        :param started: Время начала отправки.
+        :param finished: Время окончания отправки.
+        """
+        if finished - started > self.interval:
+            self.interval = min(
+                max(self.interval * 2, finished - started), self.max_interval
+            )
+            if self.lagging_since is None:
+                self.lagging_since = started
+        else:
+            self.interval = max(self.interval / 2, self.refresh_timeout)
+            self.lagging_since = None
+
+    def next_send(self, started: float) -> float:
+        """Время, раньше которого не стоит отправлять следующее сообщение."""
+        return started + self.interval
+
+    def is_behind(self, now: float) -> bool:
+        """Истина, если браузер не успевает за отправкой дольше lag_limit секунд."""
+        return (
+            self.lagging_since is not None
+            and now - self.lagging_since > self.lag_limit
+        )
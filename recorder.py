@@ -0,0 +1,181 @@
+"""
+Журнал входящих координат автобусов для воспроизведения нагрузки.
+Журнал - папка с сегментами, в сегмент только дописываются записи. Запись - одно сообщение имитатора
+после валидации: время получения и бинарный кадр (wire.py). Все числа - little-endian.
+
+    сегмент: метка формата (8 байт), затем записи
+    запись:  время получения в секундах (f64), длина кадра (u32), кадр
+
+У каждого сегмента свой словарь автобусов кадров, поэтому сегмент читается независимо от остальных,
+а кадры сегмента можно отправлять серверу как есть, по одному web-сокету.
+"""
+
+import logging
+import os
+import struct
+import time
+from collections.abc import Iterator
+
+import trio
+
+from models import Bus, BusColumns
+from wire import MAX_DEFINITIONS, WireDecoder, WireEncoder
+
+SEGMENT_MAGIC = b'BUSLOG1\n'
+RECORD = struct.Struct('<dI')
+SEGMENT_SIZE = 64 * 1024 * 1024  # После скольких байт журнал переходит на новый сегмент.
+FLUSH_INTERVAL = 1  # Раз во сколько секунд накопленные записи сбрасываются на диск.
+SEGMENT_NAME = 'ingest-%06d.log'
+
+logger = logging.getLogger('server.recorder')
+
+
+def list_segments(directory: str) -> list[str]:
+    """Пути сегментов журнала по порядку записи."""
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.startswith('ingest-') and name.endswith('.log')
+    ]
+
+
+class TrafficRecorder:
+    """
+    Запись журнала входящих координат.
+    record кодирует автобусы в кадр и складывает его в буфер, не обращаясь к диску, а run раз в flush_interval
+    секунд отдает накопленное потоку, который дописывает сегменты. Так медленный диск не задерживает прием
+    координат. Номер сегмента продолжается после уже лежащих в папке, старые сегменты не перезаписываются.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = SEGMENT_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        clock=time.time,
+    ):
+        """
+        :param directory: Папка журнала, создается при необходимости.
+        :param segment_size: После скольких байт начинать новый сегмент.
+        :param flush_interval: Раз во сколько секунд сбрасывать записи на диск.
+        :param clock: Функция времени получения координат в секундах.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._segment = len(list_segments(directory))
+        self._segment_bytes = 0
+        self._encoder = None
+        self._pending = []  # куски байт для записи, None - начать новый сегмент
+        self._file = None
+        self._lock = trio.Lock()
+
+    def record(self, buses: list[Bus]):
+        """
+        Добавляет в журнал пачку валидированных автобусов. Запись на диск происходит позже, в run.
+        Автобусы, которые не помещаются в бинарный кадр (слишком длинные номера), в журнал не попадают.
+        """
+        self._record([(bus.busId, bus.route, bus.lat, bus.lng) for bus in buses])
+
+    def record_columns(self, columns: BusColumns):
+        """
+        То же, что record, для автобусов столбцами от процессов приема (ingest.py). Пачка из буфера процесса
+        приема записывается кадрами не больше MAX_DEFINITIONS автобусов.
+        """
+        records = list(
+            zip(columns.bus_ids, columns.routes, columns.lat, columns.lng)
+        )
+        for start in range(0, len(records), MAX_DEFINITIONS):
+            self._record(records[start:start + MAX_DEFINITIONS])
+
+    def _record(self, records: list[tuple[str, str, float, float]]):
+        if self._encoder is None or self._segment_bytes >= self.segment_size:
+            self._encoder = WireEncoder()
+            self._segment_bytes = len(SEGMENT_MAGIC)
+            self._pending.append(None)
+        try:
+            frame = self._encoder.encode(records)
+        except ValueError as e:
+            logger.warning('Координаты не записаны в журнал: %s' % (e,))
+            return
+        record = RECORD.pack(self.clock(), len(frame)) + frame
+        self._pending.append(record)
+        self._segment_bytes += len(record)
+
+    def _write(self, pieces: list):
+        for piece in pieces:
+            if piece is not None:
+                self._file.write(piece)
+                continue
+            if self._file is not None:
+                self._file.close()
+            path = os.path.join(self.directory, SEGMENT_NAME % self._segment)
+            self._segment += 1
+            self._file = open(path, 'wb')
+            self._file.write(SEGMENT_MAGIC)
+            logger.info('Журнал координат пишется в %s' % (path,))
+        if self._file is not None:
+            self._file.flush()
+
+    async def flush(self):
+        """
+        Дописывает накопленные записи в сегменты в отдельном потоке. Отмена не прерывает запись,
+        иначе забранные из буфера записи пропали бы.
+        """
+        async with self._lock:
+            pieces, self._pending = self._pending, []
+            if pieces:
+                with trio.CancelScope(shield=True):
+                    await trio.to_thread.run_sync(self._write, pieces)
+
+    def close(self):
+        """Дописывает оставшиеся записи и закрывает сегмент."""
+        self._write(self._pending)
+        self._pending = []
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def run(self):
+        """Раз в flush_interval секунд сбрасывает записи на диск, при остановке - дописывает остаток."""
+        try:
+            while True:
+                await trio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            self.close()
+
+
+def read_frames(directory: str) -> Iterator[tuple[float, bytes, bool]]:
+    """
+    Записи журнала по порядку: кортежи из времени получения, кадра и признака первого кадра сегмента.
+    Недописанная последняя запись сегмента (сервер остановлен во время записи) пропускается.
+    """
+    for path in list_segments(directory):
+        with open(path, 'rb') as segment:
+            if segment.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                raise ValueError(f'{path}: Файл не является сегментом журнала.')
+            is_first = True
+            while header := segment.read(RECORD.size):
+                if len(header) < RECORD.size:
+                    break
+                timestamp, length = RECORD.unpack(header)
+                frame = segment.read(length)
+                if len(frame) < length:
+                    break
+                yield timestamp, frame, is_first
+                is_first = False
+
+
+def read_buses(directory: str) -> Iterator[tuple[float, list[Bus]]]:
+    """Записи журнала по порядку: кортежи из времени получения и автобусов."""
+    decoder = None
+    for timestamp, frame, is_first in read_frames(directory):
+        if is_first:
+            decoder = WireDecoder()
+        is_valid, buses = decoder.decode(frame)
+        if not is_valid:
+            raise ValueError(f'{buses.reason}: Запись журнала повреждена.')
+        yield timestamp, buses
@@ -0,0 +1,93 @@
+"""Скрипт воспроизведения журнала координат автобусов (recorder.py) на порт имитатора сервера"""
+
+import logging
+import warnings
+from contextlib import suppress
+
+import asyncclick as click
+import trio
+from trio import TrioDeprecationWarning
+from trio_websocket import open_websocket_url
+
+from recorder import read_frames
+
+warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%m/%d/%Y %H:%M:%S',
+)
+logger = logging.getLogger('replay')
+
+
+async def replay_frames(send_message, frames, speed: float) -> int:
+    """
+    Отправляет кадры журнала с теми же промежутками, что и при записи, сжатыми в speed раз.
+    Если отправка не успевает за журналом, следующие кадры уходят сразу, без накопления задержки.
+    :param send_message: Корутина отправки кадра.
+    :param frames: Записи журнала из read_frames.
+    :param speed: Во сколько раз быстрее записи воспроизводить, 0 - как можно быстрее.
+    :return: количество отправленных кадров.
+    """
+    started, first = trio.current_time(), None
+    sent = 0
+    for timestamp, frame, _ in frames:
+        if first is None:
+            first = timestamp
+        if speed:
+            await trio.sleep_until(started + (timestamp - first) / speed)
+        await send_message(frame)
+        sent += 1
+    return sent
+
+
+def get_log_level(ctx, param, value) -> int:
+    """Преобразует количество указанных v (verbose) в параметрах скрипта к уровню логирования"""
+    levels = [
+        logging.ERROR,
+        logging.WARNING,
+        logging.INFO,
+        logging.DEBUG,
+    ]
+    return levels[min(value, len(levels) - 1)]
+
+
+@click.command()
+@click.argument('log_dir', type=click.Path(exists=True, file_okay=False))
+@click.option(
+    '--server',
+    default='ws://127.0.0.1:8080/ws',
+    show_default=True,
+    help='Адрес сервера.',
+)
+@click.option(
+    '--speed',
+    type=float,
+    default=1,
+    show_default=True,
+    help='Во сколько раз быстрее записи воспроизводить журнал, 0 - как можно быстрее.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    callback=get_log_level,
+    help='Настройка логирования.',
+)
+async def main(log_dir, server, speed, verbose):
+
+    logger.setLevel(verbose)
+
+    async with open_websocket_url(server) as ws:
+        started = trio.current_time()
+        sent = await replay_frames(
+            ws.send_message, read_frames(log_dir), speed
+        )
+    logger.info(
+        'Отправлено %d кадров за %.1f сек'
+        % (sent, trio.current_time() - started)
+    )
+
+
+if __name__ == '__main__':
+    with suppress(KeyboardInterrupt):
+        trio.run(main(_anyio_backend='trio'))
@@ -0,0 +1,238 @@
+"""Скомпилированное хранилище маршрутов: один бинарный файл, который отображается в память"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+ROUTES_DIR = 'routes'  # папка с json-файлами маршрутов - источник истины
+STORE_SUFFIX = '.store'  # хранилище лежит рядом с папкой: routes -> routes.store
+STORE_MAGIC = b'BUSROUTE'
+STORE_VERSION = 2
+# сигнатура, версия, отпечаток папки, количество маршрутов, точек, остановок, длина метаданных и ширина
+# JSON-текста точки
+HEADER = struct.Struct('<8sI20sQQQQQ')
+
+logger = logging.getLogger('route-store')
+
+
+def point_json(lat: float, lng: float) -> str:
+    """Окончание JSON сообщения автобуса с координатами точки маршрута."""
+    return '"lat": %r, "lng": %r}' % (lat, lng)
+
+
+def point_texts(points) -> np.ndarray:
+    """JSON-окончания точек маршрута (point_json) массивом байтовых строк одной ширины."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    texts = [
+        point_json(lat, lng).encode('utf8') for lat, lng in points.tolist()
+    ]
+    return np.array(texts, dtype='S%d' % (max(map(len, texts), default=1),))
+
+
+def route_filenames(directory_path=ROUTES_DIR) -> list:
+    """Имена json-файлов с маршрутами в постоянном (отсортированном) порядке."""
+    return sorted(
+        filename
+        for filename in os.listdir(directory_path)
+        if filename.endswith('.json')
+    )
+
+
+def fingerprint(directory_path=ROUTES_DIR) -> bytes:
+    """Отпечаток папки с маршрутами: имена, размеры и время изменения файлов. Файлы при этом не читаются."""
+    digest = hashlib.sha1(b'%d' % (STORE_VERSION,))
+    for filename in route_filenames(directory_path):
+        stat = os.stat(os.path.join(directory_path, filename))
+        digest.update(
+            b'%s\0%d\0%d\0'
+            % (filename.encode('utf8'), stat.st_size, stat.st_mtime_ns)
+        )
+    return digest.digest()
+
+
+def compile_routes(directory_path=ROUTES_DIR, store_path=None) -> str:
+    """
+    Собирает json-файлы маршрутов в бинарное хранилище.
+    После заголовка подряд идут: координаты точек всех маршрутов (float64, [lat, lng]), смещения маршрутов
+    в массиве точек (int64), координаты остановок, смещения остановок маршрутов, JSON-окончания точек
+    (point_texts) и метаданные в JSON: номера маршрутов, названия конечных и названия остановок. Файл
+    записывается во временный и затем атомарно подменяет старый, так что читатели никогда не видят его
+    недописанным.
+    :param directory_path: Папка с json-файлами маршрутов.
+    :param store_path: Путь к хранилищу, по умолчанию рядом с папкой маршрутов.
+    :return: путь к хранилищу.
+    """
+    store_path = store_path or directory_path.rstrip('/') + STORE_SUFFIX
+    directory_fingerprint = fingerprint(directory_path)
+
+    points, route_offsets = [], [0]
+    stations, station_offsets = [], [0]
+    metadata = {'names': [], 'start_names': [], 'stop_names': [], 'stations': []}
+    for filename in route_filenames(directory_path):
+        with open(
+            os.path.join(directory_path, filename), encoding='utf8'
+        ) as f:
+            route = json.load(f)
+        points.extend(route['coordinates'])
+        route_offsets.append(len(points))
+        stations.extend(
+            (float(lat), float(lng)) for (lat, lng), _ in route['stations']
+        )
+        station_offsets.append(len(stations))
+        metadata['names'].append(route['name'])
+        metadata['start_names'].append(route['station_start_name'])
+        metadata['stop_names'].append(route['station_stop_name'])
+        metadata['stations'].append([name for _, name in route['stations']])
+
+    encoded_metadata = json.dumps(metadata, ensure_ascii=False).encode('utf8')
+    texts = point_texts(points)
+    sections = [
+        np.array(points, dtype='<f8').reshape(-1, 2),
+        np.array(route_offsets, dtype='<i8'),
+        np.array(stations, dtype='<f8').reshape(-1, 2),
+        np.array(station_offsets, dtype='<i8'),
+        texts,
+    ]
+
+    directory = os.path.dirname(os.path.abspath(store_path))
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix='.routes-', delete=False
+    ) as f:
+        f.write(
+            HEADER.pack(
+                STORE_MAGIC,
+                STORE_VERSION,
+                directory_fingerprint,
+                len(metadata['names']),
+                len(points),
+                len(stations),
+                len(encoded_metadata),
+                texts.itemsize,
+            )
+        )
+        for section in sections:
+            f.write(section.tobytes())
+        f.write(encoded_metadata)
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, store_path)
+
+    logger.info(
+        'Собрано хранилище %s: %d маршрутов, %d точек'
+        % (store_path, len(metadata['names']), len(points))
+    )
+    return store_path
+
+
+class RouteStore:
+    """
+    Маршруты, отображенные в память из бинарного хранилища.
+    Массивы координат и JSON-окончаний точек - представления NumPy поверх mmap без копирования, поэтому
+    процессы, открывшие одно хранилище, делят одни и те же страницы памяти только для чтения.
+    """
+
+    def __init__(self, store_path: str):
+        """:param store_path: Путь к хранилищу, собранному compile_routes."""
+        with open(store_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.fingerprint,
+            routes_number,
+            points_number,
+            stations_number,
+            metadata_length,
+            text_width,
+        ) = HEADER.unpack_from(self._mmap)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(
+                f'{store_path}: Файл не является хранилищем маршрутов версии {STORE_VERSION}.'
+            )
+
+        offset = HEADER.size
+        self.points, offset = self._section('<f8', points_number * 2, offset)
+        self.points = self.points.reshape(-1, 2)
+        self.route_offsets, offset = self._section(
+            '<i8', routes_number + 1, offset
+        )
+        self.stations, offset = self._section(
+            '<f8', stations_number * 2, offset
+        )
+        self.stations = self.stations.reshape(-1, 2)
+        self.station_offsets, offset = self._section(
+            '<i8', routes_number + 1, offset
+        )
+        self.point_texts, offset = self._section(
+            'S%d' % (text_width,), points_number, offset
+        )
+        metadata = json.loads(
+            self._mmap[offset:offset + metadata_length].decode('utf8')
+        )
+        self.names = metadata['names']
+        self.start_names = metadata['start_names']
+        self.stop_names = metadata['stop_names']
+        self.station_names = metadata['stations']
+
+    def _section(self, dtype: str, count: int, offset: int):
+        array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset)
+        return array, offset + array.nbytes
+
+    @classmethod
+    def load(cls, directory_path=ROUTES_DIR, store_path=None) -> 'RouteStore':
+        """
+        Открывает хранилище маршрутов, пересобирая его, если json-файлы в папке изменились.
+        :param directory_path: Папка с json-файлами маршрутов - источник истины.
+        :param store_path: Путь к хранилищу, по умолчанию рядом с папкой маршрутов.
+        """
+        store_path = store_path or directory_path.rstrip('/') + STORE_SUFFIX
+        try:
+            store = cls(store_path)
+            if store.fingerprint == fingerprint(directory_path):
+                return store
+        except (OSError, ValueError, struct.error):
+            pass
+        return cls(compile_routes(directory_path, store_path))
+
+    def __len__(self):
+        return len(self.names)
+
+    def coordinates(self, route_index: int) -> np.ndarray:
+        """Точки маршрута: массив строк [lat, lng] без копирования."""
+        return self.points[
+            self.route_offsets[route_index]:self.route_offsets[route_index + 1]
+        ]
+
+    def coordinate_texts(self, route_index: int) -> np.ndarray:
+        """JSON-окончания точек маршрута (point_json) без копирования."""
+        return self.point_texts[
+            self.route_offsets[route_index]:self.route_offsets[route_index + 1]
+        ]
+
+    def route(self, route_index: int) -> dict:
+        """
+        Маршрут в формате json-файлов папки с маршрутами, координаты - массивы без копирования.
+        Дополнительно в coordinate_texts лежат готовые JSON-окончания точек для имитатора.
+        """
+        stations = self.stations[
+            self.station_offsets[route_index]:self.station_offsets[route_index + 1]
+        ]
+        return {
+            'name': self.names[route_index],
+            'station_start_name': self.start_names[route_index],
+            'station_stop_name': self.stop_names[route_index],
+            'coordinates': self.coordinates(route_index),
+            'coordinate_texts': self.coordinate_texts(route_index),
+            'stations': [
+                [coordinates, name]
+                for coordinates, name in zip(
+                    stations.tolist(), self.station_names[route_index]
+                )
+            ],
+        }
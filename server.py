@@ -1,212 +1,313 @@
 # Скрипт сервера для обмена сообщенями с браузером и с модулем получения координат автобусов
 
-import json
 import logging
+import math
 import time
 import warnings
 from contextlib import suppress
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 
 import trio
-import trio.testing
 import asyncclick as click
 from trio import TrioDeprecationWarning
 from trio_websocket import serve_websocket, ConnectionClosed
 
+from clusters import CLUSTER_SPAN, CLUSTER_THRESHOLD
+from compression import (
+    COMPRESSION_LEVEL,
+    COMPRESSION_THRESHOLD,
+    MessageCompressor,
+)
+from delta import DeltaEncoder
+from hub import BUS_TTL, BusesHub
+from ingest import run_ingest_workers
+from interpolation import RouteGeometry, RouteInterpolator
+from metrics import SIZE_BUCKETS, Counter, Gauge, Histogram, serve_metrics
+from models import (  # noqa: F401 - модели доступны и через server, как раньше
+    BROWSER_MESSAGES,
+    BUS_MESSAGES,
+    Bounds,
+    Bus,
+    BusesBatch,
+    Filters,
+    GetTrack,
+    WindowBounds,
+)
+from pacing import SendPacer
+from recorder import TrafficRecorder
+from route_store import ROUTES_DIR, RouteStore
+from tracks import TRACK_INTERVAL, TrackStore
 from validators import is_instance_valid
+from wire import WireDecoder, decode_bus_message
 
 REFRESH_TIMEOUT = 0.2  # Задержка в обновлении координат сервера.
+CLOSE_TIMEOUT = 1  # Сколько секунд ждать закрытия web-сокета отключаемого браузера.
 
 warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
 send_channel, receive_channel = trio.open_memory_channel(0)
-buses = dict()
+hub = BusesHub()
+compressor = MessageCompressor()
+recorder = None  # журнал входящих координат, если сервер запущен с --record_dir
 logging.basicConfig(
     format='%(asctime)s - %(levelname)s: %(name)s: %(message)s',
     datefmt='%m/%d/%Y %H:%M:%S',
 )
 logger = logging.getLogger('server')
 
+bus_messages = Counter('bus_messages_total', 'Сообщения от имитатора автобусов.')
+bus_updates = Counter('bus_updates_total', 'Координаты автобусов от имитатора.')
+validation_errors = Counter(
+    'validation_errors_total',
+    'Сообщения, не прошедшие валидацию, по источнику и причине.',
+    ('source', 'reason'),
+)
+ingest_waiting = Gauge(
+    'ingest_waiting_senders',
+    'Хэндлеры имитатора, ожидающие места в канале приема координат.',
+)
+ingest_waiting.set_function(
+    lambda: send_channel.statistics().tasks_waiting_send
+)
+pending_updates = Gauge(
+    'hub_pending_updates', 'Автобусы с новыми координатами до следующего тика.'
+)
+pending_updates.set_function(lambda: hub.pending)
+buses_count = Gauge('hub_buses', 'Автобусы на карте.')
+buses_count.set_function(lambda: len(hub.buses))
+cached_viewports = Gauge(
+    'hub_cached_viewports', 'Окна карты в кэше сообщений хаба.'
+)
+cached_viewports.set_function(lambda: hub.cached_payloads)
+browsers_connected = Gauge('browsers_connected', 'Подключенные браузеры.')
+browsers_dropped = Counter(
+    'browsers_dropped_total', 'Браузеры, отключенные из-за отставания.'
+)
+serialize_seconds = Histogram(
+    'browser_serialize_seconds',
+    'Время подготовки сообщения браузеру в секундах.',
+)
+message_size = Histogram(
+    'browser_message_size_chars',
+    'Длина сообщений браузеру в символах.',
+    buckets=SIZE_BUCKETS,
+)
+compressed_size = Histogram(
+    'browser_compressed_size_bytes',
+    'Размер сжатых сообщений браузеру в байтах.',
+    buckets=SIZE_BUCKETS,
+)
+send_seconds = Histogram(
+    'browser_send_seconds', 'Время отправки сообщения браузеру в секундах.'
+)
 
-@dataclass
-class Bus:
-    """Автобус на карте"""
-
-    busId: str  # номер автобуса
-    lat: float  # географическая ширина местоположения автобуса
-    lng: float  # географическая долгота местоположения автобуса
-    route: str  # номер маршрута
-
-    def __post_init__(self):
-        if not isinstance(self.busId, str):
-            raise ValueError(
-                f'{self.busId}: Номер автобуса должен быть задан строкой.'
-            )
-        if not isinstance(self.lat, float):
-            raise ValueError(
-                f'{self.lat}: Географическая широта местоположения автобуса должна быть числом с плавающей точкой.'
-            )
-        if not isinstance(self.lng, float):
-            raise ValueError(
-                f'{self.lng}: Географическая долгота местоположения автобуса должна быть числом с плавающей точкой.'
-            )
-        if not isinstance(self.route, str):
-            raise ValueError(
-                f'{self.route}: Номер маршрута должен быть задан строкой.'
-            )
-
-
-@dataclass
-class WindowBounds:
-    """Координаты окна карты фронтенда"""
-
-    south_lat: float | None = None
-    north_lat: float | None = None
-    west_lng: float | None = None
-    east_lng: float | None = None
-
-    def is_inside(self, lat: float, lng: float) -> bool:
-        """Находится ли заданная координата внутри окна?
-        :param lat: Географиеская ширина координаты.
-        :param lng: Географиеская долгота координаты.
-        """
-        return (
-            self.south_lat < lat < self.north_lat
-            and self.west_lng < lng < self.east_lng
-        )
-
-    def is_none(self) -> bool:
-        """Возвращает значение Истина, если хотя бы одна из координат окна не определена."""
-        return (
-            self.south_lat is None
-            or self.north_lat is None
-            or self.west_lng is None
-            or self.east_lng is None
-        )
-
-    def update(
-        self,
-        south_lat: float = None,
-        north_lat: float = None,
-        west_lng: float = None,
-        east_lng: float = None,
-    ):
-        self.south_lat = south_lat
-        self.north_lat = north_lat
-        self.west_lng = west_lng
-        self.east_lng = east_lng
-
-    def __post_init__(self):
-
-        if not (self.south_lat is None or isinstance(self.south_lat, float)):
-            raise ValueError(
-                f'{self.south_lat}: Нижняя граница карты быть числом с плавающей точкой.'
-            )
-        if not (self.north_lat is None or isinstance(self.north_lat, float)):
-            raise ValueError(
-                f'{self.north_lat}: Верхняя граница карты должна быть числом с плавающей точкой.'
-            )
-        if not (self.west_lng is None or isinstance(self.west_lng, float)):
-            raise ValueError(
-                f'{self.west_lng}: Левая граница карты должна быть числом с плавающей точкой.'
-            )
-        if not (self.east_lng is None or isinstance(self.east_lng, float)):
-            raise ValueError(
-                f'{self.east_lng}: Правая граница карты должна быть числом с плавающей точкой.'
-            )
-
-
-@dataclass
-class Bounds:
-    """Ответ фронтенда"""
 
-    msgType: str
-    data: WindowBounds
+@dataclass(slots=True)
+class BrowserSession:
+    """Настройки обмена сообщениями с одним браузером"""
 
-    def __post_init__(self):
-        if not (isinstance(self.msgType, str) and self.msgType == 'newBounds'):
-            raise ValueError(
-                f'{self.msgType}: Тип сообщения должен быть строкой "newBounds".'
-            )
+    bounds: WindowBounds
+    pacer: SendPacer
+    delta: DeltaEncoder | None = None  # кодировщик изменений, если браузер выбрал протокол delta
+    routes: tuple[str, ...] | None = None  # маршруты, выбранные браузером, None - все маршруты
+    compress: bool = False  # браузер принимает сжатые бинарные кадры
 
-        self.data = WindowBounds(**self.data)
+    def set_protocol(self, mode: str, compress: bool = False):
+        self.delta = DeltaEncoder() if mode == 'delta' else None
+        self.compress = compress
 
 
 async def talk_to_browser(request):
     """Хэндлер обмена сообщениями с браузером."""
     ws = await request.accept()
 
-    bounds = WindowBounds()
+    session = BrowserSession(
+        bounds=WindowBounds(), pacer=SendPacer(REFRESH_TIMEOUT)
+    )
 
-    async with trio.open_nursery() as nursery:
-        nursery.start_soon(listen_browser, ws, bounds)
-        nursery.start_soon(send_buses, ws, bounds)
+    browsers_connected.inc()
+    try:
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(listen_browser, ws, session)
+            nursery.start_soon(send_buses, ws, session)
+    except Exception:
+        # ошибка обмена с одним браузером не должна останавливать сервер
+        logger.exception('Обмен с браузером прерван ошибкой')
+        await abort_browser(ws)
+    finally:
+        browsers_connected.dec()
 
 
-async def listen_browser(ws, bounds: WindowBounds):
+async def listen_browser(ws, session: BrowserSession):
     """
-    Получает сообщение от браузера с координатами окна.
-    :param bounds: Ссылка на экземпляр класса координат окна, используется для сохранения новых координат и передачи в
-    вызывающую функцию.
+    Получает сообщения от браузера с координатами окна, выбором протокола и маршрутов.
+    На запрос пути автобуса сразу отвечает сообщением Track.
+    :param session: Ссылка на настройки обмена с браузером, используется для сохранения новых координат окна,
+    протокола и маршрутов и передачи в вызывающую функцию.
     :param ws: Ссылка на экземпляр web сокета обмена сообщениями с браузером
     """
     with suppress(ConnectionClosed):
         while message := await ws.get_message():
-            is_valid, message = is_instance_valid(message, Bounds)
-            logger.debug('%s', (message,))
-            if is_valid:
-                bounds.update(**json.loads(message)['data'])
+            is_valid, browser_message = is_instance_valid(
+                message, BROWSER_MESSAGES
+            )
+            logger.debug('%s', (browser_message,))
+            if not is_valid:
+                validation_errors.labels(
+                    'browser', browser_message.reason
+                ).inc()
+                continue
+
+            if isinstance(browser_message, Bounds):
+                session.bounds = browser_message.data
+            elif isinstance(browser_message, Filters):
+                session.routes = browser_message.data.key()
+            elif isinstance(browser_message, GetTrack):
+                await ws.send_message(track_message(browser_message.data))
+            else:
+                session.set_protocol(
+                    browser_message.data.mode, browser_message.data.compress
+                )
+
+
+def track_message(query) -> str:
+    """Сообщение Track на запрос пути автобуса, время - Unix-время в секундах."""
+    return hub.track(
+        query.busId,
+        -math.inf if query.since is None else query.since,
+        math.inf if query.until is None else query.until,
+        offset=time.time() - hub.clock(),
+    )
 
 
-async def send_buses(ws, bounds: WindowBounds):
+def prepare_frame(
+    session: BrowserSession, bounds: WindowBounds, routes
+) -> tuple[str | None, str | bytes | None]:
     """
-    Получает сообщение от браузера с координатами окна.
-    :param bounds: Ссылка на экземпляр класса координат окна. Используется для вычисления автобусов, которые должны
-    быть отражены в этом окне (чтобы не перегружать браузер сообщениями).
+    Сообщение браузеру о текущей версии хаба и кадр для отправки.
+    Для широкого окна - скопления автобусов, после них браузер с протоколом delta получает ключевой кадр.
+    Браузеру, который принимает сжатые кадры, длинные сообщения отправляются сжатыми, общие для нескольких
+    браузеров сообщения сжимаются один раз за версию хаба.
+    :return: кортеж из сообщения и кадра: сжатого сообщения или самого сообщения. None, если отправлять нечего.
+    """
+    buses_msg = hub.clusters(bounds, routes)
+    is_shared = True
+    if buses_msg is not None:
+        if session.delta is not None:
+            session.delta.reset()
+    elif session.delta is None:
+        buses_msg = hub.payload(bounds, routes)
+    else:
+        buses_msg = session.delta.encode(hub.visible(bounds, routes))
+        is_shared = False
+    if buses_msg is None or not session.compress:
+        return buses_msg, buses_msg
+    return buses_msg, compressor.compress(buses_msg, hub.version, is_shared)
+
+
+async def send_buses(ws, session: BrowserSession):
+    """
+    Отправляет в браузер автобусы из окна карты при каждом оповещении хаба об изменениях.
+    Медленному браузеру сообщения отправляются реже, и он получает только последнее состояние.
+    Браузер, который слишком долго не успевает забирать сообщения, отключается. Сообщения собирает prepare_frame.
+    :param session: Ссылка на настройки обмена с браузером. Координаты окна и маршруты используются для вычисления
+    автобусов, которые должны быть отражены в этом окне (чтобы не перегружать браузер сообщениями).
     :param ws: Ссылка на экземпляр web сокета обмена сообщениями с браузером.
     """
-    start = time.monotonic()
-
-    async for bus in receive_channel:
-        if bounds.is_none():
-            continue
-
-        if not bounds.is_inside(lat=bus.lat, lng=bus.lng):
-            buses.pop(bus.busId, None)
-            continue
-
-        buses[bus.busId] = bus
-        logger.debug('sent bus on the map %s' % (bus,))
-
-        buses_msg = json.dumps(
-            {
-                'msgType': 'Buses',
-                'buses': [asdict(bus) for bus in buses.values()],
-            },
-            ensure_ascii=False,
-        )
-        try:
-            if time.monotonic() - start >= REFRESH_TIMEOUT:
-                await ws.send_message(buses_msg)
-                start = time.monotonic()
-        except ConnectionClosed:
-            break
+    pacer = session.pacer
+    with hub.subscribe() as versions:
+        async for _ in versions:
+            bounds, routes = session.bounds, session.routes
+            if bounds.is_none():
+                continue
+
+            serialize_started = time.perf_counter()
+            buses_msg, frame = prepare_frame(session, bounds, routes)
+            serialize_seconds.observe(time.perf_counter() - serialize_started)
+            if buses_msg is None:
+                continue
+            message_size.observe(len(buses_msg))
+            if frame is not buses_msg:
+                compressed_size.observe(len(frame))
+
+            started = trio.current_time()
+            try:
+                with trio.move_on_after(pacer.lag_limit) as send_scope:
+                    await ws.send_message(frame)
+            except ConnectionClosed:
+                break
+            if send_scope.cancelled_caught:
+                logger.info(
+                    'Браузер не принял сообщение за %s сек, отключаем'
+                    % (pacer.lag_limit,)
+                )
+                browsers_dropped.inc()
+                await abort_browser(ws)
+                break
+            finished = trio.current_time()
+            send_seconds.observe(finished - started)
+            pacer.record(started, finished)
+
+            if pacer.is_behind(finished):
+                logger.info('Браузер не успевает получать сообщения, отключаем')
+                browsers_dropped.inc()
+                with trio.move_on_after(CLOSE_TIMEOUT):
+                    await ws.aclose()
+                break
+            if pacer.interval > pacer.refresh_timeout:
+                await trio.sleep_until(pacer.next_send(started))
+
+
+async def abort_browser(ws):
+    """
+    Закрывает соединение с браузером, не отправляя в сокет ни байта: после прерванной отправки в нем
+    недописанный кадр, и кадр закрытия браузер уже не разобрал бы. aclose в отмененной области
+    не отправляет кадр закрытия, но закрывает TCP-соединение.
+    """
+    with trio.CancelScope() as scope:
+        scope.cancel()
+        await ws.aclose()
 
 
 async def get_message(request):
     """
-    Хэндлер получения сообщений с координатами автобусов.
-    В очередь для обработки помещаются только валидированные сообщения.
+    Хэндлер получения сообщений с координатами автобусов: одного автобуса, пачки BusesBatch
+    или бинарного кадра (wire.py). Словарь автобусов бинарных кадров у каждого соединения свой.
+    В очередь для обработки помещаются только валидированные сообщения, пачкой автобусов за раз.
+    Если ведется журнал координат, пачка дописывается и в него.
     """
     ws = await request.accept()
+    decoder = WireDecoder()
 
     with suppress(ConnectionClosed):
         while message := await ws.get_message():
 
-            is_valid, message = is_instance_valid(message, Bus)
-            if is_valid:
-                await send_channel.send(Bus(**json.loads(message)))
-            else:
-                ws.send_message(message)
+            bus_messages.inc()
+            is_valid, buses = decode_bus_message(message, decoder)
+            if not is_valid:
+                validation_errors.labels('bus', buses.reason).inc()
+                await ws.send_message(buses)
+                continue
+
+            bus_updates.inc(len(buses))
+            if recorder is not None:
+                recorder.record(buses)
+            await send_channel.send(buses)
+
+
+def observe_ingest(columns, counters: dict[str, int]):
+    """
+    Учитывает принятое процессом приема (ingest.py) так же, как get_message: метрики сообщений, ошибок
+    валидации и автобусов, журнал координат.
+    :param columns: Автобусы столбцами (BusColumns), принятые с прошлого опроса буфера.
+    :param counters: Приросты счетчиков буфера (SharedRing.take_counters).
+    """
+    bus_messages.inc(counters['messages'])
+    for reason in ('json', 'structure', 'value'):
+        if counters[reason]:
+            validation_errors.labels('bus', reason).inc(counters[reason])
+    bus_updates.inc(len(columns))
+    if recorder is not None and len(columns):
+        recorder.record_columns(columns)
 
 
 def validate_port_number(ctx, param, value):
@@ -263,17 +364,138 @@ def get_log_level(ctx, param, value):
     callback=get_log_level,
     help='Настройка логирования.',
 )  # https://click.palletsprojects.com/en/8.1.x/options/#counting
-async def main(refresh_timeout, bus_port, browser_port, verbose):
+@click.option(
+    '--ingest_workers',
+    type=int,
+    default=0,
+    show_default=True,
+    help='Количество процессов приема координат автобусов, 0 - прием в процессе сервера.',
+)
+@click.option(
+    '--bus_ttl',
+    type=float,
+    default=BUS_TTL,
+    show_default=True,
+    help='Через сколько секунд без координат автобус убирается с карты, 0 - никогда.',
+)
+@click.option(
+    '--metrics_port',
+    type=int,
+    default=0,
+    show_default=True,
+    callback=validate_port_number,
+    help='Порт страницы метрик Prometheus, 0 - метрики не отдаются.',
+)
+@click.option(
+    '--interpolation_horizon',
+    type=float,
+    default=0,
+    show_default=True,
+    help='Сколько секунд после последних координат автобус движется по маршруту, 0 - без интерполяции.',
+)
+@click.option(
+    '--cluster_threshold',
+    type=int,
+    default=CLUSTER_THRESHOLD,
+    show_default=True,
+    help='Больше скольких автобусов в окне браузер получает скопления, 0 - всегда отдельные автобусы.',
+)
+@click.option(
+    '--cluster_span',
+    type=float,
+    default=CLUSTER_SPAN,
+    show_default=True,
+    help='Окно шире или выше скольких градусов показывается скоплениями, 0 - только по количеству автобусов.',
+)
+@click.option(
+    '--record_dir',
+    default='',
+    help='Папка журнала входящих координат для replay.py, по умолчанию журнал не ведется.',
+)
+@click.option(
+    '--compression_level',
+    type=click.IntRange(0, 9),
+    default=COMPRESSION_LEVEL,
+    show_default=True,
+    help='Уровень сжатия сообщений браузерам (zlib), 0 - без сжатия.',
+)
+@click.option(
+    '--compression_threshold',
+    type=int,
+    default=COMPRESSION_THRESHOLD,
+    show_default=True,
+    help='Сообщения браузерам короче скольких символов отправляются без сжатия.',
+)
+@click.option(
+    '--track_length',
+    type=int,
+    default=0,
+    show_default=True,
+    help='Сколько последних точек пути помнит каждый автобус, 0 - пути не запоминаются.',
+)
+@click.option(
+    '--track_interval',
+    type=float,
+    default=TRACK_INTERVAL,
+    show_default=True,
+    help='Не чаще скольких секунд записывается точка пути автобуса.',
+)
+async def main(
+    refresh_timeout,
+    bus_port,
+    browser_port,
+    verbose,
+    ingest_workers,
+    bus_ttl,
+    metrics_port,
+    interpolation_horizon,
+    cluster_threshold,
+    cluster_span,
+    record_dir,
+    compression_level,
+    compression_threshold,
+    track_length,
+    track_interval,
+):
 
     logger.setLevel(verbose)
+    hub.bus_ttl = bus_ttl
+    hub.cluster_threshold = cluster_threshold
+    hub.cluster_span = cluster_span
+    compressor.level = compression_level
+    compressor.threshold = compression_threshold
+    if interpolation_horizon:
+        hub.interpolator = RouteInterpolator(
+            RouteGeometry(RouteStore.load(ROUTES_DIR)), interpolation_horizon
+        )
+    if track_length:
+        hub.tracks = TrackStore(track_length, track_interval)
 
-    global REFRESH_TIMEOUT
+    global REFRESH_TIMEOUT, recorder
     REFRESH_TIMEOUT = refresh_timeout
+    if record_dir:
+        recorder = TrafficRecorder(record_dir)
 
     async with trio.open_nursery() as nursery:
-        nursery.start_soon(
-            serve_websocket, get_message, '127.0.0.1', bus_port, None
-        )
+        nursery.start_soon(hub.run, receive_channel, refresh_timeout)
+        if recorder is not None:
+            nursery.start_soon(recorder.run)
+        if metrics_port:
+            nursery.start_soon(serve_metrics, '127.0.0.1', metrics_port)
+        if ingest_workers:
+            nursery.start_soon(
+                run_ingest_workers,
+                ingest_workers,
+                '127.0.0.1',
+                bus_port,
+                send_channel,
+                verbose,
+                observe=observe_ingest,
+            )
+        else:
+            nursery.start_soon(
+                serve_websocket, get_message, '127.0.0.1', bus_port, None
+            )
         nursery.start_soon(
             serve_websocket, talk_to_browser, '127.0.0.1', browser_port, None
         )
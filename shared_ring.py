@@ -0,0 +1,162 @@
+"""Кольцевой буфер координат автобусов в разделяемой памяти между процессами"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from models import Bus, BusColumns
+
+RING_CAPACITY = 65536  # Сколько координат автобусов помещается в буфер.
+BUS_ID_SIZE = 32  # Наибольшая длина номера автобуса в байтах UTF-8.
+ROUTE_SIZE = 16  # Наибольшая длина номера маршрута в байтах UTF-8.
+HEADER_SIZE = 128  # Счетчики записи и чтения лежат в разных строках кэша процессора.
+# Счетчики процесса приема в строке кэша счетчика записи: принятые сообщения и ошибки валидации по причинам
+# (ValidationError.reason).
+COUNTERS = ('messages', 'json', 'structure', 'value')
+
+RECORD = np.dtype(
+    [
+        ('busId', f'S{BUS_ID_SIZE}'),
+        ('route', f'S{ROUTE_SIZE}'),
+        ('lat', '<f8'),
+        ('lng', '<f8'),
+    ]
+)
+
+
+class SharedRing:
+    """
+    Кольцевой буфер с одним писателем и одним читателем.
+    Писатель (процесс приема координат) дописывает записи и сдвигает счетчик записи, читатель (процесс сервера)
+    забирает все записи до этого счетчика и сдвигает счетчик чтения. Каждый счетчик меняет только один процесс,
+    поэтому блокировки не нужны. Счетчики только растут, позиция в буфере - остаток от деления на емкость.
+    Рядом со счетчиком записи писатель ведет счетчики сообщений и ошибок валидации (COUNTERS), читатель
+    забирает их приросты.
+    """
+
+    def __init__(self, capacity: int = RING_CAPACITY, name: str | None = None):
+        """
+        :param capacity: Емкость буфера в записях.
+        :param name: Имя существующего буфера для подключения к нему, None - создать новый.
+        """
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(
+            name=name,
+            create=name is None,
+            size=HEADER_SIZE + capacity * RECORD.itemsize,
+        )
+        self._counters = np.ndarray(
+            (HEADER_SIZE // 8,), dtype='<u8', buffer=self._shm.buf
+        )
+        self._records = np.ndarray(
+            (capacity,), dtype=RECORD, buffer=self._shm.buf, offset=HEADER_SIZE
+        )
+        if name is None:
+            self._counters[:] = 0
+        self._taken = dict.fromkeys(COUNTERS, 0)  # значения счетчиков при прошлом take_counters
+
+    @property
+    def name(self) -> str:
+        """Имя буфера для подключения из другого процесса."""
+        return self._shm.name
+
+    @property
+    def _head(self) -> int:
+        return int(self._counters[0])
+
+    @property
+    def _tail(self) -> int:
+        return int(self._counters[8])
+
+    def __len__(self):
+        return self._head - self._tail
+
+    @staticmethod
+    def encode(buses) -> np.ndarray:
+        """
+        Упаковывает автобусы в записи буфера.
+        Если номер автобуса или маршрута не помещается в запись, вызывает ValueError.
+        """
+        records = []
+        for bus in buses:
+            bus_id = bus.busId.encode('utf8')
+            route = bus.route.encode('utf8')
+            if len(bus_id) > BUS_ID_SIZE:
+                raise ValueError(
+                    f'{bus.busId}: Номер автобуса должен быть не длиннее {BUS_ID_SIZE} байт.'
+                )
+            if len(route) > ROUTE_SIZE:
+                raise ValueError(
+                    f'{bus.route}: Номер маршрута должен быть не длиннее {ROUTE_SIZE} байт.'
+                )
+            records.append((bus_id, route, bus.lat, bus.lng))
+        return np.array(records, dtype=RECORD)
+
+    @staticmethod
+    def decode(records: np.ndarray) -> list[Bus]:
+        """Распаковывает записи буфера в автобусы."""
+        return [
+            Bus(bus_id.decode('utf8'), lat, lng, route.decode('utf8'))
+            for bus_id, route, lat, lng in records.tolist()
+        ]
+
+    @staticmethod
+    def columns(records: np.ndarray) -> BusColumns:
+        """Распаковывает записи буфера столбцами, не создавая экземпляры Bus."""
+        return BusColumns(
+            [bus_id.decode('utf8') for bus_id in records['busId'].tolist()],
+            [route.decode('utf8') for route in records['route'].tolist()],
+            records['lat'].tolist(),
+            records['lng'].tolist(),
+        )
+
+    def write(self, records: np.ndarray) -> int:
+        """
+        Дописывает записи, сколько поместится. Возвращает количество записанных.
+        Вызывается только процессом-писателем.
+        """
+        head = self._head
+        count = min(len(records), self.capacity - (head - self._tail))
+        start = head % self.capacity
+        first = min(count, self.capacity - start)
+        self._records[start:start + first] = records[:first]
+        self._records[:count - first] = records[first:count]
+        self._counters[0] = head + count
+        return count
+
+    def read(self) -> np.ndarray:
+        """
+        Забирает все дописанные записи (копией). Вызывается только процессом-читателем.
+        """
+        head, tail = self._head, self._tail
+        start, stop = tail % self.capacity, head % self.capacity
+        if head - tail == 0:
+            records = self._records[:0].copy()
+        elif start < stop:
+            records = self._records[start:stop].copy()
+        else:
+            records = np.concatenate(
+                [self._records[start:], self._records[:stop]]
+            )
+        self._counters[8] = head
+        return records
+
+    def count(self, name: str, amount: int = 1):
+        """Увеличивает счетчик из COUNTERS. Вызывается только процессом-писателем."""
+        self._counters[1 + COUNTERS.index(name)] += amount
+
+    def take_counters(self) -> dict[str, int]:
+        """Приросты счетчиков COUNTERS с прошлого вызова. Вызывается только процессом-читателем."""
+        values = dict(zip(COUNTERS, self._counters[1:1 + len(COUNTERS)].tolist()))
+        taken = {name: values[name] - self._taken[name] for name in COUNTERS}
+        self._taken = values
+        return taken
+
+    def close(self):
+        """Отключается от буфера."""
+        del self._counters, self._records
+        self._shm.close()
+
+    def unlink(self):
+        """Удаляет буфер. Вызывается создателем буфера после остановки писателя."""
+        self._shm.unlink()
@@ -0,0 +1,419 @@
+"""
+Ускоренная имитация: имитатор автобусов, сервер и браузеры в одном запуске trio на виртуальных часах.
+Имитатор (fake_bus.emulate) и обработчики сервера (server.get_message, server.talk_to_browser) те же, что
+и в работе, только web-сокеты между ними открываются поверх потоков в памяти, а не TCP. Час движения
+автобусов проходит за секунды, а при одинаковых параметрах и seed результат всегда одинаковый.
+Запуск: python simulation.py --routes_number 50 --duration 3600
+"""
+
+import hashlib
+import json
+import logging
+import random
+import time
+import warnings
+from contextlib import asynccontextmanager, contextmanager, suppress
+from dataclasses import dataclass
+from functools import partial
+
+import asyncclick as click
+import trio
+import trio.testing
+import trio_websocket
+from trio import TrioDeprecationWarning
+
+import server
+from compression import MessageCompressor
+from fake_bus import BATCH_LATENCY, BATCH_SIZE, ENCODINGS, EmulatorStats, emulate
+from hub import BusesHub
+from models import PROTOCOL_MODES, WindowBounds
+from route_store import ROUTES_DIR, RouteStore
+
+BROWSERS_NUMBER = 10  # Сколько браузеров смотрят на карту.
+# Сколько web-сокетов открывает имитатор автобусов. Сервер обрабатывает сокеты в случайном порядке trio, поэтому
+# при нескольких сокетах порядок автобусов в сообщениях браузерам, а с ним и отпечаток, от запуска к запуску разный.
+WEBSOCKETS_NUMBER = 1
+VIEWPORT = (0.047, 0.111)  # Размер окна браузера в градусах: высота и ширина.
+SERVER_URL = 'ws://simulation/ws'  # Адрес сервера для имитатора, соединения все равно открываются в памяти.
+
+warnings.filterwarnings(action='ignore', category=TrioDeprecationWarning)
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%m/%d/%Y %H:%M:%S',
+)
+logger = logging.getLogger('simulation')
+
+
+@dataclass
+class SimulationReport:
+    """Итоги имитации"""
+
+    updates: int = 0  # координаты, которые приняла валидация сервера
+    frames: int = 0  # сообщения имитатора серверу
+    invalid: int = 0  # сообщения имитатора, не прошедшие валидацию
+    dropped: int = 0  # координаты, которые имитатор отбросил, пока очередь их web-сокета была заполнена
+    versions: int = 0  # версии состояния хаба
+    messages: int = 0  # сообщения браузерам
+    size: int = 0  # символы или байты сжатых кадров в сообщениях браузерам
+    buses: int = 0  # автобусы на карте в конце имитации
+    digest: str = ''  # отпечаток сообщений браузерам, одинаковый при одинаковых параметрах и seed (WEBSOCKETS_NUMBER)
+
+
+def random_bounds(rng: random.Random, routes: list) -> WindowBounds:
+    """Окно браузера вокруг случайной точки случайного маршрута."""
+    height, width = VIEWPORT
+    coordinates = rng.choice(routes)['coordinates']
+    lat, lng = (float(value) for value in rng.choice(coordinates))
+    return WindowBounds(
+        south_lat=lat - height / 2,
+        north_lat=lat + height / 2,
+        west_lng=lng - width / 2,
+        east_lng=lng + width / 2,
+    )
+
+
+async def serve_in_memory(handler, stream):
+    """Принимает web-сокет на потоке в памяти и передает его обработчику сервера, как serve_websocket."""
+    async with trio.open_nursery() as nursery:
+        request = await trio_websocket.wrap_server_stream(nursery, stream)
+        await handler(request)
+        nursery.cancel_scope.cancel()
+
+
+@asynccontextmanager
+async def connect_in_memory(handler, url: str = SERVER_URL):
+    """
+    Открывает web-сокет к обработчику сервера поверх пары потоков в памяти (trio.testing.memory_stream_pair).
+    Подставляется вместо open_websocket_url.
+    :param handler: Обработчик сервера: server.get_message или server.talk_to_browser.
+    :param url: Адрес сервера, не используется.
+    """
+    client_stream, server_stream = trio.testing.memory_stream_pair()
+    async with trio.open_nursery() as nursery:
+        nursery.start_soon(serve_in_memory, handler, server_stream)
+        ws = await trio_websocket.wrap_client_stream(
+            nursery, client_stream, 'simulation', '/ws'
+        )
+        try:
+            yield ws
+        finally:
+            nursery.cancel_scope.cancel()
+
+
+@contextmanager
+def server_state(hub: BusesHub, refresh_timeout: float):
+    """
+    Подставляет в модуль server хаб имитации, новый канал приема координат, новый кэш сжатых кадров
+    и интервал тиков, а после имитации возвращает прежние. Возвращает конец канала приема для хаба.
+    """
+    names = ('hub', 'send_channel', 'receive_channel', 'compressor')
+    saved = {name: getattr(server, name) for name in names}
+    saved_refresh_timeout = server.REFRESH_TIMEOUT
+    server.send_channel, server.receive_channel = trio.open_memory_channel(0)
+    server.hub = hub
+    server.compressor = MessageCompressor()
+    server.REFRESH_TIMEOUT = refresh_timeout
+    try:
+        yield server.receive_channel
+    finally:
+        for name, value in saved.items():
+            setattr(server, name, value)
+        server.REFRESH_TIMEOUT = saved_refresh_timeout
+
+
+def bus_errors() -> float:
+    """Сколько сообщений имитатора сервер отверг с начала работы (метрика validation_errors_total)."""
+    return sum(
+        value
+        for _, labels, value in server.validation_errors.samples()
+        if ('source', 'bus') in labels
+    )
+
+
+async def watch_buses(
+    bounds: WindowBounds,
+    protocol: str,
+    compress: bool,
+    report: SimulationReport,
+    digest,
+):
+    """Браузер: выбирает протокол и окно карты и забирает сообщения сервера (server.talk_to_browser)."""
+    async with connect_in_memory(server.talk_to_browser) as ws:
+        await ws.send_message(
+            json.dumps(
+                {
+                    'msgType': 'setProtocol',
+                    'data': {'mode': protocol, 'compress': compress},
+                }
+            )
+        )
+        await ws.send_message(
+            json.dumps(
+                {
+                    'msgType': 'newBounds',
+                    'data': {
+                        'south_lat': bounds.south_lat,
+                        'north_lat': bounds.north_lat,
+                        'west_lng': bounds.west_lng,
+                        'east_lng': bounds.east_lng,
+                    },
+                }
+            )
+        )
+        while True:
+            message = await ws.get_message()
+            report.messages += 1
+            report.size += len(message)
+            digest.update(
+                message if isinstance(message, bytes) else message.encode('utf8')
+            )
+
+
+async def broadcast(hub: BusesHub, refresh_timeout: float, ticks: int):
+    """
+    Планировщик тиков хаба на виртуальных часах вместо hub.broadcast. Перед каждым тиком ждет, пока остальные
+    задачи обработают все события этого момента: порядок задач в trio случайный, а так координаты,
+    пришедшие одновременно с тиком, всегда попадают в него.
+    """
+    started = trio.current_time()
+    for tick in range(1, ticks + 1):
+        await trio.sleep_until(started + tick * refresh_timeout)
+        await trio.testing.wait_all_tasks_blocked()
+        hub.tick()
+    await trio.testing.wait_all_tasks_blocked()
+
+
+async def simulate(
+    routes: list,
+    duration: float,
+    buses_per_route: int = 10,
+    browsers_number: int = BROWSERS_NUMBER,
+    seed: int = 0,
+    bus_refresh: float = 1,
+    server_refresh: float = 1,
+    batch_size: int = BATCH_SIZE,
+    batch_latency: float = BATCH_LATENCY,
+    encoding: str = 'json',
+    hub: BusesHub | None = None,
+    websockets_number: int = WEBSOCKETS_NUMBER,
+    protocol: str = 'full',
+    compress: bool = False,
+) -> SimulationReport:
+    """
+    Имитирует duration секунд работы имитатора автобусов, сервера и браузеров.
+    Запускается на часах trio.testing.MockClock(autojump_threshold=0): тогда паузы не ждут настоящего
+    времени (run_simulation).
+    :param routes: Маршруты в формате json-файлов папки с маршрутами.
+    :param duration: Сколько секунд виртуального времени имитировать.
+    :param buses_per_route: Наибольшее количество автобусов на каждом маршруте.
+    :param browsers_number: Сколько браузеров смотрят на карту, их окна выбираются случайно.
+    :param seed: Начальное значение генератора случайных чисел для окон браузеров и автобусов.
+    :param bus_refresh: Пауза имитатора между отправками следующих координат автобусов.
+    :param server_refresh: Интервал в секундах между тиками хаба.
+    :param batch_size: Наибольшее количество координат в одном сообщении имитатора.
+    :param batch_latency: Сколько секунд имитатор ждет заполнения пачки.
+    :param encoding: Формат сообщений имитатора: json или binary.
+    :param hub: Настроенный хаб, часы которого - trio.current_time. По умолчанию хаб с настройками по умолчанию.
+    :param websockets_number: Сколько web-сокетов открывает имитатор. Отпечаток повторяется только с одним сокетом.
+    :param protocol: Протокол браузеров: full или delta.
+    :param compress: Браузеры принимают сжатые кадры.
+    """
+    rng = random.Random(seed)
+    bounds = [random_bounds(rng, routes) for _ in range(browsers_number)]
+    hub = hub or BusesHub(clock=trio.current_time)
+    report = SimulationReport()
+    stats = EmulatorStats()
+    digests = [hashlib.sha256() for _ in bounds]
+    logger.info(
+        'Имитация %d маршрутов и %d браузеров' % (len(routes), len(bounds))
+    )
+
+    updates, errors = server.bus_updates.value, bus_errors()
+    with server_state(hub, server_refresh) as receive_channel:
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(hub.ingest, receive_channel)
+            for browser_bounds, digest in zip(bounds, digests):
+                nursery.start_soon(
+                    watch_buses, browser_bounds, protocol, compress, report, digest
+                )
+            await trio.testing.wait_all_tasks_blocked()
+            nursery.start_soon(
+                partial(
+                    emulate,
+                    SERVER_URL,
+                    routes,
+                    buses_per_route,
+                    websockets_number,
+                    '',
+                    bus_refresh,
+                    batch_size,
+                    batch_latency,
+                    stats,
+                    encoding,
+                    rng,
+                    connect=partial(connect_in_memory, server.get_message),
+                )
+            )
+            await broadcast(hub, server_refresh, int(duration / server_refresh))
+            nursery.cancel_scope.cancel()
+
+    report.updates = server.bus_updates.value - updates
+    report.invalid = bus_errors() - errors
+    report.frames = stats.frames
+    report.dropped = stats.dropped
+    report.versions = hub.version
+    report.buses = len(hub.buses)
+    # у каждого браузера свой отпечаток: порядок, в котором браузеры получают сообщения, не важен
+    report.digest = hashlib.sha256(
+        b''.join(digest.digest() for digest in digests)
+    ).hexdigest()
+    return report
+
+
+def run_simulation(*args, **kwargs) -> SimulationReport:
+    """Запускает simulate на виртуальных часах, которые перескакивают вперед, когда все задачи ждут."""
+    return trio.run(
+        partial(simulate, *args, **kwargs),
+        clock=trio.testing.MockClock(autojump_threshold=0),
+    )
+
+
+def get_log_level(ctx, param, value) -> int:
+    """Преобразует количество указанных v (verbose) в параметрах скрипта к уровню логирования"""
+    levels = [
+        logging.INFO,
+        logging.DEBUG,
+    ]
+    return levels[min(value, len(levels) - 1)]
+
+
+@click.command()
+@click.option(
+    '--routes_number',
+    default=50,
+    show_default=True,
+    help='Количество маршрутов.',
+)
+@click.option(
+    '--buses_per_route',
+    default=10,
+    show_default=True,
+    help='Наибольшее количество автобусов на каждом маршруте.',
+)
+@click.option(
+    '--browsers_number',
+    default=BROWSERS_NUMBER,
+    show_default=True,
+    help='Сколько браузеров смотрят на карту.',
+)
+@click.option(
+    '--duration',
+    type=float,
+    default=3600,
+    show_default=True,
+    help='Сколько секунд виртуального времени имитировать.',
+)
+@click.option(
+    '--seed',
+    default=0,
+    show_default=True,
+    help='Начальное значение генератора случайных чисел.',
+)
+@click.option(
+    '--bus_refresh',
+    type=float,
+    default=1,
+    show_default=True,
+    help='Пауза имитатора между отправками координат автобусов.',
+)
+@click.option(
+    '--server_refresh',
+    type=float,
+    default=1,
+    show_default=True,
+    help='Интервал в секундах между тиками хаба.',
+)
+@click.option(
+    '--encoding',
+    type=click.Choice(ENCODINGS),
+    default='json',
+    show_default=True,
+    help='Формат сообщений имитатора.',
+)
+@click.option(
+    '--websockets_number',
+    type=click.IntRange(1),
+    default=WEBSOCKETS_NUMBER,
+    show_default=True,
+    help='Сколько web-сокетов открывает имитатор.',
+)
+@click.option(
+    '--protocol',
+    type=click.Choice(PROTOCOL_MODES),
+    default='full',
+    show_default=True,
+    help='Протокол браузеров.',
+)
+@click.option(
+    '--compress',
+    is_flag=True,
+    help='Браузеры принимают сжатые кадры.',
+)
+@click.option(
+    '-v',
+    '--verbose',
+    count=True,
+    callback=get_log_level,
+    help='Настройка логирования: по умолчанию итоги имитации, -v - подробности.',
+)
+async def main(
+    routes_number,
+    buses_per_route,
+    browsers_number,
+    duration,
+    seed,
+    bus_refresh,
+    server_refresh,
+    encoding,
+    websockets_number,
+    protocol,
+    compress,
+    verbose,
+):
+    logger.setLevel(verbose)
+
+    store = RouteStore.load(ROUTES_DIR)
+    routes = [store.route(i) for i in range(min(routes_number, len(store)))]
+
+    started = time.perf_counter()
+    report = await simulate(
+        routes,
+        duration,
+        buses_per_route,
+        browsers_number,
+        seed,
+        bus_refresh,
+        server_refresh,
+        encoding=encoding,
+        websockets_number=websockets_number,
+        protocol=protocol,
+        compress=compress,
+    )
+    logger.info(
+        'Виртуальных секунд: %d, настоящих: %.1f'
+        % (duration, time.perf_counter() - started)
+    )
+    logger.info('%s', report)
+
+
+if __name__ == '__main__':
+    with suppress(KeyboardInterrupt):
+        # вся команда работает на виртуальных часах, поэтому simulate вызывается без вложенного trio.run
+        trio.run(
+            main(
+                _anyio_backend='trio',
+                _anyio_backend_options={
+                    'clock': trio.testing.MockClock(autojump_threshold=0)
+                },
+            )
+        )
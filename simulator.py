@@ -0,0 +1,212 @@
+"""Векторная имитация движения всех автобусов разом"""
+
+import json
+
+import numpy as np
+import trio
+from trio import MemorySendChannel
+
+from route_store import point_texts
+
+
+def root_array(array: np.ndarray) -> np.ndarray:
+    """Массив, поверх которого построено представление: например, все точки хранилища маршрутов."""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def pack_rows(arrays: list) -> tuple[np.ndarray, list[int]]:
+    """
+    Общий массив строк и смещения массивов в нем. Если все массивы - представления одного массива
+    (например, хранилища маршрутов), общим становится он сам без копирования, иначе массивы склеиваются.
+    :param arrays: Массивы с одинаковыми типом и формой строки.
+    """
+    roots = {id(root_array(array)) for array in arrays}
+    if len(roots) == 1 and all(array.flags.c_contiguous for array in arrays):
+        root = root_array(arrays[0])
+        row_shape = arrays[0].shape[1:]
+        row_size = int(np.prod(row_shape))
+        if root.dtype == arrays[0].dtype and root.size % row_size == 0:
+            rows = root.reshape((-1,) + row_shape)
+            address = rows.__array_interface__['data'][0]
+            return rows, [
+                (array.__array_interface__['data'][0] - address)
+                // rows.strides[0]
+                for array in arrays
+            ]
+    offsets = np.cumsum([0] + [len(array) for array in arrays[:-1]]).tolist()
+    return np.concatenate(arrays), offsets
+
+
+class FleetSimulator:
+    """
+    Парк автобусов в упакованных массивах NumPy.
+    У каждого маршрута есть смещение и количество точек в общем массиве точек, у каждого автобуса - номер
+    маршрута и текущая фаза: номер точки на пути туда и обратно. Обратный путь не хранится: фаза второй половины
+    отражается на номер точки маршрута. Если маршруты - представления одного массива (RouteStore), общим
+    массивом становится сам массив хранилища, и процессы имитаторов не копируют точки маршрутов. За один шаг
+    все автобусы сдвигаются на следующую точку одной векторной операцией. Начало JSON каждого автобуса
+    кодируется заранее, а окончание с координатами берется из готовых JSON-окончаний точек маршрута:
+    хранилище маршрутов держит их в том же отображенном файле, для остальных маршрутов они кодируются
+    один раз при первой сборке сообщений.
+    """
+
+    def __init__(self):
+        self.route_names = []
+        self._routes = []  # массивы координат [lat, lng] маршрутов, представления без копирования
+        self._route_sizes = []
+        self._route_texts = []  # JSON-окончания точек маршрутов, None - еще не закодированы
+        self._bus_ids = []
+        self._bus_prefixes = []  # JSON-начала для каждого автобуса
+        self._bus_routes = []
+        self._bus_phases = []
+        self.bus_phases = None
+        self._packed = False
+
+    def __len__(self):
+        return len(self._bus_ids)
+
+    def add_route(self, name: str, coordinates, texts=None) -> int:
+        """
+        Добавляет маршрут, автобусы ездят по нему туда и обратно. Возвращает номер маршрута.
+        :param name: Номер маршрута.
+        :param coordinates: Точки маршрута [[lat, lng], ...], список или массив. Массив float64
+        не копируется.
+        :param texts: JSON-окончания точек маршрута (route_store.point_texts), массив не копируется.
+        По умолчанию кодируются при первой сборке сообщений.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self._routes.append(coordinates)
+        self._route_texts.append(texts)
+        self._route_sizes.append(len(coordinates))
+        self.route_names.append(name)
+        self._unpack()
+        return len(self.route_names) - 1
+
+    def add_bus(self, route_index: int, bus_id: str, phase: int):
+        """
+        Ставит автобус на маршрут.
+        :param route_index: Номер маршрута, который вернул add_route.
+        :param bus_id: Номер автобуса.
+        :param phase: Номер точки маршрута, с которой автобус начинает поездку.
+        """
+        self._unpack()
+        self._bus_ids.append(bus_id)
+        self._bus_prefixes.append(
+            '{"busId": %s, "route": %s, '
+            % (
+                json.dumps(bus_id, ensure_ascii=False),
+                json.dumps(self.route_names[route_index], ensure_ascii=False),
+            )
+        )
+        self._bus_routes.append(route_index)
+        self._bus_phases.append(phase % self.route_length(route_index))
+
+    def route_length(self, route_index: int) -> int:
+        """Количество точек маршрута вместе с обратным путем."""
+        return 2 * self._route_sizes[route_index]
+
+    def _unpack(self):
+        if self._packed:
+            self._bus_phases = self.bus_phases.tolist()
+            self._packed = False
+
+    def _pack(self):
+        if self._packed:
+            return
+        self.points, route_offsets = pack_rows(
+            self._routes or [np.empty((0, 2))]
+        )
+        bus_routes = np.array(self._bus_routes, dtype=np.int64)
+        self.bus_prefixes = self._bus_prefixes
+        self.bus_offsets = np.array(route_offsets, dtype=np.int64)[bus_routes]
+        self.point_texts = None  # общий массив JSON-окончаний, собирается при первом вызове fragments
+        self.bus_sizes = np.array(self._route_sizes, dtype=np.int64)[
+            bus_routes
+        ]
+        self.bus_phases = np.array(self._bus_phases, dtype=np.int64)
+        self.bus_route_names = None  # номера маршрутов автобусов, собираются при первом вызове records
+        self._packed = True
+
+    def step(self):
+        """Сдвигает все автобусы на следующую точку маршрута."""
+        self._pack()
+        self.bus_phases += 1
+        self.bus_phases %= 2 * self.bus_sizes
+
+    def positions(self) -> np.ndarray:
+        """Текущие координаты всех автобусов: массив строк [lat, lng] в порядке добавления автобусов."""
+        self._pack()
+        return self.points[self.bus_offsets + self._route_points()]
+
+    def _route_points(self) -> np.ndarray:
+        """Номера текущих точек автобусов на их маршрутах."""
+        # на обратном пути фаза size + k соответствует точке size - 1 - k
+        mirrored = 2 * self.bus_sizes - 1 - self.bus_phases
+        return np.minimum(self.bus_phases, mirrored)
+
+    def _pack_texts(self):
+        for route_index, texts in enumerate(self._route_texts):
+            if texts is None:
+                self._route_texts[route_index] = point_texts(
+                    self._routes[route_index]
+                )
+        self.point_texts, route_offsets = pack_rows(
+            self._route_texts or [np.empty(0, dtype='S1')]
+        )
+        bus_routes = np.array(self._bus_routes, dtype=np.int64)
+        self.bus_text_offsets = np.array(route_offsets, dtype=np.int64)[
+            bus_routes
+        ]
+
+    def fragments(self) -> list[str]:
+        """JSON текущих координат всех автобусов в формате сообщения автобуса."""
+        self._pack()
+        if self.point_texts is None:
+            self._pack_texts()
+        texts = self.point_texts[
+            self.bus_text_offsets + self._route_points()
+        ].tolist()
+        return [
+            prefix + text.decode('utf8')
+            for prefix, text in zip(self.bus_prefixes, texts)
+        ]
+
+    def records(self) -> list[tuple[str, str, float, float]]:
+        """Текущие координаты всех автобусов: кортежи (busId, route, lat, lng) для бинарного формата."""
+        self._pack()
+        if self.bus_route_names is None:
+            self.bus_route_names = [
+                self.route_names[route_index]
+                for route_index in self._bus_routes
+            ]
+        lat, lng = self.positions().T.tolist()
+        return list(zip(self._bus_ids, self.bus_route_names, lat, lng))
+
+    async def run(
+        self,
+        send_channel: MemorySendChannel,
+        refresh_timeout: float,
+        chunk_size: int,
+        encoding: str = 'json',
+    ):
+        """
+        Раз в refresh_timeout секунд сдвигает все автобусы и отправляет их координаты в канал
+        списками не длиннее chunk_size. Если отправка не укладывается в тик, следующий тик начинается сразу.
+        :param send_channel: Канал для координат автобусов.
+        :param refresh_timeout: Интервал в секундах между перемещениями автобусов по точкам маршрутов.
+        :param chunk_size: Наибольшее количество координат в одном элементе канала.
+        :param encoding: json - списки JSON-фрагментов (fragments), binary - списки кортежей (records).
+        """
+        deadline = trio.current_time()
+        while True:
+            fragments = (
+                self.records() if encoding == 'binary' else self.fragments()
+            )
+            for start in range(0, len(fragments), chunk_size):
+                await send_channel.send(fragments[start:start + chunk_size])
+            self.step()
+
+            deadline = max(deadline + refresh_timeout, trio.current_time())
+            await trio.sleep_until(deadline)
@@ -0,0 +1,139 @@
+"""Пространственный индекс автобусов для выборки по окну карты"""
+
+import math
+from collections import defaultdict
+
+from models import WindowBounds
+
+CELL_SIZE = 0.01  # Размер ячейки сетки в градусах (около 1 км по широте).
+VIEWPORT_TILES = 8  # Сколько плиток сетки окон помещается в окно карты по каждой стороне.
+MAX_ZOOM = 20  # Самый мелкий уровень сетки окон.
+
+
+def tile_zoom(span: float, viewport_tiles: int) -> int:
+    """Уровень сетки (плитка 360 / 2**zoom градусов), на котором span градусов занимают до viewport_tiles плиток."""
+    if not span > 0:
+        return MAX_ZOOM
+    if not math.isfinite(span):
+        return 0
+    zoom = math.floor(math.log2(360 * viewport_tiles / span))
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def snap_bounds(
+    bounds, viewport_tiles: int = VIEWPORT_TILES
+) -> tuple[tuple, WindowBounds]:
+    """
+    Расширяет окно карты до границ плиток. Уровень сетки выбирается по размеру окна отдельно по широте
+    и долготе, так что окно расширяется не больше чем на две плитки из viewport_tiles / 2 по каждой стороне.
+    Окна браузеров, которые смотрят на один район при близком масштабе, получают одинаковые плитки.
+    :param bounds: Координаты окна карты (WindowBounds).
+    :param viewport_tiles: Наибольшее количество плиток по каждой стороне окна.
+    :return: кортеж из ключа (уровни и номера крайних плиток) и расширенного окна.
+    """
+    lat_zoom = tile_zoom(bounds.north_lat - bounds.south_lat, viewport_tiles)
+    lng_zoom = tile_zoom(bounds.east_lng - bounds.west_lng, viewport_tiles)
+    lat_size, lng_size = 360 / 2**lat_zoom, 360 / 2**lng_zoom
+
+    south = math.floor(bounds.south_lat / lat_size)
+    north = max(math.ceil(bounds.north_lat / lat_size), south + 1)
+    west = math.floor(bounds.west_lng / lng_size)
+    east = max(math.ceil(bounds.east_lng / lng_size), west + 1)
+    # плитки крупных уровней выходят за края карты, а автобусов за краями нет
+    return (lat_zoom, lng_zoom, south, west, north, east), WindowBounds(
+        south_lat=max(south * lat_size, -90.0),
+        north_lat=min(north * lat_size, 90.0),
+        west_lng=max(west * lng_size, -180.0),
+        east_lng=min(east * lng_size, 180.0),
+    )
+
+
+class GridIndex:
+    """
+    Равномерная сетка по широте и долготе.
+    Каждый автобус лежит в ячейке, в которую попадают его координаты. Выборка по окну карты (partition)
+    перебирает только ячейки, пересекающие окно, и делит их на лежащие внутри окна и на его границе:
+    координаты проверяются лишь в ячейках на границе.
+    """
+
+    def __init__(self, cell_size: float = CELL_SIZE):
+        """:param cell_size: Размер ячейки сетки в градусах."""
+        self.cell_size = cell_size
+        self._cells = defaultdict(dict)  # ячейка -> {busId: то, что хранится для автобуса}
+        self._bus_cells = dict()  # busId -> ячейка
+
+    def __len__(self):
+        return len(self._bus_cells)
+
+    def cell_of(self, lat: float, lng: float) -> tuple[int, int]:
+        """Ячейка сетки, в которую попадает координата."""
+        return (
+            math.floor(lat / self.cell_size),
+            math.floor(lng / self.cell_size),
+        )
+
+    def place(self, bus_id: str, lat: float, lng: float, item):
+        """Помещает в ячейку по координатам то, что хранится для автобуса, при необходимости перенося из старой."""
+        cell = self.cell_of(lat, lng)
+        old_cell = self._bus_cells.get(bus_id)
+        if old_cell is not None and old_cell != cell:
+            self._discard(old_cell, bus_id)
+        self._bus_cells[bus_id] = cell
+        self._cells[cell][bus_id] = item
+
+    def remove(self, bus_id: str):
+        """Удаляет автобус из индекса."""
+        cell = self._bus_cells.pop(bus_id, None)
+        if cell is not None:
+            self._discard(cell, bus_id)
+
+    def _discard(self, cell: tuple[int, int], bus_id: str):
+        buses = self._cells[cell]
+        buses.pop(bus_id, None)
+        if not buses:
+            del self._cells[cell]
+
+    def cells(self, bounds) -> tuple[range, range]:
+        """Диапазоны номеров ячеек по широте и долготе, пересекающих окно карты."""
+        south, west = self.cell_of(bounds.south_lat, bounds.west_lng)
+        north, east = self.cell_of(bounds.north_lat, bounds.east_lng)
+        return range(south, north + 1), range(west, east + 1)
+
+    def locate(self, bus_id: str) -> tuple[int, int] | None:
+        """Ячейка, в которой сейчас лежит автобус."""
+        return self._bus_cells.get(bus_id)
+
+    def cell_buses(self, cell: tuple[int, int]):
+        """То, что хранится для автобусов ячейки сетки (place), например строки столбцов FleetState."""
+        return self._cells[cell].values()
+
+    def partition(self, bounds) -> tuple[list, list]:
+        """
+        Непустые ячейки, пересекающие окно карты: лежащие внутри окна целиком и лежащие на его границе.
+        :param bounds: Координаты окна карты (WindowBounds).
+        """
+        lat_cells, lng_cells = self.cells(bounds)
+        if len(lat_cells) * len(lng_cells) > len(self._cells):
+            # окно шире занятой части сетки: дешевле перебрать непустые ячейки
+            cells = [
+                cell
+                for cell in self._cells
+                if cell[0] in lat_cells and cell[1] in lng_cells
+            ]
+        else:
+            cells = [
+                (lat_cell, lng_cell)
+                for lat_cell in lat_cells
+                for lng_cell in lng_cells
+                if (lat_cell, lng_cell) in self._cells
+            ]
+
+        inner_lats = range(lat_cells.start + 1, lat_cells.stop - 1)
+        inner_lngs = range(lng_cells.start + 1, lng_cells.stop - 1)
+        inner_cells, edge_cells = [], []
+        for cell in cells:
+            if cell[0] in inner_lats and cell[1] in inner_lngs:
+                inner_cells.append(cell)
+            else:
+                edge_cells.append(cell)
+        return inner_cells, edge_cells
@@ -1,4 +1,6 @@
-from server import Bounds
+import json
+
+from server import BROWSER_MESSAGES, Bounds
 from validators import is_instance_valid
 
 
@@ -29,7 +31,10 @@ async def test_requires_msg_type_specified():
         Bounds,
     )
     assert not is_valid
-    assert 'Тип сообщения должен быть строкой "newBounds".' in message
+    assert json.loads(message) == {
+        'errors': ['185: Тип сообщения должен быть строкой "newBounds".'],
+        'msgType': 'Errors',
+    }
 
 
 async def test_requires_east_lng_type_specified():
@@ -62,3 +67,100 @@ async def test_requires_struct_specified():
         message
         == '{"errors": ["Requires msgType specified"], "msgType": "Errors"}'
     )
+
+
+async def test_protocol_success():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "setProtocol", "data": {"mode": "delta"}}',
+        BROWSER_MESSAGES,
+    )
+    assert is_valid
+
+
+async def test_requires_known_protocol_mode():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "setProtocol", "data": {"mode": "xml"}}',
+        BROWSER_MESSAGES,
+    )
+    assert not is_valid
+    assert json.loads(message)['errors'] == [
+        'xml: Протокол должен быть одной из строк "full", "delta".'
+    ]
+
+
+async def test_requires_known_msg_type():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "newSomething", "data": {}}',
+        BROWSER_MESSAGES,
+    )
+    assert not is_valid
+    assert (
+        message
+        == '{"errors": ["Requires msgType specified"], "msgType": "Errors"}'
+    )
+
+
+async def test_filters_success():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "newFilters", "data": {"routes": ["670к", "120", "120"]}}',
+        BROWSER_MESSAGES,
+    )
+    assert is_valid
+    assert message.data.key() == ('120', '670к')
+
+
+async def test_requires_routes_list():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "newFilters", "data": {"routes": "120"}}',
+        BROWSER_MESSAGES,
+    )
+    assert not is_valid
+    assert 'Маршруты должны быть заданы списком строк.' in message
+
+
+async def test_protocol_with_compression():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "setProtocol", "data": {"mode": "full", "compress": true}}',
+        BROWSER_MESSAGES,
+    )
+    assert is_valid
+    assert message.data.compress
+
+
+async def test_track_query_success():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "getTrack", "data": {"busId": "c790сс", "since": 1700000000}}',
+        BROWSER_MESSAGES,
+    )
+    assert is_valid
+    assert message.data.until is None
+
+
+async def test_requires_finite_bounds():
+    message = (
+        '{"msgType": "newBounds", "data": {"east_lng": 37.65, "north_lat": Infinity, '
+        '"south_lat": 55.72628839374007, "west_lng": 37.54440307617188}}'
+    )
+    is_valid, message = is_instance_valid(message, Bounds)
+    assert not is_valid
+    assert 'Границы карты должны быть конечными числами.' in message
+
+
+async def test_requires_bounds_on_the_map():
+    message = (
+        '{"msgType": "newBounds", "data": {"east_lng": 37.65, "north_lat": 1e17, '
+        '"south_lat": -1e17, "west_lng": 37.54440307617188}}'
+    )
+    is_valid, message = is_instance_valid(message, Bounds)
+    assert not is_valid
+    assert 'Широта границы карты должна быть от -90 до 90.' in message
+
+
+async def test_requires_ordered_bounds():
+    message = (
+        '{"msgType": "newBounds", "data": {"east_lng": 37.54, "north_lat": 55.77, '
+        '"south_lat": 55.72, "west_lng": 37.65}}'
+    )
+    is_valid, message = is_instance_valid(message, Bounds)
+    assert not is_valid
+    assert 'Левая граница карты должна быть не правее правой.' in message
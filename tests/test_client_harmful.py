@@ -1,4 +1,4 @@
-from server import Bus
+from server import BUS_MESSAGES, Bus
 from validators import is_instance_valid
 
 
@@ -44,3 +44,65 @@ async def test_requires_struct_specified():
         message
         == '{"errors": ["Requires msgType specified"], "msgType": "Errors"}'
     )
+
+
+async def test_returns_validated_bus():
+    is_valid, bus = is_instance_valid(
+        '{"busId": "c790сс", "lat": 55.7500, "lng": 37.600, "route": "120"}',
+        Bus,
+    )
+    assert is_valid
+    assert bus == Bus(busId='c790сс', lat=55.75, lng=37.6, route='120')
+
+
+async def test_error_keeps_reason():
+    _, error = is_instance_valid('message', Bus)
+    assert error.reason == 'json'
+
+    _, error = is_instance_valid(
+        '{"busId": "c790сс", "lat": "c55.7500", "lng": 37.600, "route": "120"}',
+        Bus,
+    )
+    assert error.reason == 'value'
+
+
+async def test_batch_success():
+    is_valid, batch = is_instance_valid(
+        '{"msgType": "BusesBatch", "buses": ['
+        '{"busId": "c790сс", "lat": 55.7500, "lng": 37.600, "route": "120"}, '
+        '{"busId": "a134aa", "lat": 55.7494, "lng": 37.621, "route": "670к"}]}',
+        BUS_MESSAGES,
+    )
+    assert is_valid
+    assert [bus.busId for bus in batch.buses] == ['c790сс', 'a134aa']
+
+
+async def test_single_bus_is_accepted_alongside_batches():
+    is_valid, bus = is_instance_valid(
+        '{"busId": "c790сс", "lat": 55.7500, "lng": 37.600, "route": "120"}',
+        BUS_MESSAGES,
+    )
+    assert is_valid
+    assert isinstance(bus, Bus)
+
+
+async def test_batch_requires_valid_buses():
+    is_valid, message = is_instance_valid(
+        '{"msgType": "BusesBatch", "buses": ['
+        '{"busId": "c790сс", "lat": "c55.7500", "lng": 37.600, "route": "120"}]}',
+        BUS_MESSAGES,
+    )
+    assert not is_valid
+    assert (
+        'Географическая широта местоположения автобуса должна быть числом с плавающей точкой.'
+        in message
+    )
+
+
+async def test_requires_finite_coordinates():
+    is_valid, message = is_instance_valid(
+        '{"busId": "c790сс", "lat": NaN, "lng": 37.600, "route": "120"}',
+        BUS_MESSAGES,
+    )
+    assert not is_valid
+    assert 'Координаты автобуса должны быть конечными числами.' in message
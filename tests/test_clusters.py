@@ -0,0 +1,82 @@
+import json
+
+from hub import BusesHub
+from models import Bus, WindowBounds
+
+CITY = WindowBounds(
+    south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+)
+STREET = WindowBounds(
+    south_lat=55.74, north_lat=55.76, west_lng=37.59, east_lng=37.61
+)
+
+
+def fill(hub, number):
+    for i in range(number):
+        hub.update(
+            Bus(
+                busId=f'{i:05d}',
+                lat=55.55 + (i % 40) * 0.01,
+                lng=37.35 + (i // 40 % 50) * 0.01,
+                route=str(i % 7),
+            )
+        )
+    hub.tick()
+
+
+def test_wide_viewport_gets_clusters():
+    hub = BusesHub(cluster_threshold=1000, cluster_span=0.3)
+    fill(hub, 2000)
+
+    message = json.loads(hub.clusters(CITY))
+    assert message['msgType'] == 'BusClusters'
+    assert sum(cluster['count'] for cluster in message['clusters']) == 2000
+    assert len(message['clusters']) <= 25 * 25
+    assert max(len(cluster['routes']) for cluster in message['clusters']) == 3
+    assert hub.clusters(STREET) is None  # вблизи автобусы видны по одному
+
+
+def test_crowded_viewport_gets_clusters():
+    hub = BusesHub(cluster_threshold=100, cluster_span=0)
+    fill(hub, 50)
+    assert hub.clusters(CITY) is None
+
+    fill(hub, 200)
+    assert json.loads(hub.clusters(CITY))['msgType'] == 'BusClusters'
+
+
+def test_cluster_size_does_not_grow_with_buses():
+    hub = BusesHub(cluster_threshold=10)
+    fill(hub, 2000)  # все ячейки заняты
+    small = len(hub.clusters(CITY))
+    fill(hub, 20_000)
+    assert len(hub.clusters(CITY)) < small * 1.5
+
+
+def test_clusters_follow_moved_bus():
+    hub = BusesHub(cluster_threshold=1, cluster_span=0)
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.75, lng=37.6, route='120'))
+    hub.tick()
+    [cluster] = json.loads(hub.clusters(STREET))['clusters']
+    assert cluster == {
+        'lat': 55.75,
+        'lng': 37.6,
+        'count': 2,
+        'routes': ['120'],
+    }
+
+    hub.update(Bus(busId='a134aa', lat=55.7502, lng=37.6, route='670к'))
+    hub.tick()
+    [cluster] = json.loads(hub.clusters(STREET))['clusters']
+    assert cluster['lat'] == 55.7501
+    assert sorted(cluster['routes']) == ['120', '670к']
+
+
+def test_filtered_routes_are_clustered_by_count_only():
+    hub = BusesHub(cluster_threshold=500, cluster_span=0.3)
+    fill(hub, 2000)
+    assert hub.clusters(CITY, ('1',)) is None  # окно широкое, но автобусов маршрута меньше порога
+
+    message = json.loads(hub.clusters(CITY, ('1', '2', '3')))
+    assert sum(cluster['count'] for cluster in message['clusters']) == 858
@@ -0,0 +1,33 @@
+import zlib
+
+from compression import MessageCompressor
+
+
+def test_shared_message_is_compressed_once_per_version():
+    compressor = MessageCompressor(level=6, threshold=100)
+    message = '{"msgType": "Buses", "buses": [%s]}' % (
+        ', '.join(['{"busId": "c790сс", "lat": 55.75}'] * 100),
+    )
+
+    frame = compressor.compress(message, 1)
+    assert zlib.decompress(frame).decode('utf8') == message
+    assert len(frame) < len(message) / 10
+    assert compressor.compress(message, 1) is frame
+    assert compressor.compress(message, 2) is not frame
+    assert len(compressor) == 1
+
+
+def test_own_and_short_messages():
+    compressor = MessageCompressor(level=6, threshold=100)
+    delta = '{"msgType": "BusesDelta", "buses": [%s], "removed": []}' % (
+        ', '.join(['{"busId": "a134aa", "lat": 55.7494}'] * 10),
+    )
+
+    assert zlib.decompress(compressor.compress(delta, 1, False)) == (
+        delta.encode('utf8')
+    )
+    assert not compressor
+    assert compressor.compress('{"msgType": "Buses", "buses": []}', 1) == (
+        '{"msgType": "Buses", "buses": []}'
+    )
+    assert MessageCompressor(level=0).compress(delta * 100, 1) == delta * 100
@@ -0,0 +1,72 @@
+import json
+
+from delta import DeltaEncoder
+from hub import BusesHub
+from models import Bus, WindowBounds
+
+BOUNDS = WindowBounds(
+    south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+)
+
+
+def make_hub(*buses):
+    hub = BusesHub()
+    for bus in buses:
+        hub.update(bus)
+    hub.tick()
+    return hub
+
+
+def test_first_message_is_keyframe():
+    hub = make_hub(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    message = json.loads(DeltaEncoder().encode(hub.visible(BOUNDS)))
+
+    assert message['msgType'] == 'Buses'
+    assert [bus['busId'] for bus in message['buses']] == ['c790сс']
+
+
+def test_delta_contains_only_changes():
+    hub = make_hub(
+        Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+        Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'),
+        Bus(busId='b001bb', lat=55.76, lng=37.65, route='5'),
+    )
+    encoder = DeltaEncoder()
+    encoder.encode(hub.visible(BOUNDS))
+
+    hub.update(Bus(busId='a134aa', lat=55.7495, lng=37.621, route='670к'))
+    hub.update(Bus(busId='b001bb', lat=57.0, lng=37.65, route='5'))
+    hub.update(Bus(busId='d002dd', lat=55.8, lng=37.7, route='7'))
+    hub.tick()
+    message = json.loads(encoder.encode(hub.visible(BOUNDS)))
+
+    assert message['msgType'] == 'BusesDelta'
+    assert sorted(bus['busId'] for bus in message['buses']) == [
+        'a134aa',
+        'd002dd',
+    ]
+    assert message['removed'] == ['b001bb']
+
+
+def test_nothing_is_sent_without_changes():
+    hub = make_hub(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    encoder = DeltaEncoder()
+    encoder.encode(hub.visible(BOUNDS))
+
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.tick()
+    assert encoder.encode(hub.visible(BOUNDS)) is None
+
+
+def test_keyframe_is_repeated():
+    hub = make_hub(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    encoder = DeltaEncoder(keyframe_interval=3)
+    messages = [encoder.encode(hub.visible(BOUNDS)) for _ in range(4)]
+
+    assert [message is not None for message in messages] == [
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert json.loads(messages[3])['msgType'] == 'Buses'
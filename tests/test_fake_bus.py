@@ -0,0 +1,102 @@
+from contextlib import suppress
+
+import trio
+from trio_websocket import ConnectionClosed, serve_websocket
+
+import fake_bus
+from fake_bus import (
+    EmulatorStats,
+    SocketSender,
+    bus_key,
+    dispatch,
+    send_updates,
+)
+
+MESSAGES_NUMBER = 50
+
+
+def test_failed_socket_reconnects_alone(monkeypatch):
+    monkeypatch.setattr(fake_bus, 'RELAUNCH_INTERVAL', 0.01)
+    connections, received = [], []
+    stats = EmulatorStats()
+
+    async def handler(request):
+        ws = await request.accept()
+        number = len(connections)
+        connections.append(ws)
+        with suppress(ConnectionClosed):
+            while True:
+                received.append(await ws.get_message())
+                if number == 0:  # первое соединение обрывается после первого сообщения
+                    await ws.aclose()
+
+    async def main():
+        with trio.fail_after(10):
+            await serve_and_send()
+
+    async def serve_and_send():
+        async with trio.open_nursery() as nursery:
+            server = await nursery.start(
+                serve_websocket, handler, '127.0.0.1', 0, None
+            )
+            send_channel, receive_channel = trio.open_memory_channel(0)
+            async with trio.open_nursery() as emulator:
+                emulator.start_soon(
+                    send_updates,
+                    f'ws://127.0.0.1:{server.port}/ws',
+                    2,
+                    receive_channel,
+                    1,
+                    0,
+                    stats,
+                )
+                await trio.sleep(0.2)
+                for i in range(MESSAGES_NUMBER):
+                    await send_channel.send([f'{{"busId": "{i}"}}'])
+                    await trio.sleep(0.005)
+                await send_channel.aclose()
+            nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+    assert len(connections) == 3  # переподключился только оборванный сокет
+    # пока сокет переподключается, координаты его автобусов отбрасываются, остальные доходят
+    assert stats.dropped < MESSAGES_NUMBER / 2
+    assert len(received) + stats.dropped >= MESSAGES_NUMBER - 2  # еще теряются сообщения в момент обрыва
+    assert stats.updates >= len(received)
+
+
+def test_bus_always_goes_through_one_socket():
+    senders = [SocketSender('ws://127.0.0.1/ws') for _ in range(3)]
+    for sender in senders:
+        sender.is_connected = True
+
+    def updates(step):
+        return [f'{{"busId": "{i}", "lat": {step}}}' for i in range(30)]
+
+    for step in range(3):
+        assert dispatch(senders, updates(step)) == 0
+
+    bus_ids = set()
+    for sender in senders:
+        batches = [sender._receive_channel.receive_nowait() for _ in range(3)]
+        ids = [bus_key(update) for update in batches[0]]
+        assert ids  # по хэшу автобусы разошлись по всем сокетам
+        for step, batch in enumerate(batches):
+            assert batch == [
+                update for update in updates(step) if bus_key(update) in ids
+            ]
+        bus_ids.update(ids)
+    assert len(bus_ids) == 30
+
+
+def test_full_socket_drops_its_buses_only():
+    senders = [
+        SocketSender('ws://127.0.0.1/ws', queue_size=1) for _ in range(2)
+    ]
+    senders[0].is_connected = True  # второй сокет переподключается
+    buses = [f'{{"busId": "{i}"}}' for i in range(20)]
+
+    first = dispatch(senders, buses)
+    assert 0 < first < len(buses)
+    assert dispatch(senders, buses) == len(buses)  # очередь первого сокета заполнена
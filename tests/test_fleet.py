@@ -0,0 +1,119 @@
+import json
+
+import numpy as np
+
+from fleet import FleetState
+from models import Bus, WindowBounds
+
+
+def test_fleet_behaves_like_dict_of_buses():
+    fleet = FleetState()
+    fleet.write(
+        [
+            Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+            Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'),
+        ],
+        0,
+    )
+    fleet.write([Bus(busId='c790сс', lat=55.76, lng=37.6, route='120')], 1)
+
+    assert list(fleet) == ['c790сс', 'a134aa']
+    assert len(fleet) == 2
+    assert 'a134aa' in fleet
+    assert fleet['c790сс'] == Bus(
+        busId='c790сс', lat=55.76, lng=37.6, route='120'
+    )
+    assert fleet.get('b001bb') is None
+
+
+def test_only_moved_buses_are_changed():
+    fleet = FleetState()
+    slots, is_changed = fleet.write(
+        [
+            Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+            Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'),
+        ],
+        0,
+    )
+    assert is_changed.tolist() == [True, True]
+    fragments = fleet.encode(slots)
+
+    slots, is_changed = fleet.write(
+        [
+            Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+            Bus(busId='a134aa', lat=55.7495, lng=37.621, route='670к'),
+        ],
+        5,
+    )
+    assert is_changed.tolist() == [False, True]
+    assert fleet.encode(slots)[0] is fragments[0]
+    assert fleet.updated[slots].tolist() == [5, 5]
+
+    fleet.write([Bus(busId='c790сс', lat=55.75, lng=37.6, route='5')], 6)
+    assert json.loads(fleet.encode(slots[:1])[0]) == {
+        'busId': 'c790сс',
+        'lat': 55.75,
+        'lng': 37.6,
+        'route': '5',
+    }
+
+
+def test_removed_slots_are_reused():
+    fleet = FleetState(capacity=2)
+    for generation in range(10):
+        fleet.write(
+            [
+                Bus(
+                    busId=f'{generation}-{i}',
+                    lat=55.75,
+                    lng=37.6,
+                    route='120',
+                )
+                for i in range(3)
+            ],
+            generation,
+        )
+        for i in range(3):
+            fleet.remove(f'{generation}-{i}')
+
+    assert not fleet
+    assert fleet.capacity == 4
+    assert fleet.route_names == ['120']
+
+
+def test_within_filters_slots_by_bounds():
+    fleet = FleetState()
+    fleet.write(
+        [
+            Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+            Bus(busId='a134aa', lat=55.95, lng=37.6, route='670к'),
+        ],
+        0,
+    )
+    bounds = WindowBounds(
+        south_lat=55.7, north_lat=55.8, west_lng=37.5, east_lng=37.7
+    )
+
+    slots = fleet.within(bounds, np.arange(len(fleet)))
+    assert fleet.bus_ids[slots].tolist() == ['c790сс']
+
+
+def test_route_slots_follow_route_changes():
+    fleet = FleetState()
+    fleet.write(
+        [
+            Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+            Bus(busId='a134aa', lat=55.75, lng=37.6, route='670к'),
+            Bus(busId='b245bb', lat=55.75, lng=37.6, route='120'),
+        ],
+        0,
+    )
+    fleet.write([Bus(busId='c790сс', lat=55.75, lng=37.6, route='670к')], 1)
+    fleet.remove('a134aa')
+
+    def bus_ids(routes):
+        return sorted(fleet.bus_ids[fleet.route_slots(routes)].tolist())
+
+    assert bus_ids(['120']) == ['b245bb']
+    assert bus_ids(['670к']) == ['c790сс']
+    assert bus_ids(['120', '670к', '5']) == ['b245bb', 'c790сс']
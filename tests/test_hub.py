@@ -0,0 +1,264 @@
+import json
+
+from hub import BusesHub
+from models import Bus, BusColumns, WindowBounds
+
+
+def test_version_fans_out_to_every_subscriber():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+
+    with hub.subscribe() as first, hub.subscribe() as second:
+        hub.tick()
+        assert first.receive_nowait() == second.receive_nowait() == 1
+
+
+def test_slow_subscriber_does_not_block_publish():
+    hub = BusesHub(buffer_size=1)
+
+    with hub.subscribe() as slow, hub.subscribe() as fast:
+        for lat in (55.75, 55.76, 55.77):
+            hub.update(Bus(busId='c790сс', lat=lat, lng=37.6, route='120'))
+            hub.tick()
+            assert fast.receive_nowait() == hub.version
+
+        assert slow.receive_nowait() == 1
+        assert slow.statistics().current_buffer_used == 0
+
+
+def test_unchanged_state_is_not_published():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+
+    with hub.subscribe() as subscriber:
+        hub.tick()
+        subscriber.receive_nowait()
+        hub.tick()
+        assert subscriber.statistics().current_buffer_used == 0
+
+    assert not hub._subscribers
+
+
+def test_query_keeps_buses_outside_bounds():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.95, lng=37.6, route='670к'))
+    hub.tick()
+
+    bounds = WindowBounds(
+        south_lat=55.7, north_lat=55.8, west_lng=37.5, east_lng=37.7
+    )
+    assert [bus.busId for bus in hub.query(bounds)] == ['c790сс']
+    assert len(hub.buses) == 2
+
+
+def test_updates_are_applied_on_tick():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='c790сс', lat=55.76, lng=37.6, route='120'))
+    assert not hub.buses
+
+    hub.tick()
+    assert hub.buses['c790сс'].lat == 55.76
+    assert hub.version == 1
+
+
+def test_columns_are_applied_like_buses():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update_columns(
+        BusColumns(['c790сс', 'a001аа'], ['120', '34'], [55.76, 55.7], [37.6, 37.5])
+    )
+    hub.tick()
+
+    assert hub.buses['c790сс'].lat == 55.76
+    assert hub.buses['a001аа'] == Bus(busId='a001аа', lat=55.7, lng=37.5, route='34')
+    assert hub.version == 1
+
+
+def test_payload_is_shared_within_tick():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'))
+    hub.tick()
+
+    bounds = WindowBounds(
+        south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+    )
+    same_bounds = WindowBounds(
+        south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+    )
+    payload = hub.payload(bounds)
+    assert hub.payload(same_bounds) is payload
+
+    message = json.loads(payload)
+    assert message['msgType'] == 'Buses'
+    assert sorted(bus['busId'] for bus in message['buses']) == [
+        'a134aa',
+        'c790сс',
+    ]
+
+
+def test_unmoved_bus_keeps_its_fragment():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'))
+    hub.tick()
+    bounds = WindowBounds(
+        south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+    )
+    hub.payload(bounds)
+    slot = hub.buses.slot('c790сс')
+    fragment = hub.buses.fragments[slot]
+
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.7495, lng=37.621, route='670к'))
+    hub.tick()
+    message = json.loads(hub.payload(bounds))
+
+    assert hub.buses.fragments[slot] is fragment
+    assert {bus['busId']: bus['lat'] for bus in message['buses']} == {
+        'c790сс': 55.75,
+        'a134aa': 55.7495,
+    }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_silent_bus_is_evicted():
+    clock = FakeClock()
+    hub = BusesHub(bus_ttl=10, clock=clock)
+    bounds = WindowBounds(
+        south_lat=55.5, north_lat=56.0, west_lng=37.3, east_lng=37.9
+    )
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'))
+    hub.tick()
+    hub.payload(bounds)
+
+    with hub.subscribe() as subscriber:
+        clock.now = 8
+        hub.update(Bus(busId='a134aa', lat=55.7495, lng=37.621, route='670к'))
+        hub.tick()
+        subscriber.receive_nowait()
+        clock.now = 12
+        hub.tick()
+
+        assert subscriber.receive_nowait() == hub.version
+        assert list(hub.buses) == ['a134aa']
+        assert len(hub.grid) == 1
+        assert 'c790сс' not in hub.payload(bounds)
+
+
+def test_memory_stays_flat_under_emulator_churn():
+    clock = FakeClock()
+    hub = BusesHub(bus_ttl=30, clock=clock)
+    bounds = WindowBounds(
+        south_lat=55.0, north_lat=56.0, west_lng=37.0, east_lng=38.0
+    )
+
+    sizes = []
+    for second in range(3 * 3600):  # три часа, тик в секунду
+        clock.now = float(second)
+        emulator_id = second // 600  # имитатор перезапускается с новым префиксом каждые 10 минут
+        for i in range(10):
+            hub.update(
+                Bus(
+                    busId=f'{emulator_id}-{i}',
+                    lat=55.0 + (second + i) % 97 * 0.01,
+                    lng=37.6,
+                    route='120',
+                )
+            )
+        hub.tick()
+        if second % 60 == 0:
+            hub.payload(bounds)
+        sizes.append(
+            (len(hub.buses), len(hub.grid), len(hub._last_seen), hub.buses.capacity, len(hub.grid._cells))
+        )
+
+    assert max(size[0] for size in sizes) == 20  # старое поколение еще не истекло
+    assert max(sizes[3600:]) == max(sizes[:3600])
+    assert sizes[-1][:3] == (10, 10, 10)
+
+
+def test_nearby_viewports_share_payload():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'))
+    hub.tick()
+
+    bounds = WindowBounds(
+        south_lat=55.72, north_lat=55.77, west_lng=37.54, east_lng=37.65
+    )
+    panned = WindowBounds(
+        south_lat=55.721, north_lat=55.771, west_lng=37.545, east_lng=37.655
+    )
+    payload = hub.payload(bounds)
+    assert hub.payload(panned) is payload
+    assert hub.visible(panned) is hub.visible(bounds)
+
+    hub.update(Bus(busId='c790сс', lat=55.751, lng=37.6, route='120'))
+    hub.tick()
+    assert hub.payload(panned) is not payload
+    assert hub.cached_payloads == 1
+
+
+def test_whole_map_window_is_served():
+    world = WindowBounds(
+        south_lat=-90.0, north_lat=90.0, west_lng=-180.0, east_lng=180.0
+    )
+    for viewport_tiles in (0, 8):
+        hub = BusesHub(viewport_tiles=viewport_tiles, cluster_threshold=1)
+        hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+        hub.update(Bus(busId='a134aa', lat=-33.9, lng=151.2, route='670к'))
+        hub.tick()
+
+        assert json.loads(hub.clusters(world))['msgType'] == 'BusClusters'
+        assert len(json.loads(hub.payload(world))['buses']) == 2
+
+
+def test_viewport_cache_evicts_least_recent():
+    hub = BusesHub(cache_size=2)
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.tick()
+
+    viewports = [
+        WindowBounds(
+            south_lat=55.7 + shift,
+            north_lat=55.8 + shift,
+            west_lng=37.5,
+            east_lng=37.7,
+        )
+        for shift in (0.0, 0.5, 1.0)
+    ]
+    first = hub.payload(viewports[0])
+    hub.payload(viewports[1])
+    assert hub.payload(viewports[0]) is first
+    hub.payload(viewports[2])
+
+    assert hub.cached_payloads == 2
+    assert hub.viewport(viewports[1])[0] not in hub._payloads
+    assert hub.payload(viewports[0]) is first
+
+
+def test_filtered_viewport_gets_only_chosen_routes():
+    hub = BusesHub()
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.update(Bus(busId='a134aa', lat=55.751, lng=37.6, route='670к'))
+    hub.update(Bus(busId='b245bb', lat=55.95, lng=37.6, route='120'))
+    hub.tick()
+    bounds = WindowBounds(
+        south_lat=55.7, north_lat=55.8, west_lng=37.5, east_lng=37.7
+    )
+
+    message = json.loads(hub.payload(bounds, ('120',)))
+    assert [bus['busId'] for bus in message['buses']] == ['c790сс']
+    assert list(hub.visible(bounds, ('670к',))) == ['a134aa']
+    assert len(json.loads(hub.payload(bounds))['buses']) == 2
@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+
+from hub import BusesHub
+from interpolation import RouteGeometry, RouteInterpolator
+from models import Bus
+from route_store import RouteStore
+from tests.test_hub import FakeClock
+from tests.test_route_store import write_route
+
+# прямая на север примерно 1 км и поворот на восток
+ROUTE = [[55.75, 37.6], [55.755, 37.6], [55.76, 37.6], [55.76, 37.61]]
+
+
+def make_geometry(tmp_path):
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    write_route(routes_dir, '120', ROUTE)
+    write_route(  # туда и обратно по одной улице
+        routes_dir, '5', [[55.8, 37.5], [55.81, 37.5], [55.8, 37.5]]
+    )
+    return RouteGeometry(RouteStore.load(str(routes_dir)))
+
+
+def test_projection_and_location_are_inverse(tmp_path):
+    geometry = make_geometry(tmp_path)
+    routes = np.array([0, 0, -1, 0])
+    lat = np.array([55.7525, 55.76, 55.75, 55.9])
+    lng = np.array([37.6001, 37.605, 37.6, 37.6])
+
+    distances = geometry.project(routes, lat, lng)
+    assert math.isclose(distances[0], 0.0025 * geometry.scale[0])
+    assert math.isclose(
+        distances[1], 0.01 * geometry.scale[0] + 0.005 * geometry.scale[1]
+    )
+    assert np.isnan(distances[2:]).all()  # неизвестный маршрут и автобус вдали от маршрута
+
+    lat, lng = geometry.locate(routes[:2], distances[:2])
+    assert np.allclose(lat, [55.7525, 55.76])
+    assert np.allclose(lng, [37.6, 37.605])
+
+
+def test_projection_nearest_to_hint_is_chosen(tmp_path):
+    geometry = make_geometry(tmp_path)
+    length = geometry.lengths[1]
+    routes = np.array([1, 1])
+    lat, lng = np.array([55.805, 55.805]), np.array([37.5, 37.5])
+
+    distances = geometry.project(
+        routes, lat, lng, np.array([0.2 * length, 0.8 * length])
+    )
+    assert np.allclose(distances, [0.25 * length, 0.75 * length])
+
+
+def test_bus_moves_between_reports(tmp_path):
+    clock = FakeClock()
+    hub = BusesHub(
+        clock=clock,
+        interpolator=RouteInterpolator(make_geometry(tmp_path), horizon=2),
+    )
+    hub.update(Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'))
+    hub.tick()
+    clock.now = 1
+    hub.update(Bus(busId='c790сс', lat=55.7502, lng=37.6, route='120'))
+    hub.tick()
+    version = hub.version
+
+    clock.now = 1.5
+    hub.tick()
+    assert hub.version == version + 1
+    assert math.isclose(hub.buses['c790сс'].lat, 55.7503, abs_tol=1e-6)
+
+    clock.now = 5
+    hub.tick()
+    assert math.isclose(hub.buses['c790сс'].lat, 55.7506, abs_tol=1e-6)
+    clock.now = 6
+    hub.tick()
+    assert hub.version == version + 2  # автобус остановился после horizon секунд
+
+
+def test_bus_off_route_stays_in_place(tmp_path):
+    clock = FakeClock()
+    hub = BusesHub(
+        clock=clock,
+        interpolator=RouteInterpolator(make_geometry(tmp_path)),
+    )
+    for second, lat in enumerate((55.9, 55.91)):
+        clock.now = second
+        hub.update(Bus(busId='c790сс', lat=lat, lng=37.6, route='120'))
+        hub.tick()
+
+    clock.now = 1.5
+    hub.tick()
+    assert hub.buses['c790сс'].lat == 55.91
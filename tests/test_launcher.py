@@ -0,0 +1,22 @@
+import asyncclick as click
+import pytest
+
+from launcher import main, shard_routes
+
+
+def test_shards_cover_routes_once():
+    routes = list(range(50))
+    shards = shard_routes(routes, 4)
+
+    assert len(shards) == 4
+    assert sorted(sum(shards, [])) == routes
+
+
+def test_workers_without_routes_are_dropped():
+    assert shard_routes([0, 1], 8) == [[0], [1]]
+
+
+def test_workers_must_be_positive():
+    [workers] = [param for param in main.params if param.name == 'workers']
+    with pytest.raises(click.BadParameter):
+        workers.type.convert(0, workers, None)
@@ -0,0 +1,97 @@
+import socket
+import struct
+
+import pytest
+import trio
+
+from metrics import SIZE_BUCKETS, Counter, Gauge, Histogram, Metric, Registry, serve_metrics
+
+
+def test_metric_needs_samples():
+    with pytest.raises(TypeError):
+        Metric('untyped', 'Без значений.', registry=None)
+
+
+def test_render_prometheus_text():
+    registry = Registry()
+    errors = Counter(
+        'validation_errors_total', 'Ошибки.', ('reason',), registry=registry
+    )
+    browsers = Gauge('browsers_connected', 'Браузеры.', registry=registry)
+    sizes = Histogram(
+        'message_size', 'Размеры.', buckets=SIZE_BUCKETS[:2], registry=registry
+    )
+
+    errors.labels('json').inc()
+    errors.labels('json').inc()
+    errors.labels('value').inc()
+    browsers.set_function(lambda: 3)
+    sizes.observe(100)
+    sizes.observe(2000)
+
+    assert registry.render().splitlines() == [
+        '# HELP validation_errors_total Ошибки.',
+        '# TYPE validation_errors_total counter',
+        'validation_errors_total{reason="json"} 2',
+        'validation_errors_total{reason="value"} 1',
+        '# HELP browsers_connected Браузеры.',
+        '# TYPE browsers_connected gauge',
+        'browsers_connected 3',
+        '# HELP message_size Размеры.',
+        '# TYPE message_size histogram',
+        'message_size_bucket{le="256"} 1',
+        'message_size_bucket{le="1024"} 1',
+        'message_size_bucket{le="+Inf"} 2',
+        'message_size_sum 2100',
+        'message_size_count 2',
+    ]
+
+
+def test_metrics_endpoint():
+    registry = Registry()
+    Counter('bus_messages_total', 'Сообщения.', registry=registry).inc(5)
+
+    async def scrape(path):
+        async with trio.open_nursery() as nursery:
+            listeners = await nursery.start(
+                serve_metrics, '127.0.0.1', 0, registry
+            )
+            port = listeners[0].socket.getsockname()[1]
+            stream = await trio.open_tcp_stream('127.0.0.1', port)
+            await stream.send_all(b'GET %s HTTP/1.1\r\nHost: x\r\n\r\n' % path)
+            response = b''
+            while data := await stream.receive_some():
+                response += data
+            nursery.cancel_scope.cancel()
+        return response.decode('utf8')
+
+    response = trio.run(scrape, b'/metrics')
+    assert response.startswith('HTTP/1.1 200 OK')
+    assert response.endswith('bus_messages_total 5\n')
+    assert trio.run(scrape, b'/').startswith('HTTP/1.1 404')
+
+
+def test_reset_connection_keeps_endpoint_alive():
+    registry = Registry()
+
+    async def reset_and_scrape():
+        async with trio.open_nursery() as nursery:
+            listeners = await nursery.start(
+                serve_metrics, '127.0.0.1', 0, registry
+            )
+            port = listeners[0].socket.getsockname()[1]
+            stream = await trio.open_tcp_stream('127.0.0.1', port)
+            await stream.send_all(b'GET /metr')
+            stream.socket.setsockopt(  # закрытие с RST вместо FIN
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0)
+            )
+            stream.socket.close()
+            await trio.sleep(0.1)
+
+            stream = await trio.open_tcp_stream('127.0.0.1', port)
+            await stream.send_all(b'GET /metrics HTTP/1.1\r\n\r\n')
+            response = await stream.receive_some()
+            nursery.cancel_scope.cancel()
+        return response
+
+    assert trio.run(reset_and_scrape).startswith(b'HTTP/1.1 200 OK')
@@ -0,0 +1,32 @@
+from pacing import SendPacer
+
+
+def test_fast_browser_gets_every_tick():
+    pacer = SendPacer(refresh_timeout=0.2)
+    pacer.record(started=0, finished=0.01)
+
+    assert pacer.interval == 0.2
+    assert pacer.next_send(1) == 1.2
+
+
+def test_slow_browser_backs_off_and_recovers():
+    pacer = SendPacer(refresh_timeout=0.2, max_interval=1)
+    pacer.record(started=0, finished=0.5)
+    assert pacer.interval == 0.5
+    pacer.record(started=1, finished=2)
+    assert pacer.interval == 1
+
+    pacer.record(started=3, finished=3.1)
+    pacer.record(started=4, finished=4.1)
+    pacer.record(started=5, finished=5.1)
+    assert pacer.interval == 0.2
+    assert not pacer.is_behind(6)
+
+
+def test_browser_lagging_too_long_is_behind():
+    pacer = SendPacer(refresh_timeout=0.2, max_interval=1, lag_limit=10)
+    for started in range(0, 12, 2):
+        pacer.record(started=started, finished=started + 2)
+
+    assert not pacer.is_behind(9)
+    assert pacer.is_behind(11)
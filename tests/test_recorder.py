@@ -0,0 +1,95 @@
+import trio
+import trio.testing
+
+from models import Bus, BusColumns
+from recorder import TrafficRecorder, list_segments, read_buses, read_frames
+from replay import replay_frames
+from tests.test_hub import FakeClock
+
+
+def record_batches(directory, batches, segment_size, add=TrafficRecorder.record):
+    clock = FakeClock()
+    recorder = TrafficRecorder(directory, segment_size, clock=clock)
+
+    async def record():
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(recorder.run)
+            for second, buses in enumerate(batches):
+                clock.now = second
+                add(recorder, buses)
+                await trio.sleep(0.5)
+            nursery.cancel_scope.cancel()
+
+    trio.run(record, clock=trio.testing.MockClock(autojump_threshold=0))
+
+
+def make_batches(number):
+    return [
+        [
+            Bus(busId='c790сс', lat=55.75 + i * 0.001, lng=37.6, route='120'),
+            Bus(busId=f'a{i}', lat=55.7494, lng=37.621, route='670к'),
+        ]
+        for i in range(number)
+    ]
+
+
+def test_log_is_read_back_across_segments(tmp_path):
+    batches = make_batches(10)
+    record_batches(str(tmp_path), batches, segment_size=200)
+
+    assert len(list_segments(str(tmp_path))) > 1
+    records = list(read_buses(str(tmp_path)))
+    assert [timestamp for timestamp, _ in records] == list(range(10))
+    assert [buses for _, buses in records] == batches
+
+
+def test_columns_are_recorded_as_buses(tmp_path):
+    def record_columns(recorder, buses):
+        recorder.record_columns(
+            BusColumns(
+                [bus.busId for bus in buses],
+                [bus.route for bus in buses],
+                [bus.lat for bus in buses],
+                [bus.lng for bus in buses],
+            )
+        )
+
+    batches = make_batches(3)
+    record_batches(str(tmp_path), batches, 1000, add=record_columns)
+
+    assert [buses for _, buses in read_buses(str(tmp_path))] == batches
+
+
+def test_new_recorder_appends_segments(tmp_path):
+    record_batches(str(tmp_path), make_batches(2), segment_size=1000)
+    record_batches(str(tmp_path), make_batches(3), segment_size=1000)
+
+    assert len(list_segments(str(tmp_path))) == 2
+    assert len(list(read_buses(str(tmp_path)))) == 5
+
+
+def test_truncated_record_is_skipped(tmp_path):
+    record_batches(str(tmp_path), make_batches(3), segment_size=1000)
+    [segment] = list_segments(str(tmp_path))
+    with open(segment, 'r+b') as file:
+        file.truncate(file.seek(0, 2) - 5)
+
+    assert len(list(read_frames(str(tmp_path)))) == 2
+
+
+def test_replay_keeps_intervals(tmp_path):
+    record_batches(str(tmp_path), make_batches(5), segment_size=1000)
+
+    async def replay(speed):
+        sent = []
+
+        async def send_message(frame):
+            sent.append(trio.current_time())
+
+        await replay_frames(send_message, read_frames(str(tmp_path)), speed)
+        return [moment - sent[0] for moment in sent]
+
+    clock = trio.testing.MockClock(autojump_threshold=0)
+    assert trio.run(replay, 1, clock=clock) == [0, 1, 2, 3, 4]
+    assert trio.run(replay, 4, clock=clock) == [0, 0.25, 0.5, 0.75, 1]
+    assert trio.run(replay, 0, clock=clock) == [0, 0, 0, 0, 0]
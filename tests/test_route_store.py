@@ -0,0 +1,50 @@
+import json
+import os
+
+import numpy as np
+
+from route_store import RouteStore
+
+
+def write_route(directory, name, coordinates):
+    route = {
+        'name': name,
+        'station_start_name': 'Начало',
+        'station_stop_name': 'Конец',
+        'coordinates': coordinates,
+        'stations': [[[str(lat), str(lng)], 'Остановка'] for lat, lng in coordinates[:1]],
+    }
+    with open(os.path.join(directory, f'{name}.json'), 'w', encoding='utf8') as f:
+        json.dump(route, f, ensure_ascii=False)
+
+
+def test_store_matches_json(tmp_path):
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    write_route(routes_dir, '120', [[55.1, 37.1], [55.2, 37.2]])
+    write_route(routes_dir, '670к', [[55.3, 37.3]])
+
+    store = RouteStore.load(str(routes_dir))
+
+    assert store.names == ['120', '670к']
+    assert store.coordinates(0).tolist() == [[55.1, 37.1], [55.2, 37.2]]
+    assert store.route(1)['stations'] == [[[55.3, 37.3], 'Остановка']]
+    assert not store.coordinates(1).flags.writeable
+    assert isinstance(store.coordinates(1), np.ndarray)
+    assert store.coordinate_texts(0).tolist() == [
+        b'"lat": 55.1, "lng": 37.1}',
+        b'"lat": 55.2, "lng": 37.2}',
+    ]
+
+
+def test_store_is_rebuilt_when_routes_change(tmp_path):
+    routes_dir = tmp_path / 'routes'
+    routes_dir.mkdir()
+    write_route(routes_dir, '120', [[55.1, 37.1]])
+    assert len(RouteStore.load(str(routes_dir))) == 1
+
+    write_route(routes_dir, '5', [[55.5, 37.5], [55.6, 37.6]])
+    store = RouteStore.load(str(routes_dir))
+
+    assert store.names == ['120', '5']
+    assert store.coordinates(1).tolist() == [[55.5, 37.5], [55.6, 37.6]]
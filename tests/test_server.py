@@ -0,0 +1,121 @@
+import trio
+import trio.testing
+
+import server
+from hub import BusesHub
+from models import Bus, BusColumns, WindowBounds
+from pacing import SendPacer
+from server import BrowserSession, observe_ingest, send_buses, talk_to_browser
+
+
+class StalledSocket:
+    """Web-сокет браузера, который перестал забирать сообщения"""
+
+    def __init__(self):
+        self.sent = 0
+        self.closed = False
+
+    async def send_message(self, message):
+        self.sent += 1
+        await trio.sleep_forever()
+
+    async def aclose(self):
+        self.closed = True
+
+
+class BrokenSocket:
+    """Web-сокет браузера, отправка в который падает с неожиданной ошибкой"""
+
+    def __init__(self):
+        self.closed = False
+        self.messages = [
+            '{"msgType": "newBounds", "data": {"south_lat": 55.0, "north_lat": 56.0, '
+            '"west_lng": 37.0, "east_lng": 38.0}}'
+        ]
+
+    async def get_message(self):
+        if self.messages:
+            return self.messages.pop()
+        await trio.sleep_forever()
+
+    async def send_message(self, message):
+        raise RuntimeError('сбой отправки')
+
+    async def aclose(self):
+        self.closed = True
+
+
+class Request:
+    def __init__(self, ws):
+        self.ws = ws
+
+    async def accept(self):
+        return self.ws
+
+
+def test_browser_error_does_not_reach_server(monkeypatch):
+    hub = BusesHub()
+    monkeypatch.setattr(server, 'hub', hub)
+    ws = BrokenSocket()
+
+    async def main():
+        with trio.fail_after(60):
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(talk_to_browser, Request(ws))
+                await trio.testing.wait_all_tasks_blocked()
+                hub.update(
+                    Bus(busId='c790сс', lat=55.75, lng=37.6, route='120')
+                )
+                hub.tick()
+
+    trio.run(main, clock=trio.testing.MockClock(autojump_threshold=0))
+
+    assert ws.closed
+
+
+def test_ingest_counters_reach_metrics(monkeypatch):
+    recorded = []
+
+    class Recorder:
+        def record_columns(self, columns):
+            recorded.append(columns)
+
+    monkeypatch.setattr(server, 'recorder', Recorder())
+    messages = server.bus_messages.value
+    updates = server.bus_updates.value
+    json_errors = server.validation_errors.labels('bus', 'json').value
+    columns = BusColumns(['c790сс'], ['120'], [55.75], [37.6])
+
+    observe_ingest(
+        columns, {'messages': 3, 'json': 2, 'structure': 0, 'value': 0}
+    )
+
+    assert server.bus_messages.value == messages + 3
+    assert server.bus_updates.value == updates + 1
+    assert server.validation_errors.labels('bus', 'json').value == json_errors + 2
+    assert recorded == [columns]
+
+
+def test_interrupted_send_closes_browser(monkeypatch):
+    hub = BusesHub()
+    monkeypatch.setattr(server, 'hub', hub)
+    session = BrowserSession(
+        bounds=WindowBounds(55.0, 56.0, 37.0, 38.0),
+        pacer=SendPacer(1, lag_limit=5),
+    )
+    ws = StalledSocket()
+
+    async def main():
+        with trio.fail_after(60):
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(send_buses, ws, session)
+                await trio.testing.wait_all_tasks_blocked()
+                hub.update(
+                    Bus(busId='c790сс', lat=55.75, lng=37.6, route='120')
+                )
+                hub.tick()
+
+    trio.run(main, clock=trio.testing.MockClock(autojump_threshold=0))
+
+    assert ws.sent == 1  # в сокет с недописанным кадром больше ничего не пишется
+    assert ws.closed
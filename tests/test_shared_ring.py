@@ -0,0 +1,64 @@
+import pytest
+
+from models import Bus
+from shared_ring import COUNTERS, SharedRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing(capacity=4)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def make_buses(count, start=0):
+    return [
+        Bus(f'{i}-а', 55.0 + i, 37.0 + i, '670к') for i in range(start, start + count)
+    ]
+
+
+def test_ring_wraps_around(ring):
+    reader = SharedRing(capacity=4, name=ring.name)
+
+    assert ring.write(SharedRing.encode(make_buses(3))) == 3
+    assert SharedRing.decode(reader.read()) == make_buses(3)
+
+    assert ring.write(SharedRing.encode(make_buses(5, start=3))) == 4
+    assert len(reader) == 4
+    assert SharedRing.decode(reader.read()) == make_buses(4, start=3)
+    assert reader.read().size == 0
+
+    reader.close()
+
+
+def test_ring_rejects_long_bus_id():
+    with pytest.raises(ValueError):
+        SharedRing.encode([Bus('x' * 33, 55.0, 37.0, '120')])
+
+
+def test_columns_match_decoded_buses(ring):
+    ring.write(SharedRing.encode(make_buses(3)))
+    columns = SharedRing.columns(ring.read())
+
+    assert len(columns) == 3
+    assert columns.bus_ids == [bus.busId for bus in make_buses(3)]
+    assert columns.routes == ['670к'] * 3
+    assert columns.lat == [bus.lat for bus in make_buses(3)]
+    assert columns.lng == [bus.lng for bus in make_buses(3)]
+
+
+def test_counters_are_taken_as_increments(ring):
+    reader = SharedRing(capacity=4, name=ring.name)
+
+    ring.count('messages', 3)
+    ring.count('json')
+    assert reader.take_counters() == {
+        'messages': 3, 'json': 1, 'structure': 0, 'value': 0
+    }
+
+    ring.count('messages')
+    assert reader.take_counters() == dict(dict.fromkeys(COUNTERS, 0), messages=1)
+    assert not any(reader.take_counters().values())
+
+    reader.close()
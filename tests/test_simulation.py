@@ -0,0 +1,55 @@
+import trio
+
+from hub import BusesHub
+from simulation import run_simulation
+
+ROUTES = [
+    {
+        'name': str(number),
+        'coordinates': [
+            [55.70 + number / 100 + step / 1000, 37.50 + step / 1000]
+            for step in range(50)
+        ],
+    }
+    for number in range(5)
+]
+
+
+def test_simulation_is_repeatable():
+    first = run_simulation(ROUTES, 600, seed=1, batch_latency=0)
+    second = run_simulation(ROUTES, 600, seed=1, batch_latency=0)
+
+    assert first == second
+    assert first.versions == 600
+    assert first.messages == 600 * 10
+    # координаты в момент последнего тика попадают в него, а первые отбрасываются, пока сокет подключается
+    assert first.updates + first.dropped == 601 * first.buses
+    assert first.dropped == first.buses
+    assert run_simulation(ROUTES, 600, seed=2).digest != first.digest
+
+
+def test_binary_encoding_gives_same_messages():
+    json_report = run_simulation(ROUTES, 60, encoding='json')
+    binary_report = run_simulation(ROUTES, 60, encoding='binary')
+
+    assert binary_report.digest == json_report.digest
+
+
+def test_configured_hub_expires_buses_in_virtual_time():
+    hub = BusesHub(clock=trio.current_time, bus_ttl=5)
+    report = run_simulation(ROUTES, 3600, bus_refresh=10, hub=hub)
+
+    assert report.buses == 0  # координаты приходят реже, чем автобусы живут на карте
+    assert report.versions > 360
+
+
+def test_browsers_get_server_protocols():
+    full = run_simulation(ROUTES, 60, websockets_number=3)
+    delta = run_simulation(
+        ROUTES, 60, websockets_number=3, protocol='delta', compress=True
+    )
+
+    assert full.updates == delta.updates
+    assert full.invalid == delta.invalid == 0
+    assert full.messages == delta.messages == 60 * 10
+    assert full.digest != delta.digest  # браузеры delta получают изменения, а не полный список
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+
+from route_store import point_texts
+from simulator import FleetSimulator
+
+
+def make_simulator():
+    simulator = FleetSimulator()
+    route = simulator.add_route('120', [[55.1, 37.1], [55.2, 37.2], [55.3, 37.3]])
+    simulator.add_bus(route, '120-000', 0)
+    simulator.add_bus(route, '120-001', 4)
+    return simulator
+
+
+def test_fragments_are_bus_messages():
+    fragments = make_simulator().fragments()
+
+    assert [json.loads(fragment) for fragment in fragments] == [
+        {'busId': '120-000', 'route': '120', 'lat': 55.1, 'lng': 37.1},
+        {'busId': '120-001', 'route': '120', 'lat': 55.2, 'lng': 37.2},
+    ]
+
+
+def test_buses_drive_there_and_back():
+    simulator = make_simulator()
+    lats = []
+    for _ in range(7):
+        lats.append(simulator.positions()[0, 0])
+        simulator.step()
+
+    assert lats == [55.1, 55.2, 55.3, 55.3, 55.2, 55.1, 55.1]
+
+
+def test_bus_added_after_step_keeps_phases():
+    simulator = make_simulator()
+    simulator.step()
+    route = simulator.add_route('5', [[56.0, 38.0]])
+    simulator.add_bus(route, '5-000', 0)
+
+    assert simulator.positions().tolist() == [
+        [55.2, 37.2],
+        [55.1, 37.1],
+        [56.0, 38.0],
+    ]
+
+
+def test_routes_of_one_array_are_not_copied():
+    points = np.array(
+        [[55.1, 37.1], [55.2, 37.2], [55.3, 37.3], [56.0, 38.0], [56.1, 38.1]]
+    )
+    simulator = FleetSimulator()
+    first = simulator.add_route('120', points[:3])
+    second = simulator.add_route('5', points[3:])
+    simulator.add_bus(first, '120-000', 2)
+    simulator.add_bus(second, '5-000', 3)
+
+    lats = []
+    for _ in range(4):
+        lats.append(simulator.positions()[:, 0].tolist())
+        simulator.step()
+
+    assert np.shares_memory(simulator.points, points)
+    assert lats == [[55.3, 56.0], [55.3, 56.0], [55.2, 56.1], [55.1, 56.1]]
+
+
+def test_prepared_texts_are_not_copied():
+    points = np.array([[55.1, 37.1], [55.2, 37.2], [56.0, 38.0]])
+    texts = point_texts(points)
+    simulator = FleetSimulator()
+    first = simulator.add_route('120', points[:2], texts[:2])
+    second = simulator.add_route('5', points[2:], texts[2:])
+    simulator.add_bus(first, '120-000', 3)
+    simulator.add_bus(second, '5-000', 0)
+
+    assert [json.loads(fragment) for fragment in simulator.fragments()] == [
+        {'busId': '120-000', 'route': '120', 'lat': 55.1, 'lng': 37.1},
+        {'busId': '5-000', 'route': '5', 'lat': 56.0, 'lng': 38.0},
+    ]
+    assert np.shares_memory(simulator.point_texts, texts)
@@ -0,0 +1,89 @@
+import random
+
+from hub import BusesHub
+from models import Bus, WindowBounds
+from spatial import GridIndex, snap_bounds, tile_zoom
+
+
+def test_slots_match_linear_filter():
+    rnd = random.Random(1)
+    hub = BusesHub()
+    buses = {}
+    for i in range(2000):
+        bus = Bus(
+            busId=str(i),
+            lat=rnd.uniform(55.5, 56.0),
+            lng=rnd.uniform(37.3, 37.9),
+            route='120',
+        )
+        buses[bus.busId] = bus
+        hub.update(bus)
+    hub.tick()
+
+    for _ in range(50):
+        south, north = sorted(rnd.uniform(55.4, 56.1) for _ in range(2))
+        west, east = sorted(rnd.uniform(37.2, 38.0) for _ in range(2))
+        bounds = WindowBounds(
+            south_lat=south, north_lat=north, west_lng=west, east_lng=east
+        )
+        expected = {
+            bus.busId
+            for bus in buses.values()
+            if bounds.is_inside(lat=bus.lat, lng=bus.lng)
+        }
+        slots = hub.slots(bounds).tolist()
+        assert len(slots) == len(expected)
+        assert set(hub.buses.bus_ids[slots]) == expected
+
+
+def test_moved_bus_changes_cell():
+    grid = GridIndex(cell_size=0.1)
+    grid.place('c790сс', 55.75, 37.61, 0)
+    grid.place('c790сс', 55.95, 37.61, 0)
+
+    old_place = WindowBounds(
+        south_lat=55.7, north_lat=55.8, west_lng=37.6, east_lng=37.7
+    )
+    new_place = WindowBounds(
+        south_lat=55.9, north_lat=56.0, west_lng=37.6, east_lng=37.7
+    )
+    assert grid.partition(old_place) == ([], [])
+    inner_cells, edge_cells = grid.partition(new_place)
+    assert inner_cells + edge_cells == [grid.locate('c790сс')]
+    assert list(grid.cell_buses(grid.locate('c790сс'))) == [0]
+
+    grid.remove('c790сс')
+    assert not len(grid)
+    assert not grid._cells
+
+
+def test_nearby_viewports_snap_to_same_tiles():
+    bounds = WindowBounds(
+        south_lat=55.72, north_lat=55.77, west_lng=37.54, east_lng=37.65
+    )
+    panned = WindowBounds(
+        south_lat=55.721, north_lat=55.771, west_lng=37.545, east_lng=37.655
+    )
+    zoomed_in = WindowBounds(
+        south_lat=55.74, north_lat=55.75, west_lng=37.59, east_lng=37.61
+    )
+
+    key, snapped = snap_bounds(bounds)
+    assert snap_bounds(panned)[0] == key
+    assert snap_bounds(zoomed_in)[0][:2] > key[:2]
+    assert snapped.south_lat <= bounds.south_lat
+    assert snapped.north_lat >= bounds.north_lat
+    assert snapped.west_lng <= bounds.west_lng
+    assert snapped.east_lng >= bounds.east_lng
+    assert key[4] - key[2] <= 8 and key[5] - key[3] <= 8
+
+
+def test_whole_map_snaps_inside_the_map():
+    _, snapped = snap_bounds(
+        WindowBounds(
+            south_lat=-90.0, north_lat=90.0, west_lng=-180.0, east_lng=180.0
+        )
+    )
+    assert snapped == WindowBounds(-90.0, 90.0, -180.0, 180.0)
+    assert tile_zoom(float('inf'), 8) == 0
+    assert tile_zoom(float('nan'), 8) == tile_zoom(0, 8)
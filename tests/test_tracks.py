@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+from hub import BusesHub
+from models import Bus
+from tests.test_hub import FakeClock
+from tracks import TrackStore
+
+
+def test_ring_keeps_last_points_in_order():
+    tracks = TrackStore(length=4, interval=1)
+    slots = np.array([0, 2])
+    for second in range(6):
+        tracks.record(
+            slots,
+            np.array([55.0 + second, 56.0 + second]),
+            np.array([37.0, 38.0]),
+            second,
+        )
+
+    times, lat, lng = tracks.track(0)
+    assert times.tolist() == [2, 3, 4, 5]
+    assert lat.tolist() == [57, 58, 59, 60]
+    assert tracks.track(0, since=2.5, until=4)[0].tolist() == [3, 4]
+    assert tracks.track(2, since=4.5)[1].tolist() == [61]
+    assert not len(tracks.track(1)[0])
+
+
+def test_points_are_thinned_by_interval():
+    tracks = TrackStore(length=10, interval=5)
+    for second in range(12):
+        tracks.record(np.array([0]), np.array([55.75]), np.array([37.6]), second)
+
+    assert tracks.track(0)[0].tolist() == [0, 5, 10]
+
+
+def test_hub_answers_track_and_forgets_evicted_bus():
+    clock = FakeClock()
+    hub = BusesHub(clock=clock, bus_ttl=10, tracks=TrackStore(interval=1))
+    for second in range(3):
+        clock.now = second
+        hub.update(
+            Bus(busId='c790сс', lat=55.75 + second / 100, lng=37.6, route='120')
+        )
+        hub.tick()
+
+    message = json.loads(hub.track('c790сс', since=101, offset=100))
+    assert message == {
+        'msgType': 'Track',
+        'busId': 'c790сс',
+        'points': [[101, 55.76, 37.6], [102, 55.77, 37.6]],
+    }
+
+    clock.now = 20
+    hub.tick()
+    assert json.loads(hub.track('c790сс'))['points'] == []
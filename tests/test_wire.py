@@ -0,0 +1,61 @@
+import json
+
+from models import Bus
+from wire import INVALID_FRAME, WireDecoder, WireEncoder, decode_bus_message
+
+RECORDS = [
+    ('c790сс', '120', 55.75, 37.6),
+    ('a134aa', '670к', 55.7494, 37.621),
+]
+
+
+def test_binary_frame_round_trip():
+    encoder, decoder = WireEncoder(), WireDecoder()
+
+    is_valid, buses = decoder.decode(encoder.encode(RECORDS))
+
+    assert is_valid
+    assert buses == [
+        Bus(busId='c790сс', lat=55.75, lng=37.6, route='120'),
+        Bus(busId='a134aa', lat=55.7494, lng=37.621, route='670к'),
+    ]
+
+
+def test_names_are_sent_once_per_connection():
+    encoder, decoder = WireEncoder(), WireDecoder()
+    first = encoder.encode(RECORDS)
+    second = encoder.encode([('a134aa', '670к', 55.75, 37.622)])
+
+    assert len(second) < len(first) / 2
+    decoder.decode(first)
+    is_valid, buses = decoder.decode(second)
+    assert is_valid
+    assert buses == [Bus(busId='a134aa', lat=55.75, lng=37.622, route='670к')]
+
+
+def test_unknown_slot_is_rejected():
+    encoder = WireEncoder()
+    encoder.encode(RECORDS)
+    frame = encoder.encode(RECORDS)
+
+    is_valid, error = WireDecoder().decode(frame)
+    assert not is_valid
+    assert error.reason == 'value'
+
+
+def test_truncated_frame_is_rejected():
+    frame = WireEncoder().encode(RECORDS)
+
+    assert WireDecoder().decode(frame[:-1]) == (False, INVALID_FRAME)
+    assert WireDecoder().decode(b'\x01') == (False, INVALID_FRAME)
+
+
+def test_json_messages_are_still_accepted():
+    message = json.dumps(
+        {'busId': 'c790сс', 'lat': 55.75, 'lng': 37.6, 'route': '120'}
+    )
+
+    is_valid, buses = decode_bus_message(message, WireDecoder())
+
+    assert is_valid
+    assert buses == [Bus(busId='c790сс', lat=55.75, lng=37.6, route='120')]
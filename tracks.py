@@ -0,0 +1,129 @@
+"""Недавние пути автобусов: кольцевые буферы точек в столбцах NumPy"""
+
+import json
+
+import numpy as np
+
+TRACK_LENGTH = 120  # Сколько последних точек пути помнит каждый автобус.
+TRACK_INTERVAL = 5  # Не чаще скольких секунд записывается точка пути одного автобуса.
+
+
+def join_track(bus_id: str, times, lat, lng) -> str:
+    """
+    Собирает сообщение Track из точек пути автобуса: [время, широта, долгота] от старых к новым.
+    Координаты хранятся в float32, поэтому в сообщении у них 5 знаков после запятой (около метра).
+    """
+    return '{"msgType": "Track", "busId": %s, "points": [%s]}' % (
+        json.dumps(bus_id, ensure_ascii=False),
+        ', '.join(
+            '[%.3f, %.5f, %.5f]' % point
+            for point in zip(times.tolist(), lat.tolist(), lng.tolist())
+        ),
+    )
+
+
+class TrackStore:
+    """
+    Пути автобусов за последние минуты.
+    У каждой строки столбцов FleetState свое кольцо из length точек (время, широта, долгота) в двумерных
+    массивах, поэтому память не зависит от того, как часто приходят координаты: length * 16 байт на автобус.
+    Точки записываются раз в тик одним проходом по массивам для всех автобусов с новыми координатами,
+    но не чаще interval секунд для одного автобуса. Время в кольце растет, так что запрос пути за промежуток
+    времени - два двоичных поиска по двум упорядоченным половинам кольца.
+    """
+
+    def __init__(
+        self,
+        length: int = TRACK_LENGTH,
+        interval: float = TRACK_INTERVAL,
+        capacity: int = 0,
+    ):
+        """
+        :param length: Сколько последних точек пути помнит каждый автобус.
+        :param interval: Не чаще скольких секунд записывать точку пути одного автобуса.
+        :param capacity: Начальная емкость столбцов в автобусах.
+        """
+        self.length = length
+        self.interval = interval
+        self.times = np.zeros((capacity, length), dtype=np.float64)
+        self.lat = np.zeros((capacity, length), dtype=np.float32)
+        self.lng = np.zeros((capacity, length), dtype=np.float32)
+        self.heads = np.zeros(capacity, dtype=np.int32)  # куда пишется следующая точка
+        self.counts = np.zeros(capacity, dtype=np.int32)  # сколько точек в кольце
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self.heads):
+            return
+        grown = max(capacity, len(self.heads) * 2)
+        for name in ('times', 'lat', 'lng', 'heads', 'counts'):
+            column = getattr(self, name)
+            new_column = np.zeros((grown,) + column.shape[1:], column.dtype)
+            new_column[:len(column)] = column
+            setattr(self, name, new_column)
+
+    def forget(self, slot: int):
+        """Стирает путь убранного автобуса: строка достанется другому автобусу."""
+        if slot < len(self.counts):
+            self.heads[slot] = 0
+            self.counts[slot] = 0
+
+    def record(
+        self,
+        slots: np.ndarray,
+        lat: np.ndarray,
+        lng: np.ndarray,
+        now: float,
+    ):
+        """
+        Дописывает точки в кольца автобусов, у которых последняя точка старше interval секунд.
+        :param slots: Строки автобусов в столбцах FleetState, без повторов.
+        :param lat: Широты автобусов.
+        :param lng: Долготы автобусов.
+        :param now: Время координат.
+        """
+        if not len(slots):
+            return
+        self._reserve(int(slots.max()) + 1)
+        heads = self.heads[slots]
+        last = self.times[slots, (heads - 1) % self.length]
+        due = (self.counts[slots] == 0) | (now - last >= self.interval)
+        slots, heads = slots[due], heads[due]
+
+        self.times[slots, heads] = now
+        self.lat[slots, heads] = lat[due]
+        self.lng[slots, heads] = lng[due]
+        self.heads[slots] = (heads + 1) % self.length
+        self.counts[slots] = np.minimum(self.counts[slots] + 1, self.length)
+
+    def track(
+        self,
+        slot: int,
+        since: float = -np.inf,
+        until: float = np.inf,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Точки пути автобуса со временем от since до until включительно, от старых к новым.
+        :return: кортеж из массивов времени, широт и долгот.
+        """
+        if slot >= len(self.counts) or not self.counts[slot]:
+            empty = np.zeros(0)
+            return empty, empty, empty
+
+        head, count = int(self.heads[slot]), int(self.counts[slot])
+        # кольцо - две упорядоченные половины: от самой старой точки до конца и от начала до head
+        if count < self.length:
+            parts = [slice(0, head)]
+        else:
+            parts = [slice(head, self.length), slice(0, head)]
+
+        times, rows = self.times[slot], []
+        for part in parts:
+            start = np.searchsorted(times[part], since, side='left')
+            stop = np.searchsorted(times[part], until, side='right')
+            rows.append(np.arange(part.start + start, part.start + stop))
+        rows = np.concatenate(rows)
+        return (
+            times[rows],
+            self.lat[slot, rows].astype(np.float64),
+            self.lng[slot, rows].astype(np.float64),
+        )
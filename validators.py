@@ -1,31 +1,49 @@
 import json
-from dataclasses import dataclass
-from typing import Any
 
 
-def is_instance_valid(message: str, instance_type: dataclass) -> (bool, str):
+class ValidationError(str):
+    """
+    Описание ошибки валидации: строка сообщения Errors, которую можно сразу отправить по web-сокету.
+    Причина ошибки хранится в атрибуте reason: json - строка не является JSON, structure - структура
+    не подходит к типу, value - значение поля не прошло проверку.
+    """
+
+    def __new__(cls, reason: str, description: str):
+        error = super().__new__(
+            cls,
+            json.dumps(
+                {'errors': [description], 'msgType': 'Errors'},
+                ensure_ascii=False,
+            ),
+        )
+        error.reason = reason
+        return error
+
+
+INVALID_JSON = ValidationError('json', 'Requires valid JSON')
+INVALID_STRUCTURE = ValidationError('structure', 'Requires msgType specified')
+
+
+def is_instance_valid(message: str, instance_type: type | dict[str, type]):
     """
     Проверяем полученную строку на валидность преобразования в json
-    и на то, что полученный json имеет структуру для создания экземпляра класса, переданного в instance_type
+    и на то, что полученный json имеет структуру для создания экземпляра класса, переданного в instance_type.
+    Строка разбирается один раз, созданный при проверке экземпляр возвращается вызывающему.
     :param message: строка для преобразования
-    :param instance_type: тип, к которому будет приведена строка
-    :return: кортеж из результата валидации (ЛОЖЬ/ИСТИНА) и строки. Строка содержит описание ошибку, если первый
-    элемент кортежа ЛОЖЬ или исходную строку в случае успешной валидации.
+    :param instance_type: тип, к которому будет приведена строка, или словарь типов по значению поля msgType
+    (ключ None - тип для сообщений без msgType)
+    :return: кортеж из результата валидации (ЛОЖЬ/ИСТИНА) и результата: экземпляра instance_type в случае успешной
+    валидации или описания ошибки (ValidationError), если первый элемент кортежа ЛОЖЬ.
     """
 
     try:
-        instance_type(**json.loads(message))
+        data = json.loads(message)
+        if isinstance(instance_type, dict):
+            instance_type = instance_type[data.get('msgType')]
+        return True, instance_type(**data)
     except json.JSONDecodeError:
-        return (
-            False,
-            '{"errors": ["Requires valid JSON"], "msgType": "Errors"}',
-        )
-    except TypeError:
-        return (
-            False,
-            '{"errors": ["Requires msgType specified"], "msgType": "Errors"}',
-        )
+        return False, INVALID_JSON
+    except (TypeError, KeyError, AttributeError):
+        return False, INVALID_STRUCTURE
     except ValueError as e:
-        return False, '{"errors": ["%s"], "msgType": "Errors"}' % (str(e),)
-
-    return True, message
+        return False, ValidationError('value', str(e))
@@ -0,0 +1,154 @@
+"""
+Бинарный формат координат автобусов от имитатора.
+Кадр - бинарное сообщение web-сокета: заголовок, затем определения новых автобусов и координаты.
+Номер автобуса и маршрута передаются по соединению один раз: определение связывает их с номером ячейки
+словаря соединения, дальше координаты автобуса ссылаются на ячейку. Все числа - little-endian.
+
+    заголовок:   версия (u8), резерв (u8), количество определений (u16), количество координат (u32)
+    определение: ячейка (u32), длина busId (u8), длина route (u8), busId и route в UTF-8
+    координаты:  ячейка (u32), lat (f64), lng (f64)
+"""
+
+import struct
+
+import numpy as np
+
+from models import BUS_MESSAGES, Bus, BusesBatch
+from validators import ValidationError, is_instance_valid
+
+WIRE_VERSION = 1
+HEADER = struct.Struct('<BBHI')
+DEFINITION = struct.Struct('<IBB')
+UPDATE = np.dtype([('slot', '<u4'), ('lat', '<f8'), ('lng', '<f8')])
+MAX_DEFINITIONS = 65535  # столько определений помещается в один кадр
+
+INVALID_FRAME = ValidationError('structure', 'Requires valid binary frame')
+INVALID_COORDINATES = ValidationError('value', 'Requires finite coordinates')
+
+
+class WireEncoder:
+    """Кодировщик кадров для одного соединения: помнит, какие автобусы уже определены на сервере."""
+
+    def __init__(self):
+        self._slots = dict()  # (busId, route) -> ячейка словаря соединения
+
+    def encode(self, records: list[tuple[str, str, float, float]]) -> bytes:
+        """
+        Кадр с координатами автобусов. Если номер автобуса или маршрута длиннее 255 байт,
+        вызывает ValueError.
+        :param records: Координаты автобусов: кортежи (busId, route, lat, lng). Определений новых
+        автобусов должно быть не больше MAX_DEFINITIONS.
+        """
+        definitions = []
+        updates = []
+        new_slots = dict()  # попадают в словарь, только если кадр собран целиком
+        for bus_id, route, lat, lng in records:
+            key = (bus_id, route)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = new_slots.get(key)
+            if slot is None:
+                slot = new_slots[key] = len(self._slots) + len(new_slots)
+                definitions.append(self._define(slot, bus_id, route))
+            updates.append((slot, lat, lng))
+
+        if len(definitions) > MAX_DEFINITIONS:
+            raise ValueError(
+                f'{len(definitions)}: В кадре может быть не больше {MAX_DEFINITIONS} новых автобусов.'
+            )
+        frame = b''.join(
+            [
+                HEADER.pack(WIRE_VERSION, 0, len(definitions), len(updates)),
+                *definitions,
+                np.array(updates, dtype=UPDATE).tobytes(),
+            ]
+        )
+        self._slots.update(new_slots)
+        return frame
+
+    @staticmethod
+    def _define(slot: int, bus_id: str, route: str) -> bytes:
+        encoded_id, encoded_route = bus_id.encode('utf8'), route.encode('utf8')
+        if len(encoded_id) > 255 or len(encoded_route) > 255:
+            raise ValueError(
+                f'{bus_id}: Номер автобуса и маршрута должны быть не длиннее 255 байт.'
+            )
+        return (
+            DEFINITION.pack(slot, len(encoded_id), len(encoded_route))
+            + encoded_id
+            + encoded_route
+        )
+
+
+class WireDecoder:
+    """Декодировщик кадров для одного соединения: словарь автобусов, определенных имитатором."""
+
+    def __init__(self):
+        self._slots = dict()  # ячейка -> (busId, route)
+
+    def decode(self, frame: bytes):
+        """
+        Разбирает кадр.
+        :return: кортеж из результата разбора (ЛОЖЬ/ИСТИНА) и списка автобусов или описания ошибки
+        (ValidationError), как is_instance_valid.
+        """
+        try:
+            version, _, definitions, updates = HEADER.unpack_from(frame)
+            if version != WIRE_VERSION:
+                return False, INVALID_FRAME
+
+            offset = HEADER.size
+            for _ in range(definitions):
+                slot, id_length, route_length = DEFINITION.unpack_from(
+                    frame, offset
+                )
+                offset += DEFINITION.size
+                names = frame[offset:offset + id_length + route_length]
+                if len(names) != id_length + route_length:
+                    return False, INVALID_FRAME
+                self._slots[slot] = (
+                    names[:id_length].decode('utf8'),
+                    names[id_length:].decode('utf8'),
+                )
+                offset += id_length + route_length
+
+            if len(frame) - offset != updates * UPDATE.itemsize:
+                return False, INVALID_FRAME
+            records = np.frombuffer(
+                frame, dtype=UPDATE, count=updates, offset=offset
+            )
+        except (struct.error, UnicodeDecodeError):
+            return False, INVALID_FRAME
+        if not (
+            np.isfinite(records['lat']).all()
+            and np.isfinite(records['lng']).all()
+        ):
+            return False, INVALID_COORDINATES
+
+        slots = self._slots
+        try:
+            return True, [
+                Bus(slots[slot][0], lat, lng, slots[slot][1])
+                for slot, lat, lng in records.tolist()
+            ]
+        except KeyError as e:
+            return False, ValidationError('value', f'Unknown bus slot {e}')
+
+
+def decode_bus_message(message: str | bytes, decoder: WireDecoder):
+    """
+    Разбирает сообщение имитатора любого формата: бинарный кадр, пачку BusesBatch или один автобус.
+    :param message: Сообщение web-сокета: bytes - бинарный кадр, str - JSON.
+    :param decoder: Декодировщик бинарных кадров соединения.
+    :return: кортеж из результата разбора (ЛОЖЬ/ИСТИНА) и списка автобусов или описания ошибки
+    (ValidationError).
+    """
+    if isinstance(message, bytes):
+        return decoder.decode(message)
+
+    is_valid, bus_message = is_instance_valid(message, BUS_MESSAGES)
+    if not is_valid:
+        return False, bus_message
+    if isinstance(bus_message, BusesBatch):
+        return True, bus_message.buses
+    return True, [bus_message]